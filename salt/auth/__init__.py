@@ -15,6 +15,7 @@ so that any external authentication system can be used inside of Salt
 # Import Python libs
 import os
 import hashlib
+import heapq
 import time
 import logging
 import random
@@ -27,6 +28,10 @@ import salt.payload
 
 log = logging.getLogger(__name__)
 
+# The number of seconds a token stays in the cache before the token file is
+# read again, this is how long a removed token file can go unnoticed
+TOKEN_RECHECK = 60
+
 
 class LoadAuth(object):
     '''
@@ -37,6 +42,9 @@ class LoadAuth(object):
         self.max_fail = 1.0
         self.serial = salt.payload.Serial(opts)
         self.auth = salt.loader.auth(opts)
+        # The tokens by id and a heap of the (evict, id) pairs of the cache
+        self.tokens = {}
+        self.evict = []
 
     def load_name(self, load):
         '''
@@ -119,30 +127,55 @@ class LoadAuth(object):
                  'token': tok}
         with salt.utils.fopen(t_path, 'w+') as fp_:
             fp_.write(self.serial.dumps(tdata))
+        self.__cache_tok(tdata)
         return tdata
 
+    def __cache_tok(self, tdata):
+        '''
+        Keep the token data in memory until the token expires or has to be
+        read again
+        '''
+        evict = min(tdata['expire'], time.time() + TOKEN_RECHECK)
+        self.tokens[tdata['token']] = (evict, tdata)
+        heapq.heappush(self.evict, (evict, tdata['token']))
+
+    def __evict_toks(self, now):
+        '''
+        Drop the cached tokens which are due to be read again
+        '''
+        while self.evict and self.evict[0][0] <= now:
+            evict, tok = heapq.heappop(self.evict)
+            if self.tokens.get(tok, (None,))[0] == evict:
+                self.tokens.pop(tok)
+
     def get_tok(self, tok):
         '''
         Return the name associate with the token, or False if the token is
         not valid
         '''
+        now = time.time()
+        self.__evict_toks(now)
+        if tok in self.tokens:
+            return self.tokens[tok][1]
         t_path = os.path.join(self.opts['token_dir'], tok)
         if not os.path.isfile(t_path):
             return {}
         with salt.utils.fopen(t_path, 'r') as fp_:
             tdata = self.serial.loads(fp_.read())
         rm_tok = False
-        if not 'expire' in tdata:
+        if not isinstance(tdata, dict) or not 'expire' in tdata:
             # invalid token, delete it!
             rm_tok = True
-        if tdata.get('expire', '0') < time.time():
+        elif tdata['expire'] < now:
             rm_tok = True
         if rm_tok:
             try:
                 os.remove(t_path)
-                return {}
             except (IOError, OSError):
                 pass
+            return {}
+        tdata['token'] = tok
+        self.__cache_tok(tdata)
         return tdata
 
 
@@ -2,40 +2,59 @@
 Execute batch runs
 '''
 # Import Python libs
+import os
 import math
 import time
-import copy
+import collections
 
 # Import Salt libs
 import salt.client
 import salt.output
+import salt.utils
+import salt.utils.minions
+
+# The target types which can be resolved on the master without asking the
+# minions, grain targets also need the minion data cache
+CACHE_TARGETS = ('glob', 'pcre', 'list')
+GRAIN_TARGETS = ('grain', 'grain_pcre')
+
+# The number of seconds the minions have to answer if an expired job is
+# still running
+RUNNING_TIMEOUT = 2
 
 
 class Batch(object):
     '''
-    Manage the execution of batch runs
+    Manage the execution of batch runs, a sliding window of jobs is kept in
+    flight and a new minion is started as soon as a return comes in
     '''
     def __init__(self, opts):
         self.opts = opts
         self.local = salt.client.LocalClient(opts['conf_file'])
+        self.tgt_type = self.opts.get('selected_target_option') or 'glob'
         self.minions = self.__gather_minions()
 
     def __gather_minions(self):
         '''
-        Return a list of minions to use for the batch run
+        Return a list of minions to use for the batch run, the minions are
+        read from the accepted keys and the data cache of the master when the
+        target allows it, otherwise the minions are pinged
         '''
+        if not self.opts.get('batch_ping') and (
+                self.tgt_type in CACHE_TARGETS or
+                (self.tgt_type in GRAIN_TARGETS and
+                 self.opts.get('minion_data_cache'))):
+            ckminions = salt.utils.minions.CkMinions(self.opts)
+            fret = ckminions.check_minions(self.opts['tgt'], self.tgt_type)
+            for minion in fret:
+                print('{0} Detected for this batch run'.format(minion))
+            return sorted(fret)
         args = [self.opts['tgt'],
                 'test.ping',
                 [],
-                1,
+                self.opts['timeout'],
+                self.tgt_type,
                 ]
-
-        selected_target_option = self.opts.get('selected_target_option', None)
-        if selected_target_option is not None:
-            args.append(selected_target_option)
-        else:
-            args.append('glob')
-
         fret = []
         for ret in self.local.cmd_iter(*args):
             for minion in ret:
@@ -61,67 +80,200 @@ class Batch(object):
             print(('Invalid batch data sent: {0}\nData must be in the form'
                    'of %10, 10% or 3').format(self.opts['batch']))
 
-    def run(self):
+    def __start(self, minion, active):
         '''
-        Execute the batch run
+        Publish the job to a single minion and track it in the active dict
         '''
-        args = [[],
+        pub_data = self.local.run_job(
+                [minion],
                 self.opts['fun'],
                 self.opts['arg'],
-                9999999999,
                 'list',
-                ]
+                timeout=self.opts['timeout'])
+        if not pub_data:
+            return False
+        active[pub_data['jid']] = {'minion': minion,
+                                   'start': time.time(),
+                                   'deadline': time.time() +
+                                   self.opts['timeout']}
+        return True
+
+    def __check_expired(self, active, checks, now):
+        '''
+        Ask the minions of the jobs which passed their deadline if the jobs
+        are still running, the answers come in with the other events. Returns
+        the jids of the jobs whose minions did not answer in time
+        '''
+        gone = []
+        for cjid, check in checks.items():
+            if check['deadline'] > now:
+                continue
+            checks.pop(cjid)
+            for jid in check['jobs'].values():
+                if jid in active:
+                    gone.append(jid)
+        expired = dict(
+            (job['minion'], jid) for jid, job in active.items()
+            if job['deadline'] <= now and not job.get('check')
+        )
+        if not expired:
+            return gone
+        pub_data = self.local.run_job(
+                list(expired),
+                'saltutil.running',
+                [],
+                'list',
+                timeout=RUNNING_TIMEOUT)
+        if not pub_data:
+            gone.extend(expired.values())
+            return gone
+        checks[pub_data['jid']] = {'jobs': expired,
+                                   'deadline': now + RUNNING_TIMEOUT}
+        for jid in expired.values():
+            active[jid]['check'] = pub_data['jid']
+        return gone
+
+    def __check_running(self, active, check, data):
+        '''
+        Handle the answer of a minion to a running check, the deadline of the
+        job is pushed back if it is still running. Returns the jid of the job
+        if it is gone
+        '''
+        jid = check['jobs'].pop(data.get('id'), None)
+        if jid not in active:
+            return None
+        jobs = data.get('return')
+        if isinstance(jobs, list) and jid in [
+                job.get('jid') for job in jobs
+                if isinstance(job, dict)]:
+            active[jid]['deadline'] = time.time() + self.opts['timeout']
+            active[jid].pop('check')
+            return None
+        return jid
+
+    def __cached_return(self, jid, minion):
+        '''
+        Return the data in the job cache for a minion or None, the return
+        event can be missed when it lands before the subscription is live
+        '''
+        retp = os.path.join(
+                salt.utils.jid_dir(
+                    jid,
+                    self.opts['cachedir'],
+                    self.opts['hash_type']),
+                minion,
+                'return.p')
+        if not os.path.isfile(retp):
+            return None
+        try:
+            with salt.utils.fopen(retp, 'rb') as fp_:
+                return {'return': self.local.serial.load(fp_)}
+        except Exception:
+            return None
+
+    def __summary(self, name, done, total, start, latencies):
+        '''
+        Print the throughput so far and the latency of the given returns
+        '''
+        elapsed = max(time.time() - start, 0.001)
+        lat = sorted(latencies)
+        if not lat:
+            return
+        print(('\n{0}: {1}/{2} returns, {3:.2f} returns/s, latency avg '
+               '{4:.2f}s p90 {5:.2f}s max {6:.2f}s\n').format(
+                   name,
+                   done,
+                   total,
+                   done / elapsed,
+                   sum(lat) / len(lat),
+                   lat[int(len(lat) * 0.9)],
+                   lat[-1]))
+
+    def run(self):
+        '''
+        Execute the batch run
+        '''
         bnum = self.get_bnum()
-        to_run = copy.deepcopy(self.minions)
-        active = []
+        if not bnum:
+            return {}
+        event = self.local.event
+        # Listen before publishing so that fast returns are not missed
+        if not event.cpub:
+            event.connect_pub()
+        event.subscribe('')
+        to_run = collections.deque(self.minions)
+        active = {}
+        # The running checks of the expired jobs by jid
+        checks = {}
         ret = {}
-        iters = []
-        # Itterate while we still have things to execute
-        while len(ret) < len(self.minions):
+        start = time.time()
+        latencies = []
+        window = []
+        while to_run or active:
+            # Refill the window
             next_ = []
-            if len(to_run) <= bnum and not active:
-                # last bit of them, add them all to next iterator
-                while to_run:
-                    next_.append(to_run.pop())
-            else:
-                for ind in range(bnum - len(active)):
-                    if to_run:
-                        next_.append(to_run.pop())
-            active += next_
-            args[0] = next_
+            while to_run and len(active) < bnum:
+                minion = to_run.popleft()
+                if self.__start(minion, active):
+                    next_.append(minion)
+                else:
+                    ret[minion] = 'Failed to publish the job'
             if next_:
                 print('\nExecuting run on {0}\n'.format(next_))
-                iters.append(
-                        self.local.cmd_iter_no_block(*args))
-            else:
-                time.sleep(0.02)
-            parts = {}
-            for queue in iters:
-                try:
-                    # Gather returns until we get to the bottom
-                    ncnt = 0
-                    while True:
-                        part = next(queue)
-                        if part is None:
-                            time.sleep(0.01)
-                            ncnt += 1
-                            if ncnt > 5:
-                                break
-                            continue
-                        parts.update(part)
-                except StopIteration:
-                    # remove the iter, it is done
-                    pass
-            for minion, data in parts.items():
-                active.remove(minion)
-                ret[minion] = data['ret']
-                data[minion] = data.pop('ret')
-                if 'out' in data:
-                    out = data.pop('out')
+            if not active:
+                break
+            returns = []
+            gone = []
+            for raw in event.get_events(bnum, 1, full=True):
+                data = raw['data']
+                if 'return' not in data:
+                    continue
+                if raw['tag'] in checks:
+                    jid = self.__check_running(
+                            active, checks[raw['tag']], data)
+                    if jid is not None:
+                        gone.append(jid)
+                    continue
+                job = active.get(raw['tag'])
+                if job is None or data.get('id') != job['minion']:
+                    continue
+                returns.append((raw['tag'], data))
+            gone.extend(self.__check_expired(active, checks, time.time()))
+            returned = set(jid for jid, data in returns)
+            for jid in gone:
+                if jid not in active or jid in returned:
+                    continue
+                data = self.__cached_return(jid, active[jid]['minion'])
+                if data is None:
+                    job = active.pop(jid)
+                    ret[job['minion']] = 'Minion did not return'
+                    print('{0} did not return'.format(job['minion']))
                 else:
-                    out = None
+                    returns.append((jid, data))
+            for jid, data in returns:
+                job = active.pop(jid, None)
+                if job is None:
+                    continue
+                latencies.append(time.time() - job['start'])
+                window.append(latencies[-1])
+                ret[job['minion']] = data['return']
                 salt.output.display_output(
-                        data,
-                        out,
+                        {job['minion']: data['return']},
+                        data.get('out'),
                         self.opts)
+                if len(window) >= bnum:
+                    self.__summary(
+                            'Batch',
+                            len(ret),
+                            len(self.minions),
+                            start,
+                            window)
+                    window = []
+        event.unsubscribe('')
+        self.__summary(
+                'Total',
+                len(ret),
+                len(self.minions),
+                start,
+                latencies)
         return ret
@@ -520,6 +520,7 @@ class LocalClient(object):
                     continue
                 break
             time.sleep(0.01)
+        self.event.unsubscribe(jid)
 
     def get_returns(self, jid, minions, timeout=None):
         '''
@@ -688,6 +689,7 @@ class LocalClient(object):
                                 print(minion)
                 break
             time.sleep(0.01)
+        self.event.unsubscribe(jid)
         return ret
 
     def get_cli_event_returns(
@@ -772,6 +774,7 @@ class LocalClient(object):
                                 print(minion)
                 break
             time.sleep(0.01)
+        self.event.unsubscribe(jid)
 
     def get_event_iter_returns(self, jid, minions, timeout=None):
         '''
@@ -166,6 +166,13 @@ def minion_config(path, check_dns=True):
             'backup_mode': '',
             'renderer': 'yaml_jinja',
             'failhard': False,
+            'state_aggregate': True,
+            'state_compile_cache': False,
+            'cmd_coprocess': False,
+            'cmd_timeout': 0,
+            'cmd_output_limit': 0,
+            'cmd_output_events': False,
+            'cmd_output_event_interval': 1,
             'autoload_dynamic_modules': True,
             'environment': None,
             'state_top': 'top.sls',
@@ -180,6 +187,12 @@ def minion_config(path, check_dns=True):
                 'base': ['/srv/pillar'],
                 },
             'hash_type': 'md5',
+            'hash_cache_size': 100000,
+            'file_fetch_threads': 4,
+            'find_threads': 4,
+            'file_delta_threshold': 10485760,
+            'file_compress_level': 0,
+            'file_cache_max_size': 0,
             'external_nodes': '',
             'disable_modules': [],
             'disable_returners': [],
@@ -195,6 +208,7 @@ def minion_config(path, check_dns=True):
             'ipc_mode': 'ipc',
             'tcp_pub_port': 4510,
             'tcp_pull_port': 4511,
+            'tcp_jobs_port': 4512,
             'log_file': '/var/log/salt/minion',
             'log_level': None,
             'log_level_logfile': None,
@@ -289,6 +303,7 @@ def master_config(path):
             'publish_port': '4505',
             'user': 'root',
             'worker_threads': 5,
+            'worker_lanes': {},
             'sock_dir': '/var/run/salt/master',
             'ret_port': '4506',
             'timeout': 5,
@@ -310,6 +325,8 @@ def master_config(path):
             'pillar_version': 1,
             'pillar_opts': True,
             'syndic_master': '',
+            'syndic_batch_size': 50,
+            'syndic_batch_interval': 0.5,
             'runner_dirs': [],
             'client_acl': {},
             'external_auth': {},
@@ -317,6 +334,7 @@ def master_config(path):
             'file_buffer_size': 1048576,
             'max_open_files': 100000,
             'hash_type': 'md5',
+            'hash_cache_size': 100000,
             'conf_file': path,
             'pub_refresh': False,
             'open_mode': False,
@@ -328,6 +346,10 @@ def master_config(path):
             'external_nodes': '',
             'order_masters': False,
             'job_cache': True,
+            'job_cache_writer': True,
+            'job_cache_flush_interval': 0.05,
+            'job_cache_batch_size': 500,
+            'job_cache_fsync': False,
             'ext_job_cache': '',
             'minion_data_cache': True,
             'log_file': '/var/log/salt/master',
@@ -346,6 +368,7 @@ def master_config(path):
             'state_output': 'full',
             'search': '',
             'search_index_interval': 3600,
+            'event_record_file': '',
             'nodegroups': {},
             'cython_enable': False,
             'key_logfile': '/var/log/salt/key',
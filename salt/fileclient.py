@@ -4,11 +4,15 @@ Classes that manage file clients
 # Import python libs
 import contextlib
 import logging
-import hashlib
 import os
+import copy
+import time
 import shutil
 import string
+import zlib
+import threading
 import subprocess
+import collections
 
 # Import third-party libs
 import yaml
@@ -21,6 +25,8 @@ import salt.loader
 import salt.utils
 import salt.payload
 import salt.utils
+import salt.utils.delta
+import salt.utils.hashcache
 import salt.utils.templates
 import salt.utils.gzip_util
 
@@ -29,6 +35,165 @@ from salt._compat import (
 
 log = logging.getLogger(__name__)
 
+# Counters for the files fetched from the master by this process, the state
+# system reports the bytes saved by each state
+TRANSFER_STATS = {'bytes_received': 0,
+                  'bytes_saved': 0,
+                  'files_unchanged': 0}
+TRANSFER_LOCK = threading.Lock()
+
+
+def _count(key, amount=1):
+    '''
+    Add to a transfer counter, the counters are shared by the fetch threads
+    '''
+    with TRANSFER_LOCK:
+        TRANSFER_STATS[key] += amount
+
+
+class ObjectStore(object):
+    '''
+    Content addressed store of the files cached from the master. Every file
+    in the minion file cache is a hard link to the object holding its
+    content, so identical files are stored once and a file whose content is
+    already stored can be placed without a transfer. The least recently used
+    objects are evicted when the store grows past file_cache_max_size
+    '''
+    def __init__(self, opts):
+        self.opts = opts
+        self.form = opts['hash_type']
+        self.root = os.path.join(opts['cachedir'], 'objects', self.form)
+        self.max_size = opts.get('file_cache_max_size', 0)
+        # The size of the store, it is only read from disk when needed
+        self.size = None
+
+    def path(self, hsum):
+        '''
+        Return the location of the object with the given hash
+        '''
+        return os.path.join(self.root, hsum[:2], hsum)
+
+    def _place(self, obj, dest, link=True):
+        '''
+        Replace dest with a link to, or a copy of, an object
+        '''
+        destdir = os.path.dirname(dest)
+        if not os.path.isdir(destdir):
+            os.makedirs(destdir)
+        tmp = '{0}.{1}.{2}'.format(
+                dest, os.getpid(), threading.current_thread().ident)
+        try:
+            if not link:
+                raise OSError
+            os.link(obj, tmp)
+        except OSError:
+            shutil.copyfile(obj, tmp)
+        os.rename(tmp, dest)
+
+    def _touch(self, obj):
+        '''
+        Mark an object as used, only the atime is set so that the mtime of
+        the linked files does not change
+        '''
+        try:
+            os.utime(obj, (time.time(), os.stat(obj).st_mtime))
+        except OSError:
+            pass
+
+    def get(self, hsum, dest, link=True):
+        '''
+        Place the object with the given hash at dest, returns False if the
+        object is not stored
+        '''
+        if not hsum.isalnum():
+            return False
+        obj = self.path(hsum)
+        if not os.path.isfile(obj):
+            return False
+        try:
+            self._place(obj, dest, link)
+        except (IOError, OSError) as exc:
+            log.debug('Failed to place object {0}: {1}'.format(hsum, exc))
+            return False
+        self._touch(obj)
+        log.debug('Placed \'{0}\' from the object store'.format(dest))
+        return True
+
+    def add(self, path, hsum=None):
+        '''
+        Add a cached file to the store, if the content is already stored the
+        file is replaced by a link to the object
+        '''
+        if hsum is None:
+            hsum = salt.utils.get_hash(path, self.form)
+        obj = self.path(hsum)
+        try:
+            if os.path.isfile(obj):
+                if not os.path.samefile(obj, path):
+                    self._place(obj, path)
+            else:
+                if not os.path.isdir(os.path.dirname(obj)):
+                    os.makedirs(os.path.dirname(obj))
+                os.link(path, obj)
+                if self.size is not None:
+                    self.size += os.path.getsize(obj)
+        except (IOError, OSError) as exc:
+            log.debug('Failed to store {0}: {1}'.format(path, exc))
+            return
+        self._touch(obj)
+        self.evict()
+
+    def _walk(self):
+        '''
+        Return the atime, size, inode and path of every object
+        '''
+        ret = []
+        for root, dirs, files in os.walk(self.root):
+            for fn_ in files:
+                full = os.path.join(root, fn_)
+                try:
+                    fstat = os.stat(full)
+                except OSError:
+                    continue
+                ret.append(
+                    (fstat.st_atime, fstat.st_size, fstat.st_ino, full)
+                )
+        return ret
+
+    def evict(self):
+        '''
+        Remove the least recently used objects until the store is under
+        file_cache_max_size, the cached files linked to an evicted object are
+        removed with it
+        '''
+        if not self.max_size:
+            return
+        if self.size is not None and self.size <= self.max_size:
+            return
+        objs = self._walk()
+        self.size = sum(obj[1] for obj in objs)
+        if self.size <= self.max_size:
+            return
+        objs.sort()
+        evict = {}
+        for atime, size, ino, full in objs:
+            if self.size <= self.max_size:
+                break
+            evict[ino] = full
+            self.size -= size
+        log.info('Evicting {0} objects from the file cache'.format(len(evict)))
+        for root, dirs, files in os.walk(
+                os.path.join(self.opts['cachedir'], 'files')):
+            for fn_ in files:
+                full = os.path.join(root, fn_)
+                try:
+                    if os.lstat(full).st_ino in evict:
+                        os.remove(full)
+                except OSError:
+                    continue
+        for full in evict.values():
+            salt.utils.safe_rm(full)
+
 
 def get_file_client(opts):
     '''
@@ -135,6 +300,14 @@ class Client(object):
             ret.append(self.cache_file('salt://{0}'.format(path), env))
         return ret
 
+    def sync_dir(self, path, env='base', include_empty=False):
+        '''
+        Return the hashes of the files in a subdir of the master after caching
+        them, only the remote client gets the manifests of the master so the
+        dict is empty here
+        '''
+        return {}
+
     def cache_dir(self, path, env='base', include_empty=False):
         '''
         Download all of the files in a subdir of the master
@@ -485,17 +658,16 @@ class LocalClient(Client):
                 log.warning(err.format(path))
                 return ret
             else:
-                with salt.utils.fopen(path, 'rb') as f:
-                    ret['hsum'] = hashlib.md5(f.read()).hexdigest()
+                ret['hsum'] = salt.utils.hashcache.get_cache(
+                        self.opts).get_hash(path, 'md5')
                 ret['hash_type'] = 'md5'
                 return ret
         path = self._find_file(path, env)['path']
         if not path:
             return {}
         ret = {}
-        with salt.utils.fopen(path, 'rb') as f:
-            ret['hsum'] = getattr(hashlib, self.opts['hash_type'])(
-                f.read()).hexdigest()
+        ret['hsum'] = salt.utils.hashcache.get_cache(self.opts).get_hash(
+                path, self.opts['hash_type'])
         ret['hash_type'] = self.opts['hash_type']
         return ret
 
@@ -554,24 +726,27 @@ class RemoteClient(Client):
         Client.__init__(self, opts)
         self.auth = salt.crypt.SAuth(opts)
         self.sreq = salt.payload.SREQ(self.opts['master_uri'])
+        self.store = ObjectStore(self.opts)
 
     def get_file(self, path, dest='', makedirs=False, env='base', gzip=None):
         '''
         Get a single file from the salt-master
         path must be a salt server location, aka, salt://path/to/file, if
         dest is ommited, then the downloaded file will be placed in the minion
-        cache
+        cache. If a copy of the file is already present the hash of the copy
+        is sent along and the master only sends the file if it has changed.
+        The gzip level, or the file_compress_level option, asks the master to
+        send the file as a compressed stream
         '''
         log.info('Fetching file \'{0}\''.format(path))
         path = self._check_proto(path)
         load = {'path': path,
                 'env': env,
                 'cmd': '_serve_file'}
-        if gzip:
-            gzip = int(gzip)
-            load['gzip'] = gzip
+        level = int(gzip or self.opts['file_compress_level'])
+        if level:
+            load['compress'] = level
 
-        fn_ = None
         if dest:
             destdir = os.path.dirname(dest)
             if not os.path.isdir(destdir):
@@ -579,10 +754,36 @@ class RemoteClient(Client):
                     os.makedirs(destdir)
                 else:
                     return False
-            fn_ = salt.utils.fopen(dest, 'wb+')
+            local = dest
+        else:
+            local = os.path.join(self.opts['cachedir'], 'files', env, path)
+        # Files in the minion cache are linked to the object store
+        cached = not dest
+        load['hash_type'] = self.opts['hash_type']
+        if os.path.isfile(local):
+            threshold = self.opts['file_delta_threshold']
+            if threshold and os.path.getsize(local) >= threshold:
+                # Send the block checksums along so that the master can
+                # answer with a delta if the file changed
+                load['blocks'] = salt.utils.delta.signature(
+                        local,
+                        form=self.opts['hash_type'])
+                load['hsum'] = load['blocks'].pop('hsum')
+            else:
+                load['hsum'] = salt.utils.get_hash(
+                        local,
+                        self.opts['hash_type'])
+
+        fn_ = None
+        # The decompressor and the offset into the compressed stream when the
+        # master sends the file compressed
+        decomp = None
+        zloc = 0
         while True:
             if not fn_:
                 load['loc'] = 0
+            elif decomp:
+                load['loc'] = zloc
             else:
                 load['loc'] = fn_.tell()
             try:
@@ -591,33 +792,387 @@ class RemoteClient(Client):
                             'aes',
                             self.auth.crypticle.dumps(load),
                             3,
-                            60)
+                            60,
+                            cmd=load['cmd'])
                         )
             except SaltReqTimeoutError:
                 return ''
 
+            if data.get('unchanged'):
+                size = os.path.getsize(local)
+                log.debug(
+                    'File \'{0}\' is unchanged, skipped {1} bytes'.format(
+                        path, size
+                    )
+                )
+                _count('files_unchanged')
+                _count('bytes_saved', size)
+                return local
+            load.pop('hsum', None)
+            if load.pop('blocks', None) and 'delta' in data:
+                if self._patch_file(load, local, data):
+                    if cached:
+                        self.store.add(local)
+                    return local
+                # The delta could not be applied, fetch the whole file
+                continue
+            if data.get('zreset'):
+                # The file changed on the master during the transfer
+                fn_.seek(0)
+                fn_.truncate()
+                decomp = None
+                zloc = 0
+                load.pop('zsum', None)
+                continue
+            if data.get('compress'):
+                if decomp is None:
+                    decomp = zlib.decompressobj()
+                    load['zsum'] = data['zsum']
+            else:
+                load.pop('compress', None)
+            if not fn_ and data.get('hsum') and data['dest']:
+                # The content may already be stored under another path
+                target = local
+                if cached:
+                    with self._cache_loc(data['dest'], env) as cache_dest:
+                        target = cache_dest
+                if self.store.get(data['hsum'], target, link=cached):
+                    _count(
+                        'bytes_saved',
+                        os.path.getsize(target) - len(data['data'])
+                    )
+                    return target
             if not data['data']:
                 if not fn_ and data['dest']:
                     # This is a 0 byte file on the master
-                    with self._cache_loc(data['dest'], env) as cache_dest:
-                        dest = cache_dest
-                        if not os.path.exists(cache_dest):
+                    if dest:
+                        with salt.utils.fopen(dest, 'wb+') as f:
+                            f.write(data['data'])
+                    else:
+                        with self._cache_loc(data['dest'], env) as cache_dest:
+                            dest = cache_dest
+                            # Never write through a link to the store
+                            salt.utils.safe_rm(cache_dest)
                             with salt.utils.fopen(cache_dest, 'wb+') as f:
                                 f.write(data['data'])
                 break
             if not fn_:
-                with self._cache_loc(data['dest'], env) as cache_dest:
-                    dest = cache_dest
+                if dest:
                     fn_ = salt.utils.fopen(dest, 'wb+')
-            if data.get('gzip', None):
+                else:
+                    with self._cache_loc(data['dest'], env) as cache_dest:
+                        dest = cache_dest
+                        salt.utils.safe_rm(cache_dest)
+                        fn_ = salt.utils.fopen(dest, 'wb+')
+            if decomp:
+                zloc += len(data['data'])
+                data = decomp.decompress(data['data'])
+            elif data.get('gzip', None):
                 data = salt.utils.gzip_util.uncompress(data['data'])
             else:
                 data = data['data']
+            _count('bytes_received', len(data))
             fn_.write(data)
         if fn_:
+            if decomp:
+                fn_.write(decomp.flush())
             fn_.close()
+        if cached and dest:
+            self.store.add(dest)
         return dest
 
+    def _patch_file(self, load, local, data):
+        '''
+        Rebuild a file from the blocks of the local copy and the literal data
+        of the delta sent by the master, the literal data is fetched in
+        ranges. Returns False if the rebuilt file does not match the master
+        '''
+        def _fetch(offset, length):
+            rload = {'path': load['path'],
+                     'env': load['env'],
+                     'cmd': '_serve_file'}
+            while length > 0:
+                rload['loc'] = offset
+                rload['size'] = length
+                ret = self.auth.crypticle.loads(
+                        self.sreq.send(
+                            'aes',
+                            self.auth.crypticle.dumps(rload),
+                            3,
+                            60,
+                            cmd=rload['cmd'])
+                        )
+                if not ret['data']:
+                    raise MinionError(
+                        'Short read of literal data from {0}'.format(
+                            load['path']
+                        )
+                    )
+                chunk = ret['data'][:length]
+                _count('bytes_received', len(chunk))
+                offset += len(chunk)
+                length -= len(chunk)
+                yield chunk
+
+        tmp = '{0}.delta.{1}'.format(local, os.getpid())
+        try:
+            with salt.utils.fopen(tmp, 'wb+') as fp_:
+                salt.utils.delta.patch(
+                        local,
+                        fp_,
+                        data['block_size'],
+                        data['delta'],
+                        _fetch)
+            if salt.utils.get_hash(tmp, data['hash_type']) != data['hsum']:
+                log.warning(
+                    'Delta of \'{0}\' did not match, fetching the whole '
+                    'file'.format(load['path'])
+                )
+                salt.utils.safe_rm(tmp)
+                return False
+            shutil.copymode(local, tmp)
+            os.rename(tmp, local)
+        except (IOError, OSError, MinionError, SaltReqTimeoutError) as exc:
+            log.warning(
+                'Failed to apply the delta of \'{0}\': {1}'.format(
+                    load['path'], exc
+                )
+            )
+            salt.utils.safe_rm(tmp)
+            return False
+        literal = salt.utils.delta.literal_size(data['delta'])
+        _count('bytes_saved', os.path.getsize(local) - literal)
+        log.debug(
+            'Applied delta to \'{0}\', {1} bytes of literal data'.format(
+                load['path'], literal
+            )
+        )
+        return True
+
+    def cache_master(self, env='base'):
+        '''
+        Download and cache all files on a master in a specified environment,
+        only the files which changed since the last sync are fetched
+        '''
+        ret = self.sync_manifest('', env)
+        if ret is None:
+            return Client.cache_master(self, env)
+        return ret[0]
+
+    def cache_dir(self, path, env='base', include_empty=False):
+        '''
+        Download all of the files in a subdir of the master, only the files
+        which changed since the last sync are fetched
+        '''
+        ret = self.sync_dir(path, env, include_empty)
+        if not ret:
+            return Client.cache_dir(self, path, env, include_empty)
+        return sorted(ret['files']) + ret['empty_dirs']
+
+    def sync_dir(self, path, env='base', include_empty=False):
+        '''
+        Download the files in a subdir of the master which changed since the
+        last sync and return the hashes of the files on the master, keyed by
+        the cached locations. Returns an empty dict if the master does not
+        serve manifests
+        '''
+        prefix = self._check_proto(path)
+        log.info(
+            'Caching directory \'{0}\' for environment \'{1}\''.format(
+                prefix, env
+            )
+        )
+        ret = self.sync_manifest(prefix, env)
+        if ret is None:
+            return {}
+        files, empty_dirs, manifest = ret
+        cache = os.path.join(self.opts['cachedir'], 'files', env)
+        hashes = dict(
+                (os.path.join(cache, entry[0]), entry[2])
+                for entry in manifest['files'])
+        dirs = []
+        if include_empty:
+            dest = salt.utils.path_join(self.opts['cachedir'], 'files', env)
+            for fn_ in empty_dirs:
+                minion_dir = '{0}/{1}'.format(dest, fn_)
+                if not os.path.isdir(minion_dir):
+                    os.makedirs(minion_dir)
+                dirs.append(minion_dir)
+        return {'hash_type': manifest['hash_type'],
+                'files': dict((fn_, hashes[fn_]) for fn_ in files),
+                'empty_dirs': dirs}
+
+    def file_manifest(self, prefix='', env='base'):
+        '''
+        Return the path, size and hash of the files under a prefix on the
+        master
+        '''
+        load = {'env': env,
+                'prefix': prefix,
+                'cmd': '_file_manifest'}
+        try:
+            return self.auth.crypticle.loads(
+                    self.sreq.send(
+                        'aes',
+                        self.auth.crypticle.dumps(load),
+                        3,
+                        60,
+                        cmd=load['cmd'])
+                    )
+        except SaltReqTimeoutError:
+            return {}
+
+    def _manifest_path(self, env):
+        '''
+        Return the location of the manifest of the files cached for an
+        environment
+        '''
+        return os.path.join(
+                self.opts['cachedir'],
+                'file_manifests',
+                '{0}.p'.format(env)
+                )
+
+    def _load_manifest(self, env):
+        '''
+        Read the manifest of the files cached for an environment, it maps the
+        relative path of a file to the size, mtime, hash type and hash of the
+        cached copy when it was last hashed
+        '''
+        path = self._manifest_path(env)
+        if not os.path.isfile(path):
+            return {}
+        try:
+            with salt.utils.fopen(path, 'rb') as fp_:
+                return self.serial.load(fp_)
+        except Exception:
+            log.debug('Failed to read the file manifest {0}'.format(path))
+            return {}
+
+    def _save_manifest(self, env, manifest):
+        '''
+        Write the manifest of the files cached for an environment
+        '''
+        path = self._manifest_path(env)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        tmp = '{0}.{1}'.format(path, os.getpid())
+        with salt.utils.fopen(tmp, 'w+b') as fp_:
+            self.serial.dump(manifest, fp_)
+        os.rename(tmp, path)
+
+    def _local_hash(self, manifest, rel, path, form):
+        '''
+        Return the hash of a cached file, the hash in the manifest is used as
+        long as the size and mtime of the file did not change
+        '''
+        try:
+            fstat = os.stat(path)
+        except OSError:
+            manifest.pop(rel, None)
+            return ''
+        entry = manifest.get(rel)
+        if entry and list(entry[:3]) == [fstat.st_size, fstat.st_mtime, form]:
+            return entry[3]
+        hsum = salt.utils.get_hash(path, form)
+        manifest[rel] = [fstat.st_size, fstat.st_mtime, form, hsum]
+        return hsum
+
+    def _fetch_files(self, paths, env='base'):
+        '''
+        Cache a list of files from the master, the files are fetched by a pool
+        of threads which each hold their own connection to the master.
+        Returns a dict mapping the paths to the cached locations
+        '''
+        ret = {}
+        queue = collections.deque(paths)
+        errors = []
+
+        def _fetch():
+            # Share the authentication but not the socket
+            client = copy.copy(self)
+            client.sreq = salt.payload.SREQ(self.opts['master_uri'])
+            try:
+                while True:
+                    try:
+                        path = queue.popleft()
+                    except IndexError:
+                        return
+                    try:
+                        ret[path] = client.cache_file(
+                                'salt://{0}'.format(path), env)
+                    except Exception as exc:
+                        log.error(
+                            'Failed to fetch \'{0}\': {1}'.format(path, exc),
+                            exc_info=True
+                        )
+                        errors.append(exc)
+            finally:
+                client.sreq.socket.close()
+
+        size = min(int(self.opts['file_fetch_threads']), len(paths))
+        if size < 2:
+            for path in paths:
+                ret[path] = self.cache_file('salt://{0}'.format(path), env)
+            return ret
+        # The umask is set for the whole pool, _cache_loc swaps the umask of
+        # the process and would otherwise leak the cache umask across threads
+        cumask = os.umask(63)
+        try:
+            threads = [
+                threading.Thread(target=_fetch) for ind in range(size)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            os.umask(cumask)
+        if errors:
+            # Fail like the fetch would without the pool
+            raise errors[0]
+        return ret
+
+    def sync_manifest(self, prefix='', env='base'):
+        '''
+        Bring the files under a prefix in the minion cache up to date with
+        the master. The master sends the manifest of the prefix in one request
+        and only the files which differ from the cached copies are fetched.
+        Returns a tuple of the cached files, the empty dirs on the master and
+        the manifest, or None if the master does not serve manifests
+        '''
+        manifest = self.file_manifest(prefix, env)
+        if not isinstance(manifest, dict) or 'files' not in manifest:
+            return None
+        form = manifest['hash_type']
+        local = self._load_manifest(env)
+        cache = os.path.join(self.opts['cachedir'], 'files', env)
+        ret = []
+        fetch = []
+        for rel, size, hsum in manifest['files']:
+            dest = os.path.join(cache, rel)
+            if self._local_hash(local, rel, dest, form) == hsum:
+                ret.append(dest)
+            elif form == self.store.form and self.store.get(hsum, dest):
+                _count('bytes_saved', size)
+                self._local_hash(local, rel, dest, form)
+                ret.append(dest)
+            else:
+                fetch.append(rel)
+        if fetch:
+            log.debug(
+                'Fetching {0} of {1} files under \'{2}\''.format(
+                    len(fetch), len(manifest['files']), prefix
+                )
+            )
+            for rel, dest in self._fetch_files(fetch, env).items():
+                if dest:
+                    self._local_hash(local, rel, dest, form)
+                    ret.append(dest)
+        self._save_manifest(env, local)
+        ret.sort()
+        return ret, manifest['empty_dirs'], manifest
+
     def file_list(self, env='base'):
         '''
         List the files on the master
@@ -630,7 +1185,8 @@ class RemoteClient(Client):
                         'aes',
                         self.auth.crypticle.dumps(load),
                         3,
-                        60)
+                        60,
+                        cmd=load['cmd'])
                     )
         except SaltReqTimeoutError:
             return ''
@@ -647,7 +1203,8 @@ class RemoteClient(Client):
                         'aes',
                         self.auth.crypticle.dumps(load),
                         3,
-                        60)
+                        60,
+                        cmd=load['cmd'])
                     )
         except SaltReqTimeoutError:
             return ''
@@ -664,7 +1221,8 @@ class RemoteClient(Client):
                         'aes',
                         self.auth.crypticle.dumps(load),
                         3,
-                        60)
+                        60,
+                        cmd=load['cmd'])
                     )
         except SaltReqTimeoutError:
             return ''
@@ -684,8 +1242,8 @@ class RemoteClient(Client):
                 return {}
             else:
                 ret = {}
-                with salt.utils.fopen(path, 'rb') as f:
-                    ret['hsum'] = hashlib.md5(f.read()).hexdigest()
+                ret['hsum'] = salt.utils.hashcache.get_cache(
+                        self.opts).get_hash(path, 'md5')
                 ret['hash_type'] = 'md5'
                 return ret
         load = {'path': path,
@@ -697,7 +1255,8 @@ class RemoteClient(Client):
                         'aes',
                         self.auth.crypticle.dumps(load),
                         3,
-                        60)
+                        60,
+                        cmd=load['cmd'])
                     )
         except SaltReqTimeoutError:
             return ''
@@ -714,7 +1273,8 @@ class RemoteClient(Client):
                         'aes',
                         self.auth.crypticle.dumps(load),
                         3,
-                        60)
+                        60,
+                        cmd=load['cmd'])
                     )
         except SaltReqTimeoutError:
             return ''
@@ -730,7 +1290,8 @@ class RemoteClient(Client):
                         'aes',
                         self.auth.crypticle.dumps(load),
                         3,
-                        60)
+                        60,
+                        cmd=load['cmd'])
                     )
         except SaltReqTimeoutError:
             return ''
@@ -749,7 +1310,8 @@ class RemoteClient(Client):
                         'aes',
                         self.auth.crypticle.dumps(load),
                         3,
-                        60)
+                        60,
+                        cmd=load['cmd'])
                     )
         except SaltReqTimeoutError:
             return ''
@@ -5,6 +5,7 @@ used to manage salt keys directly without interfacing with the cli.
 
 # Import python modules
 import os
+import time
 import shutil
 import fnmatch
 # Import salt modules
@@ -12,6 +13,21 @@ import salt.crypt
 import salt.utils
 import salt.utils.event
 
+# The directories of the pki dir which hold the minion keys
+KEY_DIRS = ('minions', 'minions_pre', 'minions_rejected')
+
+# The key stores by pki dir, so that the index is kept between calls
+STORES = {}
+
+
+def get_store(opts):
+    '''
+    Return the key store of the pki dir in the opts
+    '''
+    if not opts['pki_dir'] in STORES:
+        STORES[opts['pki_dir']] = KeyStore(opts)
+    return STORES[opts['pki_dir']]
+
 
 class KeyCLI(object):
     '''
@@ -216,6 +232,7 @@ class Key(object):
     def __init__(self, opts):
         self.opts = opts
         self.event = salt.utils.event.MasterEvent(opts['sock_dir'])
+        self.store = get_store(opts)
 
     def _check_minions_directories(self):
         '''
@@ -244,17 +261,11 @@ class Key(object):
         '''
         Accept a glob which to match the of a key and return the key's location
         '''
+        ret = self.store.match(match)
         if full:
-            matches = self.all_keys()
-        else:
-            matches = self.list_keys()
-        ret = {}
-        for status, keys in matches.items():
-            for key in salt.utils.isorted(keys):
-                if fnmatch.fnmatch(key, match):
-                    if not status in ret:
-                        ret[status] = []
-                    ret[status].append(key)
+            local = fnmatch.filter(self.local_keys()['local'], match)
+            if local:
+                ret['local'] = local
         return ret
 
     def local_keys(self):
@@ -273,13 +284,7 @@ class Key(object):
         '''
         Return a dict of managed keys and what the key status are
         '''
-        acc, pre, rej = self._check_minions_directories()
-        ret = {}
-        for dir_ in acc, pre, rej:
-            ret[os.path.basename(dir_)] = []
-            for fn_ in salt.utils.isorted(os.listdir(dir_)):
-                ret[os.path.basename(dir_)].append(fn_)
-        return ret
+        return self.store.list_keys()
 
     def all_keys(self):
         '''
@@ -315,6 +320,16 @@ class Key(object):
                     ret[status][key] = fp_.read()
         return ret
 
+    def _move(self, keys, dst, act):
+        '''
+        Move pending keys to another status and fire an event for each
+        '''
+        for key in self.store.move(keys, 'minions_pre', dst):
+            eload = {'result': True,
+                     'act': act,
+                     'id': key}
+            self.event.fire_event(eload, 'key')
+
     def accept(self, match):
         '''
         Accept a specified host's public key based on name or keys based on
@@ -322,24 +337,7 @@ class Key(object):
         '''
         matches = self.name_match(match)
         if 'minions_pre' in matches:
-            for key in matches['minions_pre']:
-                try:
-                    shutil.move(
-                            os.path.join(
-                                self.opts['pki_dir'],
-                                'minions_pre',
-                                key),
-                            os.path.join(
-                                self.opts['pki_dir'],
-                                'minions',
-                                key)
-                            )
-                    eload = {'result': True,
-                             'act': 'accept',
-                             'id': key}
-                    self.event.fire_event(eload, 'key')
-                except (IOError, OSError):
-                    pass
+            self._move(matches['minions_pre'], 'minions', 'accept')
         return self.name_match(match)
 
     def accept_all(self):
@@ -347,24 +345,7 @@ class Key(object):
         Accept all keys in pre
         '''
         keys = self.list_keys()
-        for key in keys['minions_pre']:
-            try:
-                shutil.move(
-                        os.path.join(
-                            self.opts['pki_dir'],
-                            'minions_pre',
-                            key),
-                        os.path.join(
-                            self.opts['pki_dir'],
-                            'minions',
-                            key)
-                        )
-                eload = {'result': True,
-                         'act': 'accept',
-                         'id': key}
-                self.event.fire_event(eload, 'key')
-            except (IOError, OSError):
-                pass
+        self._move(keys['minions_pre'], 'minions', 'accept')
         return self.list_keys()
 
     def delete_key(self, match):
@@ -372,11 +353,7 @@ class Key(object):
         Delete a single key or keys by glob
         '''
         for status, keys in self.name_match(match).items():
-            for key in keys:
-                try:
-                    os.remove(os.path.join(self.opts['pki_dir'], status, key))
-                except (OSError, IOError):
-                    pass
+            self.store.remove(keys, status)
         return self.list_keys()
 
     def delete_all(self):
@@ -384,11 +361,7 @@ class Key(object):
         Delete all keys
         '''
         for status, keys in self.list_keys().items():
-            for key in keys:
-                try:
-                    os.remove(os.path.join(self.opts['pki_dir'], status, key))
-                except (OSError, IOError):
-                    pass
+            self.store.remove(keys, status)
         return self.list_keys()
 
     def reject(self, match):
@@ -397,24 +370,7 @@ class Key(object):
         '''
         matches = self.name_match(match)
         if 'minions_pre' in matches:
-            for key in matches['minions_pre']:
-                try:
-                    shutil.move(
-                            os.path.join(
-                                self.opts['pki_dir'],
-                                'minions_pre',
-                                key),
-                            os.path.join(
-                                self.opts['pki_dir'],
-                                'minions_rejected',
-                                key)
-                            )
-                    eload = {'result': True,
-                             'act': 'reject',
-                             'id': key}
-                    self.event.fire_event(eload, 'key')
-                except (IOError, OSError):
-                    pass
+            self._move(matches['minions_pre'], 'minions_rejected', 'reject')
         return self.name_match(match)
 
     def reject_all(self):
@@ -422,24 +378,7 @@ class Key(object):
         Reject all keys in pre
         '''
         keys = self.list_keys()
-        for key in keys['minions_pre']:
-            try:
-                shutil.move(
-                        os.path.join(
-                            self.opts['pki_dir'],
-                            'minions_pre',
-                            key),
-                        os.path.join(
-                            self.opts['pki_dir'],
-                            'minions_rejected',
-                            key)
-                        )
-                eload = {'result': True,
-                         'act': 'reject',
-                         'id': key}
-                self.event.fire_event(eload, 'key')
-            except (IOError, OSError):
-                pass
+        self._move(keys['minions_pre'], 'minions_rejected', 'reject')
         return self.list_keys()
 
     def finger(self, match):
@@ -472,3 +411,121 @@ class Key(object):
                     path = os.path.join(self.opts['pki_dir'], status, key)
                 ret[status][key] = salt.utils.pem_finger(path)
         return ret
+
+
+class KeyStore(object):
+    '''
+    An in memory index of the minion keys in the pki dir. A key directory is
+    only listed again when its mtime shows that keys were added or removed,
+    so the lookups only cost a stat of the directory
+    '''
+    def __init__(self, opts):
+        self.opts = opts
+        # The (mtime, listing time, key names) of each key directory
+        self.index = {}
+
+    def path(self, status, key=None):
+        '''
+        Return the path of a key directory, or of a key in it
+        '''
+        if key is None:
+            return os.path.join(self.opts['pki_dir'], status)
+        return os.path.join(self.opts['pki_dir'], status, key)
+
+    def keys(self, status):
+        '''
+        Return the set of the key names under a status
+        '''
+        dir_ = self.path(status)
+        try:
+            mtime = os.stat(dir_).st_mtime
+        except OSError:
+            self.index.pop(status, None)
+            return set()
+        if status in self.index:
+            cmtime, listed, names = self.index[status]
+            # A change in the same second as the listing can hide behind a
+            # coarse mtime, so such a listing is not trusted
+            if cmtime == mtime and listed - mtime > 1:
+                return names
+        listed = time.time()
+        names = set(os.listdir(dir_))
+        self.index[status] = (mtime, listed, names)
+        return names
+
+    def count(self, status):
+        '''
+        Return the number of keys under a status
+        '''
+        return len(self.keys(status))
+
+    def check(self, status, key):
+        '''
+        Return True if the named key is under the status
+        '''
+        return key in self.keys(status)
+
+    def list_keys(self):
+        '''
+        Return a dict of the sorted key names under each status
+        '''
+        return dict((status, salt.utils.isorted(self.keys(status)))
+                    for status in KEY_DIRS)
+
+    def match(self, match, statuses=KEY_DIRS):
+        '''
+        Return the sorted names of the keys which match a glob by status
+        '''
+        ret = {}
+        for status in statuses:
+            keys = self.keys(status)
+            if not any(char in match for char in '*?['):
+                found = [match] if match in keys else []
+            else:
+                found = fnmatch.filter(keys, match)
+            if found:
+                ret[status] = salt.utils.isorted(found)
+        return ret
+
+    def add(self, status, key, pub):
+        '''
+        Write a public key under a status
+        '''
+        with salt.utils.fopen(self.path(status, key), 'w+') as fp_:
+            fp_.write(pub)
+        if status in self.index:
+            self.index[status][2].add(key)
+
+    def move(self, keys, src, dst):
+        '''
+        Move the named keys from one status to another, returns the names of
+        the keys which were moved
+        '''
+        moved = []
+        for key in keys:
+            try:
+                shutil.move(self.path(src, key), self.path(dst, key))
+            except (IOError, OSError):
+                continue
+            moved.append(key)
+        if src in self.index:
+            self.index[src][2].difference_update(moved)
+        if dst in self.index:
+            self.index[dst][2].update(moved)
+        return moved
+
+    def remove(self, keys, status):
+        '''
+        Delete the named keys under a status, returns the names of the keys
+        which were deleted
+        '''
+        removed = []
+        for key in keys:
+            try:
+                os.remove(self.path(status, key))
+            except (IOError, OSError):
+                continue
+            removed.append(key)
+        if status in self.index:
+            self.index[status][2].difference_update(removed)
+        return removed
@@ -128,6 +128,14 @@ def outputters(opts):
     return load.filter_func('output')
 
 
+def output_streams(opts):
+    '''
+    Returns the streaming functions of the outputters
+    '''
+    load = _create_loader(opts, 'output', 'output')
+    return load.filter_func('stream')
+
+
 def auth(opts):
     '''
     Returns the returner modules
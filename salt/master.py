@@ -8,17 +8,19 @@ import os
 import re
 import time
 import errno
+import hashlib
 import fnmatch
 import signal
 import shutil
 import stat
 import logging
-import hashlib
 import datetime
+import collections
 import pwd
 import getpass
 import resource
 import subprocess
+import threading
 import multiprocessing
 
 # Import zeromq
@@ -39,15 +41,19 @@ import salt.pillar
 import salt.state
 import salt.runner
 import salt.auth
+import salt.key
 import salt.wheel
 import salt.minion
 import salt.search
 import salt.utils
 import salt.utils.atomicfile
+import salt.utils.delta
 import salt.utils.event
 import salt.utils.verify
 import salt.utils.minions
+import salt.utils.process
 import salt.utils.gzip_util
+import salt.utils.hashcache
 from salt.utils.debug import enable_sigusr1_handler
 
 
@@ -165,8 +171,6 @@ class Master(SMaster):
         Clean out the old jobs
         '''
         jid_root = os.path.join(self.opts['cachedir'], 'jobs')
-        search = salt.search.Search(self.opts)
-        last = time.time()
         while True:
             if self.opts['keep_jobs'] != 0:
                 cur = "{0:%Y%m%d%H}".format(datetime.datetime.now())
@@ -185,10 +189,6 @@ class Master(SMaster):
                             shutil.rmtree(f_path)
                         elif int(cur) - int(jid[:10]) > self.opts['keep_jobs']:
                             shutil.rmtree(f_path)
-            if self.opts.get('search'):
-                now = time.time()
-                if now - last > self.opts['search_index_interval']:
-                    search.index()
             try:
                 time.sleep(60)
             except KeyboardInterrupt:
@@ -239,6 +239,10 @@ class Master(SMaster):
         clear_old_jobs_proc = multiprocessing.Process(
             target=self._clear_old_jobs)
         clear_old_jobs_proc.start()
+        search_indexer = None
+        if self.opts.get('search'):
+            search_indexer = SearchIndexer(self.opts)
+            search_indexer.start()
         reqserv = ReqServer(
                 self.opts,
                 self.crypticle,
@@ -246,6 +250,7 @@ class Master(SMaster):
                 self.master_key)
         reqserv.start_publisher()
         reqserv.start_event_publisher()
+        reqserv.start_job_cache_writer()
 
         def sigterm_clean(signum, frame):
             '''
@@ -256,6 +261,8 @@ class Master(SMaster):
             log.warn(('Caught signal {0}, stopping the Salt Master'
                 .format(signum)))
             clean_proc(clear_old_jobs_proc)
+            clean_proc(reqserv.job_cache_writer)
+            clean_proc(search_indexer)
             clean_proc(reqserv.publisher)
             clean_proc(reqserv.eventpublisher)
             for proc in reqserv.work_procs:
@@ -330,6 +337,272 @@ class Publisher(multiprocessing.Process):
             pull_sock.close()
 
 
+def store_job_return(opts, serial, load):
+    '''
+    Write a minion return into the local job cache, returns the paths of the
+    written files or False if the return was dropped
+    '''
+    jid_dir = salt.utils.jid_dir(
+            load['jid'],
+            opts['cachedir'],
+            opts['hash_type']
+            )
+    if not os.path.isdir(jid_dir):
+        log.error(
+            'An inconsistency occurred, a job was received with a job id '
+            'that is not present on the master: {jid}'.format(**load)
+        )
+        return False
+    hn_dir = os.path.join(jid_dir, load['id'])
+    if not os.path.isdir(hn_dir):
+        os.makedirs(hn_dir)
+    # Otherwise the minion has already returned this jid and it should
+    # be dropped
+    else:
+        log.error(
+                ('An extra return was detected from minion {0}, please'
+                ' verify the minion, this could be a replay'
+                ' attack').format(load['id'])
+                )
+        return False
+
+    fns = [('return.p', load['return'])]
+    if 'out' in load:
+        fns.append(('out.p', load['out']))
+    paths = []
+    for name, data in fns:
+        # Use atomic open here to avoid the file being read before it's
+        # completely written to. Refs #1935
+        path = os.path.join(hn_dir, name)
+        fp_ = salt.utils.atomicfile.atomic_open(path, 'w+')
+        fp_.write(serial.dumps(data))
+        fp_.close()
+        paths.append(path)
+    return paths
+
+
+def sync_paths(paths, group=64):
+    '''
+    Sync the given files and directories to disk, at most group of them are
+    open at a time. Paths which are gone are skipped.
+    '''
+    for ind in range(0, len(paths), group):
+        fds = []
+        try:
+            for path in paths[ind:ind + group]:
+                try:
+                    fds.append(os.open(path, os.O_RDONLY))
+                except OSError as exc:
+                    if exc.errno != errno.ENOENT:
+                        raise exc
+            for fd_ in fds:
+                os.fsync(fd_)
+        finally:
+            for fd_ in fds:
+                os.close(fd_)
+
+
+class JobCacheWriter(multiprocessing.Process):
+    '''
+    Write minion returns into the local job cache on behalf of the workers.
+    The returns are collected from the workers over ipc and committed in
+    batches, so the time a worker spends on a return does not depend on the
+    disk. The writer is restarted by the ReqServer if it dies, and the
+    workers write the returns themselves while it can not keep up.
+    '''
+    def __init__(self, opts):
+        super(JobCacheWriter, self).__init__()
+        self.opts = opts
+        self.serial = salt.payload.Serial(opts)
+        self.stopping = False
+
+    def commit(self, batch):
+        '''
+        Write a batch of returns, each return is written and closed in turn.
+        With job_cache_fsync the whole batch is then synced in one pass, the
+        files first and then the directories the files were added to. The
+        write tags are removed once the batch is on disk.
+        '''
+        wtags = []
+        files = []
+        dirs = set()
+        for load in batch:
+            if 'wtag' in load:
+                wtags.append(load['wtag'])
+                continue
+            try:
+                paths = store_job_return(self.opts, self.serial, load)
+            except (IOError, OSError) as exc:
+                log.error(
+                    'Failed to write the return from {0} for job {1}: '
+                    '{2}'.format(load.get('id'), load.get('jid'), exc)
+                )
+                continue
+            if not paths:
+                continue
+            files.extend(paths)
+            # The minion dir holds the new files, the jid dir the new
+            # minion dir
+            hn_dir = os.path.dirname(paths[0])
+            dirs.add(hn_dir)
+            dirs.add(os.path.dirname(hn_dir))
+        if self.opts['job_cache_fsync'] and files:
+            try:
+                self.sync(files + sorted(dirs))
+            except (IOError, OSError) as exc:
+                log.error('Failed to sync the job cache: {0}'.format(exc))
+        for wtag in wtags:
+            if os.path.isfile(wtag):
+                os.remove(wtag)
+
+    def sync(self, paths):
+        '''
+        Sync a committed batch to disk
+        '''
+        sync_paths(paths)
+
+    def _stop(self, signum, frame):
+        '''
+        Stop collecting returns, the queued returns are still committed
+        '''
+        self.stopping = True
+
+    def _recv(self, pull_sock, batch, size):
+        '''
+        Append the queued returns to the batch until it holds size returns
+        '''
+        while len(batch) < size:
+            try:
+                package = pull_sock.recv(zmq.NOBLOCK)
+            except zmq.ZMQError as exc:
+                if exc.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise exc
+            batch.append(self.serial.loads(package))
+
+    def run(self):
+        '''
+        Collect the returns and commit them on the configured schedule
+        '''
+        signal.signal(signal.SIGTERM, self._stop)
+        context = zmq.Context(1)
+        pull_sock = context.socket(zmq.PULL)
+        pull_path = os.path.join(self.opts['sock_dir'], 'job_cache_pull.ipc')
+        pull_sock.bind('ipc://{0}'.format(pull_path))
+        os.chmod(pull_path, 448)
+        interval = float(self.opts['job_cache_flush_interval'])
+        batch_size = int(self.opts['job_cache_batch_size'])
+        batch = []
+        last = time.time()
+        try:
+            while not self.stopping:
+                # Wake up at least every second to notice a SIGTERM
+                wait = min(max(interval - (time.time() - last), 0), 1)
+                try:
+                    if pull_sock.poll(wait * 1000):
+                        self._recv(pull_sock, batch, batch_size)
+                except zmq.ZMQError as exc:
+                    if exc.errno != errno.EINTR:
+                        raise exc
+                if len(batch) >= batch_size or time.time() - last >= interval:
+                    if batch:
+                        self.commit(batch)
+                        batch = []
+                    last = time.time()
+        except KeyboardInterrupt:
+            pass
+        # Commit what is left, including the returns still in the socket
+        self._recv(pull_sock, batch, float('inf'))
+        if batch:
+            self.commit(batch)
+        pull_sock.close()
+        context.term()
+
+
+class SearchIndexer(multiprocessing.Process):
+    '''
+    Keep the search index up to date. The index is updated in its own
+    process so that a long index run does not hold up the job cache cleanup.
+    '''
+    def __init__(self, opts):
+        super(SearchIndexer, self).__init__()
+        self.opts = opts
+
+    def run(self):
+        '''
+        Update the index every search_index_interval seconds
+        '''
+        search = salt.search.Search(self.opts)
+        interval = float(self.opts['search_index_interval'])
+        while True:
+            start = time.time()
+            try:
+                search.index()
+            except Exception as exc:
+                log.error('Failed to update the search index: {0}'.format(exc))
+            try:
+                time.sleep(max(interval - (time.time() - start), 0))
+            except KeyboardInterrupt:
+                break
+
+
+# Map the master commands to the worker lane they are executed in, commands
+# which are not listed here are executed in the default lane
+LANE_CMDS = {
+    'auth': ('_auth',),
+    'return': ('_return', '_syndic_return', '_minion_event'),
+    'file': ('_serve_file', '_file_hash', '_file_list', '_file_manifest',
+             '_file_list_emptydirs', '_dir_list', '_master_opts'),
+    'compile': ('_pillar', '_master_state', '_ext_nodes', 'minion_publish',
+                'minion_runner'),
+}
+
+
+class Lane(object):
+    '''
+    Track the workers, the queued requests and the statistics of a worker
+    lane in the ReqServer
+    '''
+    def __init__(self, name, size):
+        self.name = name
+        self.size = int(size)
+        self.procs = []
+        self.workers = set()
+        self.idle = collections.deque()
+        self.queue = collections.deque()
+        self.inflight = 0
+        self.processed = 0
+        self.max_queued = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def done(self, latency):
+        '''
+        Record a finished request
+        '''
+        self.inflight -= 1
+        self.processed += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def stats(self):
+        '''
+        Return the statistics for this lane
+        '''
+        avg = 0.0
+        if self.processed:
+            avg = self.total_latency / self.processed
+        return {'size': self.size,
+                'workers': len(self.workers),
+                'idle': len(self.idle),
+                'inflight': self.inflight,
+                'queued': len(self.queue),
+                'max_queued': self.max_queued,
+                'processed': self.processed,
+                'avg_latency': avg,
+                'max_latency': self.max_latency}
+
+
 class ReqServer(object):
     '''
     Starts up the master request server, minions send results to this
@@ -338,41 +611,223 @@ class ReqServer(object):
     def __init__(self, opts, crypticle, key, mkey):
         self.opts = opts
         self.master_key = mkey
+        self.serial = salt.payload.Serial(opts)
         self.context = zmq.Context(self.opts['worker_threads'])
         # Prepare the zeromq sockets
         self.uri = 'tcp://{interface}:{ret_port}'.format(**self.opts)
         self.clients = self.context.socket(zmq.ROUTER)
-        self.workers = self.context.socket(zmq.DEALER)
+        self.workers = self.context.socket(zmq.ROUTER)
         self.w_uri = 'ipc://{0}'.format(
             os.path.join(self.opts['sock_dir'], 'workers.ipc')
             )
+        self.ctl = self.context.socket(zmq.REP)
+        self.ctl_uri = 'ipc://{0}'.format(
+            os.path.join(self.opts['sock_dir'], 'workers_ctl.ipc')
+            )
         # Prepare the AES key
         self.key = key
         self.crypticle = crypticle
+        # Set up the worker lanes, the default lane is always present
+        self.lanes = {'default': Lane('default', self.opts['worker_threads'])}
+        for name, size in self.opts.get('worker_lanes', {}).items():
+            if name not in LANE_CMDS and name != 'default':
+                log.error('Unknown worker lane {0}, ignoring'.format(name))
+                continue
+            self.lanes[name] = Lane(name, size)
+        self.lane_map = {}
+        for name, cmds in LANE_CMDS.items():
+            if name in self.lanes:
+                for cmd in cmds:
+                    self.lane_map[cmd] = name
+        # Map the busy worker identities to the lane and the request start
+        self.busy = {}
+        self.job_cache_writer = None
 
-    def __bind(self):
+    @property
+    def work_procs(self):
         '''
-        Binds the reply server
+        Return all of the worker processes
         '''
-        log.info('Setting up the master communication server')
-        self.clients.bind(self.uri)
-        self.work_procs = []
+        procs = []
+        for lane in self.lanes.values():
+            procs.extend(lane.procs)
+        return procs
 
-        for ind in range(int(self.opts['worker_threads'])):
-            self.work_procs.append(MWorker(self.opts,
+    def __spawn(self, lane):
+        '''
+        Start worker processes until the lane has as many as its size
+        '''
+        lane.procs = [proc for proc in lane.procs if proc.is_alive()]
+        while len(lane.procs) < lane.size:
+            proc = MWorker(self.opts,
                     self.master_key,
                     self.key,
-                    self.crypticle))
-
-        for ind, proc in enumerate(self.work_procs):
-            log.info('Starting Salt worker process {0}'.format(ind))
+                    self.crypticle,
+                    lane.name)
+            log.info(
+                'Starting Salt worker process {0} in lane {1}'.format(
+                    len(lane.procs),
+                    lane.name
+                )
+            )
             proc.start()
+            lane.procs.append(proc)
+
+    def __reap(self):
+        '''
+        Forget the workers which died and start replacements for them
+        '''
+        for lane in self.lanes.values():
+            for proc in lane.procs:
+                if proc.is_alive():
+                    continue
+                wid = '{0}-{1}'.format(lane.name, proc.pid)
+                lane.workers.discard(wid)
+                if wid in lane.idle:
+                    lane.idle.remove(wid)
+                if wid in self.busy:
+                    log.error(
+                        'Worker {0} died while handling a request'.format(wid)
+                    )
+                    self.busy.pop(wid)
+                    lane.inflight -= 1
+            self.__spawn(lane)
+        if self.job_cache_writer and not self.job_cache_writer.is_alive():
+            log.error(
+                'The job cache writer died with exit code {0}, '
+                'restarting it'.format(self.job_cache_writer.exitcode)
+            )
+            self.start_job_cache_writer()
+
+    def __lane_name(self, package):
+        '''
+        Return the name of the lane a request package is executed in, the
+        command of clear loads is read directly, encrypted loads carry the
+        command in the clear next to the load
+        '''
+        if not self.lane_map:
+            return 'default'
+        try:
+            payload = self.serial.loads(package)
+            cmd = payload.get('cmd')
+            if not cmd and payload.get('enc') == 'clear':
+                cmd = payload['load'].get('cmd')
+        except Exception:
+            return 'default'
+        return self.lane_map.get(cmd, 'default')
+
+    def __dispatch(self, lane):
+        '''
+        Hand queued requests to the idle workers in the lane
+        '''
+        while lane.queue and lane.idle:
+            start, frames = lane.queue.popleft()
+            wid = lane.idle.popleft()
+            self.busy[wid] = (lane, start)
+            lane.inflight += 1
+            self.workers.send_multipart([wid, ''] + frames)
 
+    def __worker_ready(self, wid, lane):
+        '''
+        Put a worker back into the idle pool of its lane, or stop it if the
+        lane has been shrunk
+        '''
+        if len(lane.workers) > lane.size:
+            lane.workers.discard(wid)
+            self.workers.send_multipart([wid, '', 'STOP'])
+            return
+        lane.idle.append(wid)
+        self.__dispatch(lane)
+
+    def __handle_worker(self):
+        '''
+        Handle a message from a worker, either a ready notice or a reply to
+        pass back to the client
+        '''
+        frames = self.workers.recv_multipart()
+        wid = frames[0]
+        body = frames[2:]
+        if body[0] == 'READY':
+            lane = self.lanes.get(body[1])
+            if lane is None:
+                self.workers.send_multipart([wid, '', 'STOP'])
+                return
+            lane.workers.add(wid)
+        else:
+            lane, start = self.busy.pop(wid)
+            lane.done(time.time() - start)
+            self.clients.send_multipart(body)
+        self.__worker_ready(wid, lane)
+
+    def __handle_client(self):
+        '''
+        Queue a client request in the lane it belongs to
+        '''
+        frames = self.clients.recv_multipart()
+        lane = self.lanes[self.__lane_name(frames[-1])]
+        lane.queue.append((time.time(), frames))
+        lane.max_queued = max(lane.max_queued, len(lane.queue))
+        self.__dispatch(lane)
+
+    def __handle_ctl(self):
+        '''
+        Answer a request on the control socket, the control socket reports
+        the lane statistics and is used to resize the lanes at runtime
+        '''
+        load = self.serial.loads(self.ctl.recv())
+        ret = {}
+        if load.get('cmd') == 'resize':
+            lane = self.lanes.get(load.get('lane'))
+            if lane is None:
+                ret = 'Lane {0} is not configured'.format(load.get('lane'))
+            else:
+                lane.size = max(int(load['size']), 1)
+                self.__spawn(lane)
+                # Stop the surplus idle workers right away
+                while len(lane.workers) > lane.size and lane.idle:
+                    wid = lane.idle.pop()
+                    lane.workers.discard(wid)
+                    self.workers.send_multipart([wid, '', 'STOP'])
+        for name, lane in self.lanes.items():
+            if not isinstance(ret, dict):
+                break
+            ret[name] = lane.stats()
+        self.ctl.send(self.serial.dumps(ret))
+
+    def __bind(self):
+        '''
+        Binds the reply server
+        '''
+        log.info('Setting up the master communication server')
+        self.clients.bind(self.uri)
         self.workers.bind(self.w_uri)
+        self.ctl.bind(self.ctl_uri)
+        os.chmod(
+                os.path.join(self.opts['sock_dir'], 'workers_ctl.ipc'),
+                448
+                )
 
+        for lane in self.lanes.values():
+            self.__spawn(lane)
+
+        poller = zmq.Poller()
+        poller.register(self.clients, zmq.POLLIN)
+        poller.register(self.workers, zmq.POLLIN)
+        poller.register(self.ctl, zmq.POLLIN)
+        last_reap = time.time()
         while True:
             try:
-                zmq.device(zmq.QUEUE, self.clients, self.workers)
+                socks = dict(poller.poll(5000))
+                if time.time() - last_reap > 5:
+                    self.__reap()
+                    last_reap = time.time()
+                # Replies first, they free up workers for the queued requests
+                if socks.get(self.workers) == zmq.POLLIN:
+                    self.__handle_worker()
+                if socks.get(self.clients) == zmq.POLLIN:
+                    self.__handle_client()
+                if socks.get(self.ctl) == zmq.POLLIN:
+                    self.__handle_ctl()
             except zmq.ZMQError as exc:
                 if exc.errno == errno.EINTR:
                     continue
@@ -394,6 +849,15 @@ class ReqServer(object):
         self.eventpublisher = salt.utils.event.EventPublisher(self.opts)
         self.eventpublisher.start()
 
+    def start_job_cache_writer(self):
+        '''
+        Start the process which writes the minion returns to the job cache
+        '''
+        if not self.opts['job_cache_writer']:
+            return
+        self.job_cache_writer = JobCacheWriter(self.opts)
+        self.job_cache_writer.start()
+
     def run(self):
         '''
         Start up the ReqServer
@@ -410,40 +874,52 @@ class MWorker(multiprocessing.Process):
             opts,
             mkey,
             key,
-            crypticle):
+            crypticle,
+            lane='default'):
         multiprocessing.Process.__init__(self)
         self.opts = opts
         self.serial = salt.payload.Serial(opts)
         self.crypticle = crypticle
         self.mkey = mkey
         self.key = key
+        self.lane = lane
 
     def __bind(self):
         '''
         Bind to the local port
         '''
         context = zmq.Context(1)
-        socket = context.socket(zmq.REP)
+        socket = context.socket(zmq.REQ)
+        socket.setsockopt(
+                zmq.IDENTITY,
+                '{0}-{1}'.format(self.lane, os.getpid())
+                )
         w_uri = 'ipc://{0}'.format(
             os.path.join(self.opts['sock_dir'], 'workers.ipc')
             )
         log.info('Worker binding to socket {0}'.format(w_uri))
         try:
             socket.connect(w_uri)
+            # Tell the ReqServer that this worker is ready for requests
+            socket.send_multipart(['READY', self.lane])
 
             while True:
                 try:
-                    package = socket.recv()
-                    payload = self.serial.loads(package)
+                    frames = socket.recv_multipart()
+                    if frames == ['STOP']:
+                        log.info('Worker in lane {0} stopped'.format(self.lane))
+                        break
+                    payload = self.serial.loads(frames[-1])
                     ret = self.serial.dumps(self._handle_payload(payload))
-                    socket.send(ret)
+                    socket.send_multipart(frames[:-1] + [ret])
                 # Properly handle EINTR from SIGUSR1
                 except zmq.ZMQError as exc:
                     if exc.errno == errno.EINTR:
                         continue
                     raise exc
         except KeyboardInterrupt:
-            socket.close()
+            pass
+        socket.close()
 
     def _handle_payload(self, payload):
         '''
@@ -518,6 +994,14 @@ class AESFuncs(object):
         self.local = salt.client.LocalClient(self.opts['conf_file'])
         # Create the master minion to access the external job cache
         self.mminion = salt.minion.MasterMinion(self.opts)
+        # The socket to the job cache writer is connected on first use
+        self.job_cache_push = None
+        # Hashes of the files in the file_roots, shared by the workers
+        self.hashes = salt.utils.hashcache.get_cache(self.opts)
+        # Whether the files in the file_roots compress, keyed by path
+        self.compress_cache = {}
+        # The threads writing compressed streams, keyed by stream path
+        self.zstream_jobs = {}
 
     def __find_file(self, path, env='base'):
         '''
@@ -624,9 +1108,110 @@ class AESFuncs(object):
                 pass
         return ret
 
+    def __hash_file(self, path, form):
+        '''
+        Return the hash of a file in the file_roots, the hash is only
+        recalculated when the inode, mtime or size of the file changes
+        '''
+        return self.hashes.get_hash(path, form)
+
+    def __delta(self, path, sig):
+        '''
+        Return the delta which rebuilds a file from the copy the minion
+        described by its block checksums, or None to send the whole file
+        '''
+        try:
+            if int(sig['block_size']) <= 0:
+                return None
+            return salt.utils.delta.delta(path, sig)
+        except Exception as exc:
+            log.error(
+                'Failed to compute the delta of {0}: {1}'.format(path, exc)
+            )
+            return None
+
+    def __zstream_path(self, path, hsum, level):
+        '''
+        Return the location of the compressed stream of a version of a file,
+        the streams of a file are kept in a directory of their own
+        '''
+        return os.path.join(
+                self.opts['cachedir'],
+                'file_zcache',
+                hashlib.md5(path).hexdigest(),
+                '{0}.{1}'.format(hsum, level)
+                )
+
+    def __zstream(self, path, hsum, level):
+        '''
+        Return the location of the compressed stream of a file, the stream is
+        written once for every version of the file and compression level so
+        the chunks of a file share one compressor. The stream is written in
+        the background and an empty string is returned until it is in place,
+        the file is sent uncompressed meanwhile. Files which do not compress
+        get no stream.
+        '''
+        fstat = os.stat(path)
+        cached = self.compress_cache.get(path)
+        if cached and cached[:2] == (fstat.st_mtime, fstat.st_size):
+            if not cached[2]:
+                return ''
+        else:
+            comp = salt.utils.gzip_util.compressible(path)
+            self.compress_cache[path] = (fstat.st_mtime, fstat.st_size, comp)
+            if not comp:
+                return ''
+        zpath = self.__zstream_path(path, hsum, level)
+        if os.path.isfile(zpath):
+            return zpath
+        for key in list(self.zstream_jobs):
+            if not self.zstream_jobs[key].is_alive():
+                self.zstream_jobs.pop(key)
+        if zpath in self.zstream_jobs:
+            return ''
+        zdir, name = os.path.split(zpath)
+        if not os.path.isdir(zdir):
+            os.makedirs(zdir)
+        # Remove the streams of the older versions of the file at this level
+        # and the temporary files left behind by dead processes, a stream
+        # another worker is writing is left to it
+        for fn_ in os.listdir(zdir):
+            comps = fn_.split('.')
+            if len(comps) == 3 and comps[2].isdigit():
+                if salt.utils.process.os_is_running(comps[2]):
+                    if fn_.startswith(name + '.'):
+                        return ''
+                    continue
+            elif len(comps) != 2 or fn_ == name or comps[1] != str(level):
+                continue
+            salt.utils.safe_rm(os.path.join(zdir, fn_))
+        job = threading.Thread(
+                target=self.__compress,
+                args=(path, zpath, level))
+        job.daemon = True
+        job.start()
+        self.zstream_jobs[zpath] = job
+        return ''
+
+    def __compress(self, path, zpath, level):
+        '''
+        Write the compressed stream of a file and move it into place
+        '''
+        tmp = '{0}.{1}'.format(zpath, os.getpid())
+        try:
+            salt.utils.gzip_util.compress_file(path, tmp, level)
+            os.rename(tmp, zpath)
+        except (IOError, OSError) as exc:
+            log.error(
+                'Failed to compress {0}: {1}'.format(path, exc)
+            )
+            salt.utils.safe_rm(tmp)
+
     def _serve_file(self, load):
         '''
-        Return a chunk from a file based on the data received
+        Return a chunk from a file based on the data received, if the minion
+        sends the hash of its cached copy and it matches the file no data is
+        sent back
         '''
         ret = {'data': '',
                'dest': ''}
@@ -638,9 +1223,57 @@ class AESFuncs(object):
         ret['dest'] = fnd['rel']
         gzip = load.get('gzip', None)
 
+        if load['loc'] == 0 and load.get('hsum'):
+            form = load.get('hash_type', 'md5')
+            if form in salt.utils.HASH_TYPES:
+                hsum = self.__hash_file(fnd['path'], form)
+                if hsum == load['hsum']:
+                    ret['unchanged'] = True
+                    return ret
+                if load.get('blocks'):
+                    ops = self.__delta(fnd['path'], load['blocks'])
+                    if ops is not None:
+                        ret['delta'] = ops
+                        ret['block_size'] = load['blocks']['block_size']
+                        ret['hsum'] = hsum
+                        ret['hash_type'] = form
+                        return ret
+
+        if (load['loc'] == 0 and
+                load.get('hash_type') in salt.utils.HASH_TYPES):
+            # The minion can place the file from its object store if it
+            # already holds the content
+            ret['hsum'] = self.__hash_file(fnd['path'], load['hash_type'])
+
+        if load.get('compress') and not load.get('size'):
+            level = min(max(int(load['compress']), 1), 9)
+            zsum = load.get('zsum')
+            if zsum is None:
+                zsum = self.__hash_file(fnd['path'], self.opts['hash_type'])
+                zpath = ''
+                if load['loc'] == 0:
+                    zpath = self.__zstream(fnd['path'], zsum, level)
+            elif zsum.isalnum():
+                zpath = self.__zstream_path(fnd['path'], zsum, level)
+                if not os.path.isfile(zpath):
+                    ret['zreset'] = True
+                    return ret
+            else:
+                return ret
+            if zpath:
+                with salt.utils.fopen(zpath, 'rb') as fp_:
+                    fp_.seek(load['loc'])
+                    ret['data'] = fp_.read(self.opts['file_buffer_size'])
+                ret['compress'] = level
+                ret['zsum'] = zsum
+                return ret
+
+        size = self.opts['file_buffer_size']
+        if load.get('size'):
+            size = min(size, int(load['size']))
         with salt.utils.fopen(fnd['path'], 'rb') as fp_:
             fp_.seek(load['loc'])
-            data = fp_.read(self.opts['file_buffer_size'])
+            data = fp_.read(size)
             if gzip and data:
                 data = salt.utils.gzip_util.compress(data, gzip)
                 ret['gzip'] = gzip
@@ -657,9 +1290,7 @@ class AESFuncs(object):
         if not path:
             return {}
         ret = {}
-        with salt.utils.fopen(path, 'rb') as fp_:
-            ret['hsum'] = getattr(hashlib, self.opts['hash_type'])(
-                    fp_.read()).hexdigest()
+        ret['hsum'] = self.__hash_file(path, self.opts['hash_type'])
         ret['hash_type'] = self.opts['hash_type']
         return ret
 
@@ -685,6 +1316,46 @@ class AESFuncs(object):
                         )
         return ret
 
+    def _file_manifest(self, load):
+        '''
+        Return the path, size and hash of every file under a prefix of an
+        environment, and the empty directories, so that the minion can sync
+        a directory in one request
+        '''
+        ret = {'files': [],
+               'empty_dirs': [],
+               'hash_type': self.opts['hash_type']}
+        if 'env' not in load or load['env'] not in self.opts['file_roots']:
+            return ret
+        prefix = load.get('prefix', '')
+        if os.path.isabs(prefix) or '..' in prefix.split('/'):
+            return ret
+        seen = set()
+        for path in self.opts['file_roots'][load['env']]:
+            # Only walk the part of the file root the prefix can match
+            top = os.path.join(path, prefix)
+            if not os.path.isdir(top):
+                top = os.path.dirname(top)
+            for root, dirs, files in os.walk(top, followlinks=True):
+                rel_root = os.path.relpath(root, path)
+                if not files and not dirs and rel_root.startswith(prefix):
+                    ret['empty_dirs'].append(rel_root)
+                for fn_ in files:
+                    full = os.path.join(root, fn_)
+                    rel = os.path.relpath(full, path)
+                    if not rel.startswith(prefix) or rel in seen:
+                        continue
+                    seen.add(rel)
+                    try:
+                        ret['files'].append([
+                            rel,
+                            os.path.getsize(full),
+                            self.__hash_file(full, self.opts['hash_type'])
+                        ])
+                    except (IOError, OSError):
+                        continue
+        return ret
+
     def _file_list_emptydirs(self, load):
         '''
         Return a list of all empty directories on the master
@@ -780,47 +1451,39 @@ class AESFuncs(object):
         self.event.fire_event(load, load['jid'])
         if not self.opts['job_cache'] or self.opts.get('ext_job_cache'):
             return
-        jid_dir = salt.utils.jid_dir(
-                load['jid'],
-                self.opts['cachedir'],
-                self.opts['hash_type']
-                )
-        if not os.path.isdir(jid_dir):
-            log.error(
-                'An inconsistency occurred, a job was received with a job id '
-                'that is not present on the master: {jid}'.format(**load)
-            )
-            return False
-        hn_dir = os.path.join(jid_dir, load['id'])
-        if not os.path.isdir(hn_dir):
-            os.makedirs(hn_dir)
-        # Otherwise the minion has already returned this jid and it should
-        # be dropped
-        else:
-            log.error(
-                    ('An extra return was detected from minion {0}, please'
-                    ' verify the minion, this could be a replay'
-                    ' attack').format(load['id'])
-                    )
+        if self.opts['job_cache_writer'] and self.__push_job_cache(load):
+            # The job cache writer process writes the return
+            return
+        if store_job_return(self.opts, self.serial, load) is False:
             return False
 
-        self.serial.dump(
-            load['return'],
-            # Use atomic open here to avoid the file being read before it's
-            # completely written to. Refs #1935
-            salt.utils.atomicfile.atomic_open(
-                os.path.join(hn_dir, 'return.p'), 'w+'
-            )
-        )
-        if 'out' in load:
-            self.serial.dump(
-                load['out'],
-                # Use atomic open here to avoid the file being read before
-                # it's completely written to. Refs #1935
-                salt.utils.atomicfile.atomic_open(
-                    os.path.join(hn_dir, 'out.p'), 'w+'
+    def __push_job_cache(self, load):
+        '''
+        Send a load to the job cache writer process, returns False if the
+        writer is not running or its queue is full
+        '''
+        if self.job_cache_push is None:
+            context = zmq.Context(1)
+            self.job_cache_push = context.socket(zmq.PUSH)
+            hwm = int(self.opts['job_cache_batch_size']) * 2
+            # if 2.1 >= zmq < 3.0, we only have one HWM setting
+            try:
+                self.job_cache_push.setsockopt(zmq.HWM, hwm)
+            # in zmq >= 3.0, there are separate send and receive HWM settings
+            except AttributeError:
+                self.job_cache_push.setsockopt(zmq.SNDHWM, hwm)
+            self.job_cache_push.connect(
+                'ipc://{0}'.format(
+                    os.path.join(self.opts['sock_dir'], 'job_cache_pull.ipc')
                 )
             )
+        try:
+            self.job_cache_push.send(self.serial.dumps(load), zmq.NOBLOCK)
+        except zmq.ZMQError as exc:
+            if exc.errno not in (errno.EAGAIN, errno.EINTR):
+                raise exc
+            return False
+        return True
 
     def _syndic_return(self, load):
         '''
@@ -830,39 +1493,58 @@ class AESFuncs(object):
         # Verify the load
         if 'return' not in load or 'jid' not in load or 'id' not in load:
             return None
-        # set the write flag
-        jid_dir = salt.utils.jid_dir(
-                load['jid'],
-                self.opts['cachedir'],
-                self.opts['hash_type']
-                )
-        if not os.path.isdir(jid_dir):
-            log.error(
-                'An inconsistency occurred, a job was received with a job id '
-                'that is not present on the master: {jid}'.format(**load)
-            )
-            return False
-        wtag = os.path.join(jid_dir, 'wtag_{0}'.format(load['id']))
-        try:
-            with salt.utils.fopen(wtag, 'w+') as fp_:
-                fp_.write('')
-        except (IOError, OSError):
-            log.error(
-                    ('Failed to commit the write tag for the syndic return,'
-                    ' are permissions correct in the cache dir:'
-                    ' {0}?').format(self.opts['cachedir'])
+        # The syndic sends the returns in batches as they come in, the
+        # minions which are expected to return are announced up front
+        minions = load.get('minions') or load['return'].keys()
+        if minions:
+            self.event.fire_event({'syndic': minions}, load['jid'])
+        if not load['return']:
+            return True
+        wtag = None
+        if self.opts['job_cache'] and not self.opts.get('ext_job_cache'):
+            # set the write flag
+            jid_dir = salt.utils.jid_dir(
+                    load['jid'],
+                    self.opts['cachedir'],
+                    self.opts['hash_type']
                     )
-            return False
+            if not os.path.isdir(jid_dir):
+                log.error(
+                    'An inconsistency occurred, a job was received with a job '
+                    'id that is not present on the master: {jid}'.format(
+                        **load)
+                )
+                return False
+            wtag = os.path.join(jid_dir, 'wtag_{0}'.format(load['id']))
+            try:
+                with salt.utils.fopen(wtag, 'w+') as fp_:
+                    fp_.write('')
+            except (IOError, OSError):
+                log.error(
+                        ('Failed to commit the write tag for the syndic '
+                        'return, are permissions correct in the cache dir:'
+                        ' {0}?').format(self.opts['cachedir'])
+                        )
+                return False
 
         # Format individual return loads
-        self.event.fire_event({'syndic': load['return'].keys()}, load['jid'])
+        outs = load.get('out', {})
         for key, item in load['return'].items():
             ret = {'jid': load['jid'],
                    'id': key,
                    'return': item}
+            if key in outs:
+                ret['out'] = outs[key]
             self._return(ret)
+        if wtag is None:
+            return True
+        if self.opts['job_cache_writer'] and self.__push_job_cache(
+                {'wtag': wtag}):
+            # The write tag is removed once the returns hit the disk
+            return True
         if os.path.isfile(wtag):
             os.remove(wtag)
+        return True
 
     def minion_runner(self, clear_load):
         '''
@@ -1121,6 +1803,10 @@ class ClearFuncs(object):
         self.ckminions = salt.utils.minions.CkMinions(opts)
         # Make an Auth object
         self.loadauth = salt.auth.LoadAuth(opts)
+        # The index of the minion keys
+        self.keys = salt.key.get_store(opts)
+        # The compiled autosign rules and the stat of the file they came from
+        self.autosign = (None, None)
         # Stand up the master Minion to access returner data
         self.mminion = salt.minion.MasterMinion(self.opts)
         # Make a wheel object
@@ -1209,6 +1895,41 @@ class ClearFuncs(object):
 
         return False
 
+    def _autosign_rules(self, autosign_file):
+        '''
+        Return the exact ids and the compiled patterns of the autosign file,
+        or None if the file cannot be used. The file is only read again when
+        it is changed, moved or has its ownership or mode changed
+        '''
+        fstat = os.stat(autosign_file)
+        key = (fstat.st_ino, fstat.st_size, fstat.st_mtime, fstat.st_ctime)
+        if self.autosign[0] == key:
+            return self.autosign[1]
+        rules = None
+        if not self._check_permissions(autosign_file):
+            message = "Wrong permissions for {0}, ignoring content"
+            log.warn(message.format(autosign_file))
+        else:
+            exact = set()
+            patterns = []
+            with salt.utils.fopen(autosign_file, 'r') as fp_:
+                for line in fp_:
+                    line = line.strip()
+
+                    if not line or line.startswith('#'):
+                        continue
+
+                    exact.add(line)
+                    patterns.append(re.compile(fnmatch.translate(line)))
+                    try:
+                        patterns.append(re.compile(line))
+                    except re.error:
+                        message = "{0} is not a valid regular expression, ignoring line in {1}"
+                        log.warn(message.format(line, autosign_file))
+            rules = (exact, patterns)
+        self.autosign = (key, rules)
+        return rules
+
     def _check_autosign(self, keyid):
         '''
         Checks if the specified keyid should automatically be signed.
@@ -1222,29 +1943,16 @@ class ClearFuncs(object):
         if not autosign_file or not os.path.exists(autosign_file):
             return False
 
-        if not self._check_permissions(autosign_file):
-            message = "Wrong permissions for {0}, ignoring content"
-            log.warn(message.format(autosign_file))
+        rules = self._autosign_rules(autosign_file)
+        if rules is None:
             return False
 
-        with salt.utils.fopen(autosign_file, 'r') as fp_:
-            for line in fp_:
-                line = line.strip()
-
-                if line.startswith('#'):
-                    continue
-
-                if line == keyid:
-                    return True
-                if fnmatch.fnmatch(keyid, line):
-                    return True
-                try:
-                    if re.match(line, keyid):
-                        return True
-                except re.error:
-                    message = "{0} is not a valid regular expression, ignoring line in {1}"
-                    log.warn(message.format(line, autosign_file))
-                    continue
+        exact, patterns = rules
+        if keyid in exact:
+            return True
+        for pattern in patterns:
+            if pattern.match(keyid):
+                return True
 
         return False
 
@@ -1264,7 +1972,7 @@ class ClearFuncs(object):
         # 4. encrypt the aes key as an encrypted salt.payload
         # 5. package the return and return it
 
-        salt.utils.verify.check_max_open_files(self.opts)
+        salt.utils.verify.check_max_open_files(self.opts, self.keys)
 
         log.info('Authentication request from {id}'.format(**load))
         pubfn = os.path.join(self.opts['pki_dir'],
@@ -1273,14 +1981,11 @@ class ClearFuncs(object):
         pubfn_pend = os.path.join(self.opts['pki_dir'],
                 'minions_pre',
                 load['id'])
-        pubfn_rejected = os.path.join(self.opts['pki_dir'],
-                'minions_rejected',
-                load['id'])
         if self.opts['open_mode']:
             # open mode is turned on, nuts to checks and overwrite whatever
             # is there
             pass
-        elif os.path.isfile(pubfn_rejected):
+        elif self.keys.check('minions_rejected', load['id']):
             # The key has been rejected, don't place it in pending
             log.info('Public key rejected for {id}'.format(**load))
             ret = {'enc': 'clear',
@@ -1290,7 +1995,7 @@ class ClearFuncs(object):
                      'pub': load['pub']}
             self.event.fire_event(eload, 'auth')
             return ret
-        elif os.path.isfile(pubfn):
+        elif self.keys.check('minions', load['id']):
             # The key has been accepted check it
             if not salt.utils.fopen(pubfn, 'r').read() == load['pub']:
                 log.error(
@@ -1305,14 +2010,13 @@ class ClearFuncs(object):
                          'pub': load['pub']}
                 self.event.fire_event(eload, 'auth')
                 return ret
-        elif not os.path.isfile(pubfn_pend)\
+        elif not self.keys.check('minions_pre', load['id'])\
                 and not self._check_autosign(load['id']):
             # This is a new key, stick it in pre
             log.info(
                 'New public key placed in pending for {id}'.format(**load)
             )
-            with salt.utils.fopen(pubfn_pend, 'w+') as fp_:
-                fp_.write(load['pub'])
+            self.keys.add('minions_pre', load['id'], load['pub'])
             ret = {'enc': 'clear',
                    'load': {'ret': True}}
             eload = {'result': True,
@@ -1321,7 +2025,7 @@ class ClearFuncs(object):
                      'pub': load['pub']}
             self.event.fire_event(eload, 'auth')
             return ret
-        elif os.path.isfile(pubfn_pend)\
+        elif self.keys.check('minions_pre', load['id'])\
                 and not self._check_autosign(load['id']):
             # This key is in pending, if it is the same key ret True, else
             # ret False
@@ -1350,7 +2054,7 @@ class ClearFuncs(object):
                 self.event.fire_event(eload, 'auth')
                 return {'enc': 'clear',
                         'load': {'ret': True}}
-        elif os.path.isfile(pubfn_pend)\
+        elif self.keys.check('minions_pre', load['id'])\
                 and self._check_autosign(load['id']):
             # This key is in pending, if it is the same key auto accept it
             if not salt.utils.fopen(pubfn_pend, 'r').read() == load['pub']:
@@ -1367,7 +2071,7 @@ class ClearFuncs(object):
                         'load': {'ret': False}}
             else:
                 pass
-        elif not os.path.isfile(pubfn_pend)\
+        elif not self.keys.check('minions_pre', load['id'])\
                 and self._check_autosign(load['id']):
             # This is a new key and it should be automatically be accepted
             pass
@@ -1382,8 +2086,7 @@ class ClearFuncs(object):
                     'load': {'ret': False}}
 
         log.info('Authentication accepted from {id}'.format(**load))
-        with salt.utils.fopen(pubfn, 'w+') as fp_:
-            fp_.write(load['pub'])
+        self.keys.add('minions', load['id'], load['pub'])
         pub = None
 
         # The key payload may sometimes be corrupt when using auto-accept
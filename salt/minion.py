@@ -28,6 +28,8 @@ import salt.client
 import salt.crypt
 import salt.loader
 import salt.utils
+import salt.utils.event
+import salt.utils.process
 import salt.payload
 from salt._compat import string_types
 from salt.utils.debug import enable_sigusr1_handler
@@ -58,6 +60,127 @@ def get_proc_dir(cachedir):
     return fn_
 
 
+def job_registry_uri(opts):
+    '''
+    Return the uri of the socket the minion answers job registry queries on
+    '''
+    if opts.get('ipc_mode', '') == 'tcp':
+        return 'tcp://127.0.0.1:{0}'.format(opts.get('tcp_jobs_port', 4512))
+    id_hash = hashlib.md5(opts.get('id', '')).hexdigest()
+    return 'ipc://{0}'.format(
+            os.path.join(
+                opts['sock_dir'],
+                'minion_jobs_{0}.ipc'.format(id_hash)
+                )
+            )
+
+
+def query_job_registry(opts, load, timeout=5):
+    '''
+    Ask the running minion daemon about the jobs it is executing, returns
+    None if the daemon does not answer within the timeout
+    '''
+    serial = salt.payload.Serial(opts)
+    context = zmq.Context()
+    sock = context.socket(zmq.REQ)
+    sock.setsockopt(zmq.LINGER, 0)
+    try:
+        sock.connect(job_registry_uri(opts))
+        sock.send(serial.dumps(load))
+        if sock.poll(timeout * 1000) != zmq.POLLIN:
+            log.debug('The minion job registry did not answer, falling back '
+                      'to the proc directory')
+            return None
+        return serial.loads(sock.recv())
+    except zmq.ZMQError:
+        return None
+    finally:
+        sock.close()
+        context.term()
+
+
+class JobRegistry(object):
+    '''
+    Keep track of the jobs running on the minion. The registry lives in the
+    main minion process, jobs are added when they are spawned and removed
+    when the job end event is seen on the minion event bus, so that
+    saltutil.running and friends do not need to scan the process table or
+    the proc directory.
+    '''
+    def __init__(self, opts):
+        self.opts = opts
+        self.serial = salt.payload.Serial(opts)
+        self.jobs = {}
+
+    def add(self, data, pid):
+        '''
+        Register a job as running in the given pid
+        '''
+        sdata = {'pid': pid}
+        sdata.update(data)
+        self.jobs[data['jid']] = sdata
+
+    def remove(self, jid, pid=None):
+        '''
+        Remove a job from the registry, if a pid is passed only remove the
+        job if it is still registered to that pid
+        '''
+        if jid not in self.jobs:
+            return
+        if pid is not None and self.jobs[jid]['pid'] != pid:
+            return
+        self.jobs.pop(jid)
+
+    def prune(self):
+        '''
+        Drop the jobs whose process died without sending a job end event
+        '''
+        for jid, data in list(self.jobs.items()):
+            if not salt.utils.process.os_is_running(data['pid']):
+                self.jobs.pop(jid)
+
+    def running(self):
+        '''
+        Return the data on all of the running jobs
+        '''
+        self.prune()
+        return list(self.jobs.values())
+
+    def find(self, jid):
+        '''
+        Return the data for a single running job
+        '''
+        data = self.jobs.get(jid)
+        if data is None:
+            return {}
+        if not salt.utils.process.os_is_running(data['pid']):
+            self.jobs.pop(jid)
+            return {}
+        return data
+
+    def handle_event(self, package):
+        '''
+        Update the registry from a raw event package off of the minion
+        event bus
+        '''
+        if not package.startswith('_salt_job_'):
+            return
+        tag, data = salt.utils.event.SaltEvent.unpack(package, self.serial)
+        if tag == '_salt_job_start':
+            pid = data.pop('pid')
+            self.add(data, pid)
+        elif tag == '_salt_job_end':
+            self.remove(data['jid'], data.get('pid'))
+
+    def handle_query(self, load):
+        '''
+        Answer a query made with query_job_registry
+        '''
+        if load.get('cmd') == 'find':
+            return self.find(load.get('jid'))
+        return self.running()
+
+
 def detect_kwargs(func, args, data=None):
     '''
     Detect the args and kwargs that need to be passed to a function call
@@ -185,6 +308,7 @@ class Minion(object):
         self.functions, self.returners = self.__load_modules()
         self.matcher = Matcher(self.opts, self.functions)
         self.proc_dir = get_proc_dir(opts['cachedir'])
+        self.jobs = JobRegistry(self.opts)
         self.authenticate()
 
     def __prep_mod_opts(self):
@@ -218,7 +342,7 @@ class Minion(object):
                 'cmd': '_minion_event'}
         sreq = salt.payload.SREQ(self.opts['master_uri'])
         try:
-            sreq.send('aes', self.crypticle.dumps(load))
+            sreq.send('aes', self.crypticle.dumps(load), cmd=load['cmd'])
         except:
             pass
 
@@ -302,8 +426,13 @@ class Minion(object):
                 # let python reconstruct the minion on the other side if we're
                 # running on windows
                 instance = None
-            multiprocessing.Process(target=target, args=(instance, self.opts, data)).start()
+            process = multiprocessing.Process(
+                target=target, args=(instance, self.opts, data)
+            )
+            process.start()
+            self.jobs.add(data, process.pid)
         else:
+            self.jobs.add(data, os.getpid())
             threading.Thread(target=target, args=(instance, self.opts, data)).start()
 
     @classmethod
@@ -439,6 +568,28 @@ class Minion(object):
                                 )
                             )
 
+    def _send_master(self, load):
+        '''
+        Send an encrypted load to the master and return the reply, the
+        minion authenticates again if the master AES key has changed
+        '''
+        sreq = salt.payload.SREQ(self.opts['master_uri'])
+        try:
+            ret_val = sreq.send(
+                    'aes',
+                    self.crypticle.dumps(load),
+                    cmd=load['cmd'])
+        except SaltReqTimeoutError:
+            ret_val = ''
+        if isinstance(ret_val, string_types) and not ret_val:
+            # The master AES key has changed, reauth
+            self.authenticate()
+            ret_val = sreq.send(
+                    'aes',
+                    self.crypticle.dumps(load),
+                    cmd=load['cmd'])
+        return ret_val
+
     def _return_pub(self, ret, ret_cmd='_return'):
         '''
         Return the data from the executed command to the master server
@@ -451,22 +602,22 @@ class Minion(object):
                 except (OSError, IOError):
                     # The file is gone already
                     pass
+        # Let the job registry in the main minion process know we are done
+        event = salt.utils.event.MinionEvent(**self.opts)
+        try:
+            event.fire_event(
+                    {'jid': ret['jid'], 'pid': os.getpid()},
+                    '_salt_job_end'
+                    )
+        except zmq.ZMQError:
+            pass
+        finally:
+            event.destroy()
         log.info('Returning information for job: {0}'.format(ret['jid']))
-        sreq = salt.payload.SREQ(self.opts['master_uri'])
-        if ret_cmd == '_syndic_return':
-            load = {'cmd': ret_cmd,
-                    'jid': ret['jid'],
-                    'id': self.opts['id']}
-            load['return'] = {}
-            for key, value in ret.items():
-                if key == 'jid' or key == 'fun':
-                    continue
-                load['return'][key] = value
-        else:
-            load = {'return': ret['return'],
-                    'cmd': ret_cmd,
-                    'jid': ret['jid'],
-                    'id': self.opts['id']}
+        load = {'return': ret['return'],
+                'cmd': ret_cmd,
+                'jid': ret['jid'],
+                'id': self.opts['id']}
         try:
             if hasattr(self.functions[ret['fun']], '__outputter__'):
                 oput = self.functions[ret['fun']].__outputter__
@@ -474,14 +625,7 @@ class Minion(object):
                     load['out'] = oput
         except KeyError:
             pass
-        try:
-            ret_val = sreq.send('aes', self.crypticle.dumps(load))
-        except SaltReqTimeoutError:
-            ret_val = ''
-        if isinstance(ret_val, string_types) and not ret_val:
-            # The master AES key has changed, reauth
-            self.authenticate()
-            ret_val = sreq.send('aes', self.crypticle.dumps(load))
+        ret_val = self._send_master(load)
         if self.opts['cache_jobs']:
             # Local job cache has been enabled
             fn_ = os.path.join(
@@ -611,9 +755,13 @@ class Minion(object):
 
         # Create the pull socket
         epull_sock = context.socket(zmq.PULL)
+        # Create the socket used to answer job registry queries
+        jobs_sock = context.socket(zmq.REP)
+        jobs_uri = job_registry_uri(self.opts)
         # Bind the event sockets
         epub_sock.bind(epub_uri)
         epull_sock.bind(epull_uri)
+        jobs_sock.bind(jobs_uri)
         # Restrict access to the sockets
         if not self.opts.get('ipc_mode', '') == 'tcp':
             os.chmod(
@@ -624,15 +772,19 @@ class Minion(object):
                     epull_sock_path,
                     448
                     )
+            os.chmod(
+                    jobs_uri[6:],
+                    448
+                    )
 
         poller = zmq.Poller()
-        epoller = zmq.Poller()
         socket = context.socket(zmq.SUB)
         socket.setsockopt(zmq.SUBSCRIBE, '')
         socket.setsockopt(zmq.IDENTITY, self.opts['id'])
         socket.connect(self.master_pub)
         poller.register(socket, zmq.POLLIN)
-        epoller.register(epull_sock, zmq.POLLIN)
+        poller.register(epull_sock, zmq.POLLIN)
+        poller.register(jobs_sock, zmq.POLLIN)
         # Send an event to the master that the minion is live
         self._fire_master(
                 'Minion {0} started at {1}'.format(
@@ -654,16 +806,38 @@ class Minion(object):
                 if socket in socks and socks[socket] == zmq.POLLIN:
                     payload = self.serial.loads(socket.recv())
                     self._handle_payload(payload)
-                time.sleep(0.05)
-                multiprocessing.active_children()
-                self.passive_refresh()
-                # Check the event system
-                if epoller.poll(1):
+                    time.sleep(0.05)
+                # Check the event system, this also keeps the job registry
+                # up to date
+                if epull_sock in socks and socks[epull_sock] == zmq.POLLIN:
+                    while True:
+                        try:
+                            package = epull_sock.recv(zmq.NOBLOCK)
+                        except zmq.ZMQError:
+                            break
+                        # Forward the event first, a package the registry
+                        # can not read is still delivered to the listeners
+                        try:
+                            epub_sock.send(package)
+                        except Exception:
+                            pass
+                        try:
+                            self.jobs.handle_event(package)
+                        except Exception:
+                            log.error(traceback.format_exc())
+                # Answer job registry queries from memory, every request
+                # gets a reply so that the REP socket does not get stuck
+                if jobs_sock in socks and socks[jobs_sock] == zmq.POLLIN:
+                    query = jobs_sock.recv()
+                    ret = None
                     try:
-                        package = epull_sock.recv(zmq.NOBLOCK)
-                        epub_sock.send(package)
+                        ret = self.jobs.handle_query(self.serial.loads(query))
                     except Exception:
-                        pass
+                        log.error(traceback.format_exc())
+                    finally:
+                        jobs_sock.send(self.serial.dumps(ret))
+                multiprocessing.active_children()
+                self.passive_refresh()
             except Exception:
                 log.critical(traceback.format_exc())
 
@@ -676,6 +850,9 @@ class Syndic(salt.client.LocalClient, Minion):
     def __init__(self, opts):
         self._syndic = True
         salt.client.LocalClient.__init__(self, opts['_master_conf_file'])
+        # The returns of the lower minions are read from the event bus of
+        # the syndic master
+        self.master_sock_dir = self.opts['sock_dir']
         Minion.__init__(self, opts)
 
     def _handle_aes(self, load):
@@ -718,13 +895,46 @@ class Syndic(salt.client.LocalClient, Minion):
                 target=lambda: self.syndic_cmd(data)
             ).start()
 
+    def _forward_returns(self, jid, returns, outs=None, minions=None):
+        '''
+        Send a batch of returns from the lower minions up to the master, the
+        minions which are expected to return are announced with an empty
+        batch
+        '''
+        load = {'cmd': '_syndic_return',
+                'jid': jid,
+                'id': self.opts['id'],
+                'return': returns}
+        if outs:
+            load['out'] = outs
+        if minions:
+            load['minions'] = list(minions)
+        return self._send_master(load)
+
     def syndic_cmd(self, data):
         '''
-        Take the now clear load and forward it on to the client cmd
+        Take the now clear load and forward it on to the client cmd, the
+        returns are passed up to the master in batches as they come in
         '''
         # Set up default tgt_type
         if 'tgt_type' not in data:
             data['tgt_type'] = 'glob'
+        # Listen for the returns before the publication goes out
+        event = salt.utils.event.MasterEvent(self.master_sock_dir)
+        try:
+            self._syndic_forward(data, event)
+        finally:
+            event.destroy()
+
+    def _syndic_forward(self, data, event):
+        '''
+        Publish the load and forward the returns collected on the event
+        '''
+        # The subscription has to be on the socket before the publication
+        # goes out, returns which come in before that are lost
+        if not event.cpub:
+            event.connect_pub()
+        event.subscribe(data['jid'])
         # Send out the publication
         pub_data = self.pub(
                 data['tgt'],
@@ -735,16 +945,51 @@ class Syndic(salt.client.LocalClient, Minion):
                 data['jid'],
                 data['to']
                 )
-        # Gather the return data
-        ret = self.get_returns(
-                pub_data['jid'],
-                pub_data['minions'],
-                data['to']
-                )
-        ret['jid'] = data['jid']
-        ret['fun'] = data['fun']
-        # Return the publication data up the pipe
-        self._return_pub(ret, '_syndic_return')
+        if not pub_data or pub_data['jid'] == '0':
+            event.unsubscribe(data['jid'])
+            return
+        log.info('Forwarding the returns for job: {0}'.format(data['jid']))
+        minions = set(pub_data['minions'])
+        if minions:
+            self._forward_returns(data['jid'], {}, minions=minions)
+        batch_size = int(self.opts.get('syndic_batch_size', 50))
+        interval = float(self.opts.get('syndic_batch_interval', 0.5))
+        found = set()
+        batch = {}
+        outs = {}
+        announce = set()
+        # Wait for the timeout after the first return, as get_returns does
+        deadline = time.time() + data['to']
+        sent = time.time()
+        while minions.difference(found) and time.time() < deadline:
+            wait = min(deadline, sent + interval) - time.time()
+            for ret in event.get_events(
+                    batch_size,
+                    max(wait, 0),
+                    data['jid']):
+                if 'syndic' in ret:
+                    # A lower syndic announced its minions
+                    announce.update(set(ret['syndic']).difference(minions))
+                    minions.update(ret['syndic'])
+                    continue
+                if 'id' not in ret or 'return' not in ret:
+                    continue
+                if not found:
+                    deadline = time.time() + data['to']
+                found.add(ret['id'])
+                batch[ret['id']] = ret['return']
+                if 'out' in ret:
+                    outs[ret['id']] = ret['out']
+            if (batch or announce) and (len(batch) >= batch_size
+                    or time.time() - sent >= interval):
+                self._forward_returns(data['jid'], batch, outs, announce)
+                batch = {}
+                outs = {}
+                announce = set()
+                sent = time.time()
+        if batch or announce:
+            self._forward_returns(data['jid'], batch, outs, announce)
+        event.unsubscribe(data['jid'])
 
 
 class Matcher(object):
@@ -8,9 +8,19 @@ import logging
 
 # Import Salt libs
 import salt.utils
+import salt.utils.snapshot
 
 log = logging.getLogger(__name__)
 
+# The installed packages are read again when the dpkg status file changes,
+# the available versions also when the package lists are updated
+_INSTALLED = salt.utils.snapshot.snapshot(
+        'apt.installed',
+        ('/var/lib/dpkg/status',))
+_AVAILABLE = salt.utils.snapshot.snapshot(
+        'apt.available',
+        ('/var/lib/dpkg/status', '/var/lib/apt/lists'))
+
 __outputter__ = {
     'upgrade_available': 'txt',
     'available_version': 'txt',
@@ -51,6 +61,10 @@ def available_version(name):
 
         salt '*' pkg.available_version <package name>
     '''
+    cache = _AVAILABLE.get().setdefault('versions', {})
+    if name in cache:
+        return cache[name]
+
     version = ''
     cmd = 'apt-cache -q policy {0} | grep Candidate'.format(name)
 
@@ -61,6 +75,7 @@ def available_version(name):
     if len(version_list) >= 2:
         version = version_list[-1]
 
+    cache[name] = version
     return version
 
 
@@ -73,6 +88,12 @@ def version(name):
 
         salt '*' pkg.version <package name>
     '''
+    if not ':' in name:
+        # Look the name up in the list of all of the packages, which is read
+        # once for all of the packages of a state run
+        pkgs = list_pkgs()
+        if name in pkgs:
+            return pkgs[name]
     pkgs = list_pkgs(name)
     # check for ':arch' appended to pkg name (i.e. 32 bit installed on 64 bit
     # machine is ':i386')
@@ -99,6 +120,7 @@ def refresh_db():
     cmd = 'apt-get -q update'
 
     out = __salt__['cmd.run_stdout'](cmd)
+    _AVAILABLE.clear()
 
     servers = {}
     for line in out:
@@ -211,6 +233,7 @@ def install(name=None, refresh=False, repo='', skip_verify=False,
 
     old = list_pkgs()
     stderr = __salt__['cmd.run_all'](cmd).get('stderr', '')
+    _clear()
     if stderr:
         log.error(stderr)
     new = list_pkgs()
@@ -232,6 +255,7 @@ def remove(pkg):
 
     cmd = 'apt-get -q -y remove {0}'.format(pkg)
     __salt__['cmd.run'](cmd)
+    _clear()
     new_pkgs = list_pkgs()
     for pkg in old_pkgs:
         if pkg not in new_pkgs:
@@ -257,6 +281,7 @@ def purge(pkg):
     # Remove inital package
     purge_cmd = 'apt-get -q -y purge {0}'.format(pkg)
     __salt__['cmd.run'](purge_cmd)
+    _clear()
 
     new_pkgs = list_pkgs()
 
@@ -293,6 +318,7 @@ def upgrade(refresh=True, **kwargs):
     old_pkgs = list_pkgs()
     cmd = 'apt-get -q -y -o DPkg::Options::=--force-confold dist-upgrade'
     __salt__['cmd.run'](cmd)
+    _clear()
     new_pkgs = list_pkgs()
 
     for pkg in new_pkgs:
@@ -309,6 +335,14 @@ def upgrade(refresh=True, **kwargs):
     return ret_pkgs
 
 
+def _clear():
+    '''
+    Drop the package snapshots after packages were changed
+    '''
+    _INSTALLED.clear()
+    _AVAILABLE.clear()
+
+
 def list_pkgs(regex_string=''):
     '''
     List the packages currently installed in a dict::
@@ -325,6 +359,16 @@ def list_pkgs(regex_string=''):
         salt '*' pkg.list_pkgs
         salt '*' pkg.list_pkgs httpd
     '''
+    cache = _INSTALLED.get()
+    if not regex_string in cache:
+        cache[regex_string] = _list_pkgs(regex_string)
+    return dict(cache[regex_string])
+
+
+def _list_pkgs(regex_string):
+    '''
+    Query dpkg, and aptitude for virtual packages, for the installed packages
+    '''
     ret = {}
     cmd = (
         'dpkg-query --showformat=\'${{Status}} ${{Package}} ${{Version}}\n\' '
@@ -367,6 +411,10 @@ def _get_upgradable():
     { 'pkgname': '1.2.3-45', ... }
     '''
 
+    cache = _AVAILABLE.get()
+    if 'upgrades' in cache:
+        return dict(cache['upgrades'])
+
     cmd = 'apt-get --just-print dist-upgrade'
     out = __salt__['cmd.run_stdout'](cmd)
 
@@ -388,7 +436,8 @@ def _get_upgradable():
         version = _get(line, 'version')
         r[name] = version
 
-    return r
+    cache['upgrades'] = r
+    return dict(r)
 
 
 def list_upgrades():
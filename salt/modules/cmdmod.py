@@ -5,15 +5,24 @@ Keep in mind that this module is insecure, in that it can give whomever has
 access to the master root execution access to all salt minions
 '''
 # Import Python libs
+import collections
 import logging
 import os
+import Queue
+import select
 import shutil
+import signal
 import subprocess
 import sys
+import threading
+import time
 from functools import partial
 
 # Import Salt libs
+import salt.crypt
+import salt.payload
 import salt.utils
+import salt.utils.coprocess
 from salt.exceptions import CommandExecutionError
 from salt.grains.extra import shell as shell_grain
 
@@ -27,6 +36,8 @@ except ImportError:
 # Set up logging
 log = logging.getLogger(__name__)
 
+__opts__ = {}
+
 # Set up the default outputters
 __outputter__ = {
     'run': 'txt',
@@ -85,19 +96,198 @@ def _chugid(runas):
             )
 
 
-def _run(cmd,
-         cwd=None,
-         stdout=subprocess.PIPE,
-         stderr=subprocess.PIPE,
-         quiet=False,
-         runas=None,
-         with_env=True,
-         shell=DEFAULT_SHELL,
-         env=(),
-         rstrip=True,
-         retcode=False):
+def _setsid(runas):
     '''
-    Do the DRY thing and only call subprocess.Popen() once
+    Start a new process group for the command so that all of its processes
+    can be killed on timeout, then switch to the user
+    '''
+    os.setsid()
+    if runas:
+        _chugid(runas)
+
+
+class _Capture(object):
+    '''
+    Gather an output stream, when the limit is set only the head and the tail
+    of the stream are kept and the middle is dropped
+    '''
+    def __init__(self, limit=0):
+        self.limit = limit
+        self.head = []
+        self.head_size = 0
+        self.tail = collections.deque()
+        self.tail_size = 0
+        self.dropped = 0
+
+    def write(self, data):
+        '''
+        Add data from the stream
+        '''
+        if not self.limit:
+            self.head.append(data)
+            return
+        room = self.limit - self.limit // 2 - self.head_size
+        if room > 0:
+            self.head.append(data[:room])
+            self.head_size += len(self.head[-1])
+            data = data[room:]
+        if not data:
+            return
+        self.tail.append(data)
+        self.tail_size += len(data)
+        keep = self.limit // 2
+        while self.tail and self.tail_size - len(self.tail[0]) >= keep:
+            size = len(self.tail.popleft())
+            self.tail_size -= size
+            self.dropped += size
+        if self.tail_size > keep:
+            cut = self.tail_size - keep
+            self.tail[0] = self.tail[0][cut:]
+            self.tail_size -= cut
+            self.dropped += cut
+
+    def getvalue(self):
+        '''
+        Return the kept output
+        '''
+        data = ''.join(self.head)
+        if self.dropped:
+            data += '\n[... {0} bytes dropped ...]\n'.format(self.dropped)
+        return data + ''.join(self.tail)
+
+
+class _OutputEvents(object):
+    '''
+    Send the cmd_output events of a command to the master from a thread, so
+    that a slow master does not hold up the reading of the output or the
+    timeout of the command. The events of the command share one
+    authenticated connection to the master.
+    '''
+    def __init__(self, opts):
+        self.opts = opts
+        self.queue = Queue.Queue(100)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def fire(self, cmd, proc, pending):
+        '''
+        Queue the output gathered since the last event
+        '''
+        data = {'cmd': cmd, 'pid': proc.pid}
+        for name in pending:
+            data[name] = ''.join(pending[name])
+            pending[name] = []
+        try:
+            self.queue.put_nowait(data)
+        except Queue.Full:
+            log.debug('Dropped the output event of {0!r}'.format(cmd))
+
+    def close(self, wait):
+        '''
+        Let the queued events go out for at most wait seconds
+        '''
+        try:
+            self.queue.put(None, True, wait)
+        except Queue.Full:
+            return
+        self.thread.join(wait)
+
+    def _run(self):
+        auth = sreq = None
+        while True:
+            data = self.queue.get()
+            if data is None:
+                return
+            load = {'id': self.opts['id'],
+                    'tag': 'cmd_output',
+                    'data': data,
+                    'cmd': '_minion_event'}
+            try:
+                if sreq is None:
+                    auth = salt.crypt.SAuth(self.opts)
+                    sreq = salt.payload.SREQ(self.opts['master_uri'])
+                sreq.send('aes', auth.crypticle.dumps(load), cmd=load['cmd'])
+            except Exception as exc:
+                log.debug('Failed to send an output event: {0}'.format(exc))
+                # A req socket which did not get its reply can not send again
+                sreq = None
+
+
+def _stream(cmd, proc, timeout, limit, events):
+    '''
+    Read the output of the process as it comes with bounded memory. The
+    process group is killed when the timeout is hit. Returns the stdout, the
+    stderr and True if the command timed out.
+    '''
+    deadline = time.time() + timeout if timeout else None
+    interval = __opts__.get('cmd_output_event_interval', 1)
+    next_event = time.time() + interval
+    sender = _OutputEvents(__opts__) if events else None
+    streams = {}
+    for name in ('stdout', 'stderr'):
+        pipe = getattr(proc, name)
+        if pipe is not None:
+            streams[pipe.fileno()] = (name, _Capture(limit))
+    pending = dict((name, []) for name, capture in streams.values())
+    fds = list(streams)
+    timed_out = False
+    while True:
+        wait = None
+        if deadline:
+            wait = deadline - time.time()
+            if wait <= 0:
+                timed_out = True
+                break
+        if events:
+            wait = min(wait, interval) if wait else interval
+        if not fds:
+            # Only the exit of the process is left to wait for
+            if proc.poll() is not None:
+                break
+            time.sleep(min(wait, 0.1) if wait else 0.1)
+            continue
+        for fd in select.select(fds, [], [], wait)[0]:
+            data = os.read(fd, 65536)
+            if not data:
+                fds.remove(fd)
+                continue
+            name, capture = streams[fd]
+            capture.write(data)
+            if events:
+                pending[name].append(data)
+                if limit and sum(len(x) for x in pending[name]) > limit:
+                    pending[name] = [''.join(pending[name])[-limit:]]
+        if not fds and deadline is None and not events:
+            proc.wait()
+            break
+        if events and time.time() >= next_event:
+            next_event = time.time() + interval
+            if any(pending.values()):
+                sender.fire(cmd, proc, pending)
+    if timed_out:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        proc.wait()
+    if events:
+        if any(pending.values()):
+            sender.fire(cmd, proc, pending)
+        sender.close(interval)
+    out = err = None
+    for name, capture in streams.values():
+        if name == 'stdout':
+            out = capture.getvalue()
+        else:
+            err = capture.getvalue()
+    return out, err, timed_out
+
+
+def _check_run(cwd, runas, shell):
+    '''
+    Check that the command can be run as the user with the shell and return
+    the working directory
     '''
     # Set the default working directory to the home directory
     # of the user salt-minion is running as.  Default:  /root
@@ -121,8 +311,6 @@ def _run(cmd,
         'Windows',
     ]
 
-    ret = {}
-
     if runas and __grains__['os'] in disable_runas:
         msg = 'Sorry, {0} does not support runas functionality'
         raise CommandExecutionError(msg.format(__grains__['os']))
@@ -134,6 +322,100 @@ def _run(cmd,
         except KeyError:
             msg = 'User \'{0}\' is not available'.format(runas)
             raise CommandExecutionError(msg)
+    return cwd
+
+
+def _run_coprocess(cmd, cwd, merge, quiet, runas, shell, env, rstrip,
+                   retcode):
+    '''
+    Run the command in the persistent shell of the user, shell and working
+    directory, the shell is started on the first call. Returns None if the
+    shell cannot take the command, the command is then run in a new shell.
+    '''
+    key = (runas, shell, cwd, os.getegid())
+    worker = salt.utils.coprocess.get_worker(key)
+    if worker is None:
+        run_cwd = _check_run(cwd, runas, shell)
+        owner = None
+        if runas:
+            uinfo = pwd.getpwnam(runas)
+            owner = (uinfo.pw_uid, uinfo.pw_gid)
+        try:
+            worker = salt.utils.coprocess.start_worker(
+                    key,
+                    shell,
+                    run_cwd,
+                    partial(_chugid, runas) if runas else None,
+                    owner)
+        except OSError, err:
+            log.debug('Failed to start the shell {0}: {1}'.format(shell, err))
+            return None
+
+    if not quiet:
+        log.info(
+            'Executing command {0!r} {1}in directory {2!r}'.format(
+                cmd, 'as user {0!r} '.format(runas) if runas else '',
+                worker.cwd
+            )
+        )
+
+    try:
+        res = worker.run(cmd, env, merge)
+    except salt.utils.coprocess.WorkerError, err:
+        raise CommandExecutionError(str(err))
+    if res is None:
+        return None
+    out, err, rcode = res
+    if retcode:
+        # The output is not gathered when only the return code is wanted
+        out, err = None, None
+    elif merge:
+        err = None
+    if rstrip:
+        if out is not None:
+            out = out.rstrip()
+        if err is not None:
+            err = err.rstrip()
+    return {'stdout': out,
+            'stderr': err,
+            'pid': worker.proc.pid,
+            'retcode': rcode}
+
+
+def _run(cmd,
+         cwd=None,
+         stdout=subprocess.PIPE,
+         stderr=subprocess.PIPE,
+         quiet=False,
+         runas=None,
+         with_env=True,
+         shell=DEFAULT_SHELL,
+         env=(),
+         rstrip=True,
+         retcode=False,
+         timeout=None):
+    '''
+    Do the DRY thing and only call subprocess.Popen() once
+    '''
+    if timeout is None:
+        timeout = __opts__.get('cmd_timeout', 0)
+    limit = __opts__.get('cmd_output_limit', 0)
+    events = __opts__.get('cmd_output_events', False)
+    streaming = (bool(timeout or limit or events)
+                 and not sys.platform.startswith('win'))
+
+    if (not streaming
+            and __opts__.get('cmd_coprocess', False)
+            and not sys.platform.startswith('win')
+            and stdout == subprocess.PIPE
+            and stderr in (subprocess.PIPE, subprocess.STDOUT)):
+        ret = _run_coprocess(cmd, cwd, stderr == subprocess.STDOUT, quiet,
+                             runas, shell, env, rstrip, retcode)
+        if ret is not None:
+            return ret
+
+    cwd = _check_run(cwd, runas, shell)
+    ret = {}
 
     if not quiet:
         # Put the most common case first
@@ -143,7 +425,7 @@ def _run(cmd,
             )
         )
 
-    run_env = os.environ
+    run_env = os.environ.copy()
     run_env.update(env)
     kwargs = {'cwd': cwd,
               'shell': True,
@@ -151,7 +433,9 @@ def _run(cmd,
               'stdout': stdout,
               'stderr': stderr}
 
-    if runas:
+    if streaming:
+        kwargs['preexec_fn'] = partial(_setsid, runas)
+    elif runas:
         kwargs['preexec_fn'] = partial(_chugid, runas)
 
     if not sys.platform.startswith('win'):
@@ -167,7 +451,18 @@ def _run(cmd,
 
     # This is where the magic happens
     proc = subprocess.Popen(cmd, **kwargs)
-    out, err = proc.communicate()
+    if streaming:
+        out, err, timed_out = _stream(cmd, proc, timeout, limit, events)
+        if timed_out:
+            msg = 'Command {0!r} timed out after {1} seconds'.format(
+                    cmd, timeout)
+            log.error(msg)
+            if err is not None:
+                err += '\n' + msg
+            elif out is not None:
+                out += '\n' + msg
+    else:
+        out, err = proc.communicate()
 
     if rstrip:
         if out is not None:
@@ -199,21 +494,28 @@ def _run_all_quiet(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=()):
     return _run(cmd, runas=runas, cwd=cwd, shell=shell, env=env, quiet=True)
 
 
-def run(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=()):
+def run(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=(),
+        timeout=None):
     '''
     Execute the passed command and return the output as a string
 
+    The command and all of its processes are killed after timeout seconds,
+    the cmd_timeout minion option sets the default timeout
+
     CLI Example::
 
         salt '*' cmd.run "ls -l | awk '/foo/{print $2}'"
+        salt '*' cmd.run "make test" timeout=600
     '''
     out = _run(cmd, runas=runas, shell=shell,
-               cwd=cwd, stderr=subprocess.STDOUT, env=env)['stdout']
+               cwd=cwd, stderr=subprocess.STDOUT, env=env,
+               timeout=timeout)['stdout']
     log.debug('output: {0}'.format(out))
     return out
 
 
-def run_stdout(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=()):
+def run_stdout(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=(),
+               timeout=None):
     '''
     Execute a command, and only return the standard out
 
@@ -221,12 +523,14 @@ def run_stdout(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=()):
 
         salt '*' cmd.run_stdout "ls -l | awk '/foo/{print $2}'"
     '''
-    stdout = _run(cmd, runas=runas, cwd=cwd, shell=shell, env=())["stdout"]
+    stdout = _run(cmd, runas=runas, cwd=cwd, shell=shell, env=env,
+                  timeout=timeout)["stdout"]
     log.debug('stdout: {0}'.format(stdout))
     return stdout
 
 
-def run_stderr(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=()):
+def run_stderr(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=(),
+               timeout=None):
     '''
     Execute a command and only return the standard error
 
@@ -234,12 +538,14 @@ def run_stderr(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=()):
 
         salt '*' cmd.run_stderr "ls -l | awk '/foo/{print $2}'"
     '''
-    stderr = _run(cmd, runas=runas, cwd=cwd, shell=shell, env=env)["stderr"]
+    stderr = _run(cmd, runas=runas, cwd=cwd, shell=shell, env=env,
+                  timeout=timeout)["stderr"]
     log.debug('stderr: {0}'.format(stderr))
     return stderr
 
 
-def run_all(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=()):
+def run_all(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=(),
+            timeout=None):
     '''
     Execute the passed command and return a dict of return data
 
@@ -247,7 +553,8 @@ def run_all(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=()):
 
         salt '*' cmd.run_all "ls -l | awk '/foo/{print $2}'"
     '''
-    ret = _run(cmd, runas=runas, cwd=cwd, shell=shell, env=env)
+    ret = _run(cmd, runas=runas, cwd=cwd, shell=shell, env=env,
+               timeout=timeout)
 
     if ret['retcode'] != 0:
         rcode = ret['retcode']
@@ -267,7 +574,8 @@ def run_all(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=()):
     return ret
 
 
-def retcode(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=()):
+def retcode(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=(),
+            timeout=None):
     '''
     Execute a shell command and return the command's return code.
 
@@ -281,7 +589,8 @@ def retcode(cmd, cwd=None, runas=None, shell=DEFAULT_SHELL, env=()):
             cwd=cwd,
             shell=shell,
             env=env,
-            retcode=True
+            retcode=True,
+            timeout=timeout
             )['retcode']
 
 
@@ -325,6 +634,7 @@ def script(
             runas=runas,
             shell=shell,
             retcode=kwargs.get('retcode', False),
+            timeout=kwargs.get('timeout'),
             )
     os.remove(path)
     return ret
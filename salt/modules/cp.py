@@ -202,6 +202,21 @@ def cache_dir(path, env='base', include_empty=False):
     return client.cache_dir(path, env, include_empty)
 
 
+def sync_dir(path, env='base', include_empty=False):
+    '''
+    Cache everything under a directory from the master like cache_dir and
+    return the hash type and the hashes on the master of the cached files.
+    Only the files which changed since the last sync are fetched, an empty
+    dict is returned if the master does not serve file manifests
+
+    CLI Example::
+
+        salt '*' cp.sync_dir salt://path/to/dir
+    '''
+    client = salt.fileclient.get_file_client(__opts__)
+    return client.sync_dir(path, env, include_empty)
+
+
 def cache_master(env='base'):
     '''
     Retrieve all of the files on the master and cache them locally
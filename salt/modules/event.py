@@ -21,7 +21,7 @@ def fire_master(data, tag):
     auth = salt.crypt.SAuth(__opts__)
     sreq = salt.payload.SREQ(__opts__['master_uri'])
     try:
-        sreq.send('aes', auth.crypticle.dumps(load))
+        sreq.send('aes', auth.crypticle.dumps(load), cmd=load['cmd'])
     except:
         pass
     return True
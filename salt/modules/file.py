@@ -16,7 +16,6 @@ import stat
 import tempfile
 import sys
 import getpass
-import hashlib
 import difflib
 import fnmatch
 import errno
@@ -29,6 +28,7 @@ except ImportError:
 # Import salt libs
 import salt.utils
 import salt.utils.find
+import salt.utils.hashcache
 from salt.utils.filebuffer import BufferedReader
 from salt.exceptions import CommandExecutionError, SaltInvocationError
 from salt._compat import string_types, urlparse
@@ -275,6 +275,13 @@ def chgrp(path, group):
     return chown(path, user, group)
 
 
+def _hash(path, form):
+    '''
+    Return the hash of a file from the hash cache of the minion
+    '''
+    return salt.utils.hashcache.get_cache(__opts__).get_hash(path, form)
+
+
 def get_sum(path, form='md5'):
     '''
     Return the sum for the given file, default is md5, sha1, sha224, sha256,
@@ -286,9 +293,10 @@ def get_sum(path, form='md5'):
     '''
     if not os.path.isfile(path):
         return 'File not found'
+    if form not in salt.utils.HASH_TYPES:
+        return 'Hash {0} not supported'.format(form)
     try:
-        with salt.utils.fopen(path, 'rb') as f:
-            return getattr(hashlib, form)(f.read()).hexdigest()
+        return _hash(path, form)
     except (IOError, OSError) as e:
         return 'File Error: {0}'.format(e)
     except AttributeError as e:
@@ -309,17 +317,9 @@ def get_hash(path, form='md5', chunk_size=4096):
             ``get_sum`` cannot really be trusted since it is vulnerable to
             collisions: ``get_sum(..., 'xyz') == 'Hash xyz not supported'``
     '''
-    try:
-        hash_type = getattr(hashlib, form)
-    except AttributeError:
+    if form not in salt.utils.HASH_TYPES:
         raise ValueError('Invalid hash type: {0}'.format(form))
-    with salt.utils.fopen(path, 'rb') as f:
-        hash_obj = hash_type()
-        while True:
-            chunk = f.read(chunk_size)
-            if not chunk:
-                return hash_obj.hexdigest()
-            hash_obj.update(chunk)
+    return _hash(path, form)
 
 
 def check_hash(path, hash):
@@ -434,7 +434,8 @@ def find(path, **kwargs):
         salt '*' file.find /var/log name=\*.[0-9] mtime=+30d size=+10m delete
     '''
     try:
-        f = salt.utils.find.Finder(kwargs)
+        f = salt.utils.find.Finder(
+                kwargs, __opts__.get('find_threads', 4))
     except ValueError as ex:
         return 'error: {0}'.format(ex)
 
@@ -976,9 +977,9 @@ def get_managed(
 
         if data['result']:
             sfn = data['data']
-            hsum = ''
-            with salt.utils.fopen(sfn, 'r') as source:
-                hsum = hashlib.md5(source.read()).hexdigest()
+            # The rendered template is a new file, there is no point in
+            # caching its hash
+            hsum = salt.utils.get_hash(sfn, 'md5')
             source_sum = {'hash_type': 'md5',
                           'hsum': hsum}
         else:
@@ -1228,10 +1229,7 @@ def manage_file(name,
     if os.path.isfile(name):
         # Only test the checksums on files with managed contents
         if source:
-            name_sum = ''
-            hash_func = getattr(hashlib, source_sum['hash_type'])
-            with salt.utils.fopen(name, 'rb') as namefile:
-                name_sum = hash_func(namefile.read()).hexdigest()
+            name_sum = _hash(name, source_sum['hash_type'])
 
         # Check if file needs to be replaced
         if source and source_sum['hsum'] != name_sum:
@@ -1243,8 +1241,7 @@ def manage_file(name,
             # If the downloaded file came from a non salt server source verify
             # that it matches the intended sum value
             if urlparse(source).scheme != 'salt':
-                with salt.utils.fopen(sfn, 'rb') as dlfile:
-                    dl_sum = hash_func(dlfile.read()).hexdigest()
+                dl_sum = _hash(sfn, source_sum['hash_type'])
                 if dl_sum != source_sum['hsum']:
                     ret['comment'] = ('File sum set for file {0} of {1} does '
                                       'not match real sum of {2}'
@@ -1303,9 +1300,7 @@ def manage_file(name,
             # If the downloaded file came from a non salt server source verify
             # that it matches the intended sum value
             if urlparse(source).scheme != 'salt':
-                hash_func = getattr(hashlib, source_sum['hash_type'])
-                with salt.utils.fopen(sfn, 'rb') as dlfile:
-                    dl_sum = hash_func(dlfile.read()).hexdigest()
+                dl_sum = _hash(sfn, source_sum['hash_type'])
                 if dl_sum != source_sum['hsum']:
                     ret['comment'] = ('File sum set for file {0} of {1} does '
                                       'not match real sum of {2}'
@@ -1374,10 +1369,7 @@ def manage_file(name,
     if os.path.isfile(name):
         # Only test the checksums on files with managed contents
         if source:
-            name_sum = ''
-            hash_func = getattr(hashlib, source_sum['hash_type'])
-            with salt.utils.fopen(name, 'rb') as namefile:
-                name_sum = hash_func(namefile.read()).hexdigest()
+            name_sum = _hash(name, source_sum['hash_type'])
 
         # Check if file needs to be replaced
         if source and source_sum['hsum'] != name_sum:
@@ -1389,8 +1381,7 @@ def manage_file(name,
             # If the downloaded file came from a non salt server source verify
             # that it matches the intended sum value
             if urlparse(source).scheme != 'salt':
-                with salt.utils.fopen(sfn, 'rb') as dlfile:
-                    dl_sum = hash_func(dlfile.read()).hexdigest()
+                dl_sum = _hash(sfn, source_sum['hash_type'])
                 if dl_sum != source_sum['hsum']:
                     ret['comment'] = ('File sum set for file {0} of {1} does '
                                       'not match real sum of {2}'
@@ -1449,9 +1440,7 @@ def manage_file(name,
             # If the downloaded file came from a non salt server source verify
             # that it matches the intended sum value
             if urlparse(source).scheme != 'salt':
-                hash_func = getattr(hashlib, source_sum['hash_type'])
-                with salt.utils.fopen(sfn, 'rb') as dlfile:
-                    dl_sum = hash_func(dlfile.read()).hexdigest()
+                dl_sum = _hash(sfn, source_sum['hash_type'])
                 if dl_sum != source_sum['hsum']:
                     ret['comment'] = ('File sum set for file {0} of {1} does '
                                       'not match real sum of {2}'
@@ -55,7 +55,7 @@ def _publish(
             'form': form,
             'id': __opts__['id']}
     return auth.crypticle.loads(
-            sreq.send('aes', auth.crypticle.dumps(load), 1))
+            sreq.send('aes', auth.crypticle.dumps(load), 1, cmd=load['cmd']))
 
 def normalize_arg(arg):
     if not arg:
@@ -125,4 +125,4 @@ def runner(fun, arg=None):
             'tok': tok,
             'id': __opts__['id']}
     return auth.crypticle.loads(
-            sreq.send('aes', auth.crypticle.dumps(load), 1))
+            sreq.send('aes', auth.crypticle.dumps(load), 1, cmd=load['cmd']))
@@ -7,7 +7,6 @@ is used to manage minion modules as well as automate updates to the salt minion
 
 # Import Python libs
 import os
-import hashlib
 import shutil
 import signal
 import logging
@@ -15,8 +14,10 @@ import fnmatch
 import sys
 
 # Import Salt libs
+import salt.minion
 import salt.payload
 import salt.state
+import salt.utils
 from salt._compat import string_types
 
 # Import esky for update functionality
@@ -79,15 +80,16 @@ def _sync(form, env=None):
                 remote.add(relpath)
                 dest = os.path.join(mod_dir, relpath)
             log.info('Copying \'{0}\' to \'{1}\''.format(fn_, dest))
+            src_stat = os.stat(fn_)
             if os.path.isfile(dest):
-                # The file is present, if the sum differs replace it
-                srch = hashlib.md5(
-                    salt.utils.fopen(fn_, 'r').read()
-                ).hexdigest()
-                dsth = hashlib.md5(
-                    salt.utils.fopen(dest, 'r').read()
-                ).hexdigest()
-                if srch != dsth:
+                # The file is present, the copy keeps the mtime of the cached
+                # file so the sums only need to be compared when the size or
+                # mtime differ
+                dst_stat = os.stat(dest)
+                if (src_stat.st_size == dst_stat.st_size and
+                        src_stat.st_mtime == dst_stat.st_mtime):
+                    continue
+                if salt.utils.get_hash(fn_) != salt.utils.get_hash(dest):
                     # The downloaded file differes, replace!
                     shutil.copyfile(fn_, dest)
                     ret.append('{0}.{1}'.format(form, relname))
@@ -97,6 +99,7 @@ def _sync(form, env=None):
                     os.makedirs(dest_dir)
                 shutil.copyfile(fn_, dest)
                 ret.append('{0}.{1}'.format(form, relname))
+            os.utime(dest, (src_stat.st_atime, src_stat.st_mtime))
 
     touched = bool(ret)
     if __opts__.get('clean_dynamic_modules', True):
@@ -303,18 +306,14 @@ def is_running(fun):
     return ret
 
 
-def running():
+def _read_proc_dir():
     '''
-    Return the data on all running salt processes on the minion
-
-    CLI Example::
-
-        salt '*' saltutil.running
+    Return the running jobs recorded in the proc directory, this is used when
+    the minion daemon job registry cannot be reached
     '''
     procs = __salt__['status.procs']()
     ret = []
     serial = salt.payload.Serial(__opts__)
-    pid = os.getpid()
     proc_dir = os.path.join(__opts__['cachedir'], 'proc')
     if not os.path.isdir(proc_dir):
         return []
@@ -330,12 +329,25 @@ def running():
             # continue
             os.remove(path)
             continue
-        if data.get('pid') == pid:
-            continue
         ret.append(data)
     return ret
 
 
+def running():
+    '''
+    Return the data on all running salt processes on the minion
+
+    CLI Example::
+
+        salt '*' saltutil.running
+    '''
+    jobs = salt.minion.query_job_registry(__opts__, {'cmd': 'running'})
+    if jobs is None:
+        jobs = _read_proc_dir()
+    pid = os.getpid()
+    return [data for data in jobs if data.get('pid') != pid]
+
+
 def find_job(jid):
     '''
     Return the data for a specific job id
@@ -344,7 +356,13 @@ def find_job(jid):
 
         salt '*' saltutil.find_job <job id>
     '''
-    for data in running():
+    data = salt.minion.query_job_registry(
+            __opts__,
+            {'cmd': 'find', 'jid': jid}
+            )
+    if data is not None:
+        return data
+    for data in _read_proc_dir():
         if data['jid'] == jid:
             return data
     return {}
@@ -358,22 +376,22 @@ def signal_job(jid, sig):
 
         salt '*' saltutil.signal_job <job id> 15
     '''
-    for data in running():
-        if data['jid'] == jid:
-            try:
-                os.kill(int(data['pid']), sig)
-                return 'Signal {0} sent to job {1} at pid {2}'.format(
-                        int(sig),
-                        jid,
-                        data['pid']
-                        )
-            except OSError:
-                path = os.path.join(__opts__['cachedir'], 'proc', str(jid))
-                if os.path.isfile(path):
-                    os.remove(path)
-                return ('Job {0} was not running and job data has been '
-                        ' cleaned up').format(jid)
-    return ''
+    data = find_job(jid)
+    if not data:
+        return ''
+    try:
+        os.kill(int(data['pid']), sig)
+        return 'Signal {0} sent to job {1} at pid {2}'.format(
+                int(sig),
+                jid,
+                data['pid']
+                )
+    except OSError:
+        path = os.path.join(__opts__['cachedir'], 'proc', str(jid))
+        if os.path.isfile(path):
+            os.remove(path)
+        return ('Job {0} was not running and job data has been '
+                ' cleaned up').format(jid)
 
 
 def term_job(jid):
@@ -134,6 +134,14 @@ def highstate(test=None, **kwargs):
 
     st_ = salt.state.HighState(opts)
     ret = st_.call_highstate()
+    if st_.cache_hit:
+        log.info('state.highstate used the compiled state cache')
+        # Flag the returns of the states run from the cached chunks, like
+        # __run_num__ the key is carried in the return of each state
+        if isinstance(ret, dict):
+            for data in ret.values():
+                if isinstance(data, dict):
+                    data['__cache_hit__'] = True
     serial = salt.payload.Serial(__opts__)
     cache_file = os.path.join(__opts__['cachedir'], 'highstate.p')
 
@@ -226,7 +234,13 @@ def show_lowstate():
         salt '*' state.show_lowstate
     '''
     st_ = salt.state.HighState(__opts__)
-    return st_.compile_low_chunks()
+    ret = st_.compile_low_chunks()
+    if st_.cache_hit:
+        log.info('state.show_lowstate used the compiled state cache')
+        for chunk in ret:
+            if isinstance(chunk, dict):
+                chunk['__cache_hit__'] = True
+    return ret
 
 
 def show_sls(mods, env='base', test=None, **kwargs):
@@ -5,10 +5,28 @@ Provide the service module for systemd
 import re
 # Import Salt libs
 import salt.utils
+import salt.utils.snapshot
 
 LOCAL_CONFIG_PATH = '/etc/systemd/system'
 VALID_UNIT_TYPES = ['service','socket', 'device', 'mount', 'automount',
                     'swap', 'target', 'path', 'timer']
+# The unit file states for which systemctl is-enabled returns 0
+ENABLED_STATES = ('enabled', 'enabled-runtime', 'static', 'indirect',
+                  'generated', 'alias', 'transient')
+# The active states for which systemctl is-active returns 0
+ACTIVE_STATES = ('active', 'reloading')
+
+# The unit files and the states of the units are read with one systemctl call
+# each, they are read again when a unit directory changes, when this module
+# starts, stops, enables or disables a unit, or after ten seconds
+_UNIT_FILES = salt.utils.snapshot.snapshot(
+        'systemd.unit_files',
+        (LOCAL_CONFIG_PATH,
+         '/run/systemd/system',
+         '/lib/systemd/system',
+         '/usr/lib/systemd/system'),
+        10)
+_UNITS = salt.utils.snapshot.snapshot('systemd.units', (), 10)
 
 def __virtual__():
     '''
@@ -49,14 +67,50 @@ def _systemctl_cmd(action, name):
     '''
     return 'systemctl {0} {1}'.format(action, _canonical_unit_name(name))
 
+
+def _clear():
+    '''
+    Drop the unit snapshots after a unit was changed
+    '''
+    _UNIT_FILES.clear()
+    _UNITS.clear()
+
+
+def _get_all_units():
+    '''
+    Get the active state of all of the units systemd has loaded, by
+    canonical unit name.
+    '''
+    cache = _UNITS.get()
+    if 'units' in cache:
+        return cache['units']
+    # Failed units can be marked with a leading symbol
+    rexp = re.compile('(?m)^[^\w@-]*(?P<name>\S+\.(?:' +
+                      '|'.join(VALID_UNIT_TYPES) +
+                      '))\s+\S+\s+(?P<active>\S+)')
+
+    out = __salt__['cmd.run_stdout'](
+            'systemctl --full --all list-units | col -b'
+    )
+
+    ret = {}
+    for match in rexp.finditer(out):
+        ret[match.group('name')] = match.group('active')
+    cache['units'] = ret
+    return ret
+
+
 def _get_all_unit_files():
     '''
     Get all unit files and their state. Unit files ending in .service
     are normalized so that they can be referenced without a type suffix.
     '''
-    rexp = re.compile('(?m)^(?P<name>.+)\.(?P<type>' +
+    cache = _UNIT_FILES.get()
+    if 'unit_files' in cache:
+        return cache['unit_files']
+    rexp = re.compile('(?m)^(?P<name>\S+)\.(?P<type>' +
                       '|'.join(VALID_UNIT_TYPES) +
-                      ')\s+(?P<state>.+)$')
+                      ')\s+(?P<state>\S+)')
 
     out = __salt__['cmd.run_stdout'](
             'systemctl --full list-unit-files | col -b'
@@ -68,6 +122,7 @@ def _get_all_unit_files():
         if match.group('type') != 'service':
             name += '.' + match.group('type')
         ret[name] = match.group('state')
+    cache['unit_files'] = ret
     return ret
 
 
@@ -128,7 +183,9 @@ def start(name):
 
         salt '*' service.start <service name>
     '''
-    return not __salt__['cmd.retcode'](_systemctl_cmd('start', name))
+    ret = not __salt__['cmd.retcode'](_systemctl_cmd('start', name))
+    _clear()
+    return ret
 
 
 def stop(name):
@@ -139,7 +196,9 @@ def stop(name):
 
         salt '*' service.stop <service name>
     '''
-    return not __salt__['cmd.retcode'](_systemctl_cmd('stop', name))
+    ret = not __salt__['cmd.retcode'](_systemctl_cmd('stop', name))
+    _clear()
+    return ret
 
 
 def restart(name):
@@ -152,7 +211,9 @@ def restart(name):
     '''
     if name == 'salt-minion':
         salt.utils.daemonize_if(__opts__)
-    return not __salt__['cmd.retcode'](_systemctl_cmd('restart', name))
+    ret = not __salt__['cmd.retcode'](_systemctl_cmd('restart', name))
+    _clear()
+    return ret
 
 
 def reload(name):
@@ -163,7 +224,9 @@ def reload(name):
 
         salt '*' service.reload <service name>
     '''
-    return not __salt__['cmd.retcode'](_systemctl_cmd('reload', name))
+    ret = not __salt__['cmd.retcode'](_systemctl_cmd('reload', name))
+    _clear()
+    return ret
 
 
 # The unused sig argument is required to maintain consistency in the state
@@ -177,6 +240,9 @@ def status(name, sig=None):
 
         salt '*' service.status <service name>
     '''
+    units = _get_all_units()
+    if _canonical_unit_name(name) in units:
+        return units[_canonical_unit_name(name)] in ACTIVE_STATES
     cmd = 'systemctl is-active {0}'.format(_canonical_unit_name(name))
     return not __salt__['cmd.retcode'](cmd)
 
@@ -189,7 +255,9 @@ def enable(name, **kwargs):
 
         salt '*' service.enable <service name>
     '''
-    return not __salt__['cmd.retcode'](_systemctl_cmd('enable', name))
+    ret = not __salt__['cmd.retcode'](_systemctl_cmd('enable', name))
+    _clear()
+    return ret
 
 
 def disable(name, **kwargs):
@@ -200,7 +268,9 @@ def disable(name, **kwargs):
 
         salt '*' service.disable <service name>
     '''
-    return not __salt__['cmd.retcode'](_systemctl_cmd('disable', name))
+    ret = not __salt__['cmd.retcode'](_systemctl_cmd('disable', name))
+    _clear()
+    return ret
 
 
 def _templated_instance_enabled(name):
@@ -217,6 +287,10 @@ def _templated_instance_enabled(name):
 
 
 def _enabled(name):
+    unit_files = _get_all_unit_files()
+    key = name[:-8] if name.endswith('.service') else name
+    if key in unit_files and '@' not in name:
+        return unit_files[key] in ENABLED_STATES
     is_enabled = not bool(__salt__['cmd.retcode'](_systemctl_cmd('is-enabled', name)))
     return is_enabled or _templated_instance_enabled(name)
 
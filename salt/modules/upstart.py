@@ -38,6 +38,15 @@ import os
 
 # Import salt libs
 import salt.utils
+import salt.utils.snapshot
+
+# The runlevel, the service lists and the job states are read once, they are
+# read again when the init directories change, when this module changes a
+# service, or after ten seconds
+_SERVICES = salt.utils.snapshot.snapshot(
+        'upstart.services',
+        ['/etc/init', '/etc/init.d'] + sorted(glob.glob('/etc/rc?.d')),
+        10)
 
 
 def __virtual__():
@@ -112,12 +121,42 @@ def _runlevel():
     '''
     Return the current runlevel
     '''
+    cache = _SERVICES.get()
+    if 'runlevel' in cache:
+        return cache['runlevel']
     out = __salt__['cmd.run']('runlevel {0}'.format(_find_utmp()))
     try:
-        return out.split()[1]
+        cache['runlevel'] = out.split()[1]
     except IndexError:
         # The runlevel is unknown, return the default
-        return _default_runlevel()
+        cache['runlevel'] = _default_runlevel()
+    return cache['runlevel']
+
+
+def _clear():
+    '''
+    Drop the service snapshot after a service was changed
+    '''
+    _SERVICES.clear()
+
+
+def _upstart_jobs():
+    '''
+    Return a dict of the upstart jobs and whether they are running, from a
+    single call to initctl
+    '''
+    cache = _SERVICES.get()
+    if 'jobs' in cache:
+        return cache['jobs']
+    ret = {}
+    for line in __salt__['cmd.run']('initctl list').splitlines():
+        comps = line.split()
+        if len(comps) < 2 or comps[1].startswith('('):
+            # The instances of a job are left to the service command
+            continue
+        ret[comps[0]] = 'start/running' in line
+    cache['jobs'] = ret
+    return ret
 
 
 def _is_symlink(name):
@@ -206,6 +245,9 @@ def get_enabled():
 
         salt '*' service.get_enabled
     '''
+    cache = _SERVICES.get()
+    if 'enabled' in cache:
+        return list(cache['enabled'])
     ret = set()
     for name in _iter_service_names():
         if _service_is_upstart(name):
@@ -215,7 +257,8 @@ def get_enabled():
             if _service_is_sysv(name):
                 if _sysv_is_enabled(name):
                     ret.add(name)
-    return sorted(ret)
+    cache['enabled'] = sorted(ret)
+    return list(cache['enabled'])
 
 
 def get_disabled():
@@ -226,6 +269,9 @@ def get_disabled():
 
         salt '*' service.get_disabled
     '''
+    cache = _SERVICES.get()
+    if 'disabled' in cache:
+        return list(cache['disabled'])
     ret = set()
     for name in _iter_service_names():
         if _service_is_upstart(name):
@@ -235,7 +281,8 @@ def get_disabled():
             if _service_is_sysv(name):
                 if _sysv_is_disabled(name):
                     ret.add(name)
-    return sorted(ret)
+    cache['disabled'] = sorted(ret)
+    return list(cache['disabled'])
 
 
 def get_all():
@@ -258,7 +305,9 @@ def start(name):
         salt '*' service.start <service name>
     '''
     cmd = 'service {0} start'.format(name)
-    return not __salt__['cmd.retcode'](cmd)
+    ret = not __salt__['cmd.retcode'](cmd)
+    _clear()
+    return ret
 
 
 def stop(name):
@@ -270,7 +319,9 @@ def stop(name):
         salt '*' service.stop <service name>
     '''
     cmd = 'service {0} stop'.format(name)
-    return not __salt__['cmd.retcode'](cmd)
+    ret = not __salt__['cmd.retcode'](cmd)
+    _clear()
+    return ret
 
 
 def restart(name):
@@ -284,7 +335,9 @@ def restart(name):
     if name == 'salt-minion':
         salt.utils.daemonize_if(__opts__)
     cmd = 'service {0} restart'.format(name)
-    return not __salt__['cmd.retcode'](cmd)
+    ret = not __salt__['cmd.retcode'](cmd)
+    _clear()
+    return ret
 
 
 def full_restart(name):
@@ -298,7 +351,9 @@ def full_restart(name):
     if name == 'salt-minion':
         salt.utils.daemonize_if(__opts__)
     cmd = 'service {0} --full-restart'.format(name)
-    return not __salt__['cmd.retcode'](cmd)
+    ret = not __salt__['cmd.retcode'](cmd)
+    _clear()
+    return ret
 
 
 def reload(name):
@@ -310,7 +365,9 @@ def reload(name):
         salt '*' service.reload <service name>
     '''
     cmd = 'service {0} reload'.format(name)
-    return not __salt__['cmd.retcode'](cmd)
+    ret = not __salt__['cmd.retcode'](cmd)
+    _clear()
+    return ret
 
 
 def status(name, sig=None):
@@ -326,8 +383,14 @@ def status(name, sig=None):
         return bool(__salt__['status.pid'](sig))
     cmd = 'service {0} status'.format(name)
     if _service_is_upstart(name):
+        jobs = _upstart_jobs()
+        if name in jobs:
+            return jobs[name]
         return 'start/running' in __salt__['cmd.run'](cmd)
-    return not bool(__salt__['cmd.retcode'](cmd))
+    cache = _SERVICES.get().setdefault('status', {})
+    if not name in cache:
+        cache[name] = not bool(__salt__['cmd.retcode'](cmd))
+    return cache[name]
 
 
 def _get_service_exec():
@@ -369,10 +432,13 @@ def enable(name, **kwargs):
         salt '*' service.enable <service name>
     '''
     if _service_is_upstart(name):
-        return _upstart_enable(name)
-    executable = _get_service_exec()
-    cmd = '{0} -f {1} defaults'.format(executable, name)
-    return not __salt__['cmd.retcode'](cmd)
+        ret = _upstart_enable(name)
+    else:
+        executable = _get_service_exec()
+        cmd = '{0} -f {1} defaults'.format(executable, name)
+        ret = not __salt__['cmd.retcode'](cmd)
+    _clear()
+    return ret
 
 
 def disable(name, **kwargs):
@@ -384,10 +450,13 @@ def disable(name, **kwargs):
         salt '*' service.disable <service name>
     '''
     if _service_is_upstart(name):
-        return _upstart_disable(name)
-    executable = _get_service_exec()
-    cmd = '{0} -f {1} remove'.format(executable, name)
-    return not __salt__['cmd.retcode'](cmd)
+        ret = _upstart_disable(name)
+    else:
+        executable = _get_service_exec()
+        cmd = '{0} -f {1} remove'.format(executable, name)
+        ret = not __salt__['cmd.retcode'](cmd)
+    _clear()
+    return ret
 
 
 def enabled(name):
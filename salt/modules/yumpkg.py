@@ -17,8 +17,22 @@ import logging
 import os
 import re
 
+# Import salt libs
+import salt.utils.snapshot
+
 log = logging.getLogger(__name__)
 
+# The installed packages are read again when the rpm database changes, the
+# repository data is also read again after a minute to follow yum refreshing
+# its metadata
+_INSTALLED = salt.utils.snapshot.snapshot(
+        'yumpkg.installed',
+        ('/var/lib/rpm/Packages',))
+_AVAILABLE = salt.utils.snapshot.snapshot(
+        'yumpkg.available',
+        ('/var/lib/rpm/Packages',),
+        60)
+
 
 def __virtual__():
     '''
@@ -107,7 +121,7 @@ def list_upgrades(*args):
     '''
     pkgs = list_pkgs()
 
-    yb = yum.YumBase()
+    yb = _yumbase()
     versions_list = {}
     for pkgtype in ['updates']:
         pl = yb.doPackageLists(pkgtype)
@@ -131,7 +145,10 @@ def available_version(name):
 
         salt '*' pkg.available_version <package name>
     '''
-    yb = yum.YumBase()
+    cache = _AVAILABLE.get().setdefault('versions', {})
+    if name in cache:
+        return cache[name]
+    yb = _yumbase()
     # look for available packages only, if package is already installed with
     # latest version it will not show up here.  If we want to use wildcards
     # here we can, but for now its exact match only.
@@ -153,9 +170,11 @@ def available_version(name):
         # to also check if a package is installed and on latest version
         # already and return a message saying 'up to date' or something along
         # those lines.
-        return ''
-    # remove the duplicate items from the list and return the first one
-    return list(set(versions_list))[0]
+        cache[name] = ''
+    else:
+        # remove the duplicate items from the list and return the first one
+        cache[name] = list(set(versions_list))[0]
+    return cache[name]
 
 
 def upgrade_available(name):
@@ -177,6 +196,11 @@ def version(name):
 
         salt '*' pkg.version <package name>
     '''
+    # Look the name up in the list of all of the packages, which is read once
+    # for all of the packages of a state run
+    pkgs = list_pkgs()
+    if name in pkgs:
+        return pkgs[name]
     pkgs = list_pkgs(name)
     if name in pkgs:
         return pkgs[name]
@@ -194,18 +218,45 @@ def list_pkgs(*args):
 
         salt '*' pkg.list_pkgs
     '''
+    cache = _INSTALLED.get()
+    if not args in cache:
+        cache[args] = _list_pkgs(*args)
+    return dict(cache[args])
+
+
+def _clear():
+    '''
+    Drop the package snapshots after packages were changed
+    '''
+    _INSTALLED.clear()
+    _AVAILABLE.clear()
+
+
+def _yumbase():
+    '''
+    Return a YumBase object for repository queries, the object and the
+    repository data it loaded are kept with the available packages
+    '''
+    cache = _AVAILABLE.get()
+    if not 'yb' in cache:
+        cache['yb'] = yum.YumBase()
+    return cache['yb']
+
+
+def _list_pkgs(*args):
+    '''
+    Query the rpm database for the installed packages
+    '''
     ts = rpm.TransactionSet()
     pkgs = {}
-    # In order to support specific package versions, we are going to use the
-    # yum libraries to handle pattern matching
-    yb = yum.YumBase()
-    setattr(yb.conf, 'assumeyes', True)
-
     # if no args are passed in get all packages
     if len(args) == 0:
         for h in ts.dbMatch():
             pkgs[h['name']] = '-'.join([h['version'], h['release']])
     else:
+        # In order to support specific package versions, we are going to use
+        # the yum libraries to handle pattern matching
+        yb = _yumbase()
         # get package version for each package in *args
         for arg in args:
             # Make yum do the pattern matching
@@ -231,6 +282,7 @@ def refresh_db():
     '''
     yb = yum.YumBase()
     yb.cleanMetadata()
+    _AVAILABLE.clear()
     return True
 
 
@@ -349,6 +401,7 @@ def install(name=None, refresh=False, repo='', skip_verify=False, pkgs=None,
     yumlogger.log_accumulated_errors()
 
     yb.closeRpmDB()
+    _clear()
 
     new = list_pkgs()
 
@@ -385,6 +438,7 @@ def upgrade():
     yb.processTransaction(rpmDisplay=yumlogger)
     yumlogger.log_accumulated_errors()
     yb.closeRpmDB()
+    _clear()
 
     new = list_pkgs()
     return _compare_versions(old, new)
@@ -417,6 +471,7 @@ def remove(pkgs):
     yb.processTransaction(rpmDisplay=yumlogger)
     yumlogger.log_accumulated_errors()
     yb.closeRpmDB()
+    _clear()
 
     new = list_pkgs(*pkgs)
 
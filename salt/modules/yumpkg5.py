@@ -7,9 +7,23 @@ import os
 import re
 from collections import namedtuple
 
+# Import salt libs
+import salt.utils.snapshot
+
 
 log = logging.getLogger(__name__)
 
+# The installed packages are read again when the rpm database changes, the
+# repository data is also read again after a minute to follow yum refreshing
+# its metadata
+_INSTALLED = salt.utils.snapshot.snapshot(
+        'yumpkg5.installed',
+        ('/var/lib/rpm/Packages',))
+_AVAILABLE = salt.utils.snapshot.snapshot(
+        'yumpkg5.available',
+        ('/var/lib/rpm/Packages',),
+        60)
+
 def __virtual__():
     '''
     Confine this module to yum based systems
@@ -52,6 +66,14 @@ def _parse_yum(arg):
     return results
 
 
+def _clear():
+    '''
+    Drop the package snapshots after packages were changed
+    '''
+    _INSTALLED.clear()
+    _AVAILABLE.clear()
+
+
 def _list_removed(old, new):
     '''
     List the packages which have been removed between the two package objects
@@ -71,8 +93,11 @@ def available_version(name):
 
         salt '*' pkg.available_version <package name>
     '''
-    out = _parse_yum('list update {0}'.format(name))
-    return out[0].version if out else ''
+    cache = _AVAILABLE.get().setdefault('versions', {})
+    if not name in cache:
+        out = _parse_yum('list update {0}'.format(name))
+        cache[name] = out[0].version if out else ''
+    return cache[name]
 
 
 def upgrade_available(name):
@@ -94,11 +119,16 @@ def version(name):
 
         salt '*' pkg.version <package name>
     '''
-    out = _parse_yum('list installed {0}'.format(name))
-    if out:
-        return out[0].version
-    else:
-        return ''
+    # Look the name up in the list of all of the packages, which is read once
+    # for all of the packages of a state run
+    pkgs = list_pkgs()
+    if name in pkgs:
+        return pkgs[name]
+    cache = _INSTALLED.get().setdefault('versions', {})
+    if not name in cache:
+        out = _parse_yum('list installed {0}'.format(name))
+        cache[name] = out[0].version if out else ''
+    return cache[name]
 
 
 def list_pkgs():
@@ -111,8 +141,11 @@ def list_pkgs():
 
         salt '*' pkg.list_pkgs
     '''
-    out = _parse_yum('list installed')
-    return dict([(i.name, i.version) for i in out])
+    cache = _INSTALLED.get()
+    if not 'pkgs' in cache:
+        out = _parse_yum('list installed')
+        cache['pkgs'] = dict([(i.name, i.version) for i in out])
+    return dict(cache['pkgs'])
 
 
 def list_upgrades():
@@ -138,6 +171,7 @@ def refresh_db():
     '''
     cmd = 'yum -q clean dbcache'
     __salt__['cmd.retcode'](cmd)
+    _AVAILABLE.clear()
     return True
 
 
@@ -207,6 +241,7 @@ def install(name=None, refresh=False, repo='', skip_verify=False, pkgs=None,
     )
     old = list_pkgs()
     stderr = __salt__['cmd.run_all'](cmd).get('stderr','')
+    _clear()
     if stderr:
         log.error(stderr)
     new = list_pkgs()
@@ -229,6 +264,7 @@ def upgrade():
     old = list_pkgs()
     cmd = 'yum -q -y upgrade'
     __salt__['cmd.retcode'](cmd)
+    _clear()
     new = list_pkgs()
     pkgs = {}
     for npkg in new:
@@ -260,6 +296,7 @@ def remove(pkg):
     old = list_pkgs()
     cmd = 'yum -q -y remove ' + pkg
     __salt__['cmd.retcode'](cmd)
+    _clear()
     new = list_pkgs()
     return _list_removed(old, new)
 
@@ -1,10 +1,20 @@
 '''
 Used to manage the outputter system. This package is the modular system used
 for managing outputters.
+
+An outputter module exposes an ``output`` function which returns the
+formatted data as a string. An outputter can also expose a ``stream``
+function, a generator which yields the formatted data in chunks, it is used
+by ``display_output`` so that large returns are written to the terminal as
+they are formatted instead of being built up in memory first.
 '''
 
+# Import python libs
+import sys
+
 # Import salt utils
 import salt.loader
+from salt._compat import text_type
 
 
 STATIC = (
@@ -14,17 +24,27 @@ STATIC = (
           'json_out',
           )
 
+# The loaded outputters and streams, keyed on the directories they were
+# loaded from, the loader scans and imports every outputter module so this
+# is only done once per process
+_OUTPUTTERS = {}
 
-def display_output(data, out, opts=None):
+
+def _load(opts):
     '''
-    Print the passed data using the desired output
+    Return the outputters and the streaming outputters for the opts
     '''
-    print(get_printout(out, opts)(data).rstrip())
+    key = (opts.get('extension_modules'),
+           tuple(opts.get('outputter_dirs', [])))
+    if key not in _OUTPUTTERS:
+        _OUTPUTTERS[key] = (salt.loader.outputters(opts),
+                            salt.loader.output_streams(opts))
+    return _OUTPUTTERS[key]
 
 
-def get_printout(out, opts=None, **kwargs):
+def _prep(out, opts, kwargs):
     '''
-    Return a printer function
+    Return the name of the outputter to use and the opts to pass to it
     '''
     if opts is None:
         opts = {}
@@ -52,10 +72,74 @@ def get_printout(out, opts=None, **kwargs):
     opts.update(kwargs)
     if not 'color' in opts:
         opts['color'] = not bool(opts.get('no_color', False))
-    outputters = salt.loader.outputters(opts)
+    return out, opts
+
+
+def _bind(func, opts):
+    '''
+    Point the __opts__ of a cached outputter at the opts of this call
+    '''
+    func.__globals__['__opts__'] = opts
+    return func
+
+
+def _write(chunk):
+    '''
+    Write a chunk of output to stdout
+    '''
+    if isinstance(chunk, text_type):
+        chunk = chunk.encode(sys.stdout.encoding or 'utf-8', 'replace')
+    sys.stdout.write(chunk)
+
+
+def display_output(data, out, opts=None):
+    '''
+    Print the passed data using the desired output
+    '''
+    stream = get_stream(out, opts)
+    if stream is None:
+        print(get_printout(out, opts)(data).rstrip())
+        return
+    # Trailing whitespace is held back until more output follows, so that
+    # the result matches the rstripped output of the outputter
+    pending = ''
+    for chunk in stream(data):
+        if not chunk:
+            continue
+        stripped = chunk.rstrip()
+        if stripped:
+            _write(pending)
+            _write(stripped)
+            pending = chunk[len(stripped):]
+        else:
+            pending += chunk
+    _write('\n')
+    sys.stdout.flush()
+
+
+def get_printout(out, opts=None, **kwargs):
+    '''
+    Return a printer function
+    '''
+    out, opts = _prep(out, opts, kwargs)
+    outputters = _load(opts)[0]
+    if not out in outputters:
+        return _bind(outputters['pprint'], opts)
+    return _bind(outputters[out], opts)
+
+
+def get_stream(out, opts=None, **kwargs):
+    '''
+    Return the streaming function of the outputter, or None if the outputter
+    can only format the data as a whole
+    '''
+    out, opts = _prep(out, opts, kwargs)
+    outputters, streams = _load(opts)
     if not out in outputters:
-        return outputters['pprint']
-    return outputters[out]
+        out = 'pprint'
+    if not out in streams:
+        return None
+    return _bind(streams[out], opts)
 
 
 def out_format(data, out, opts=None):
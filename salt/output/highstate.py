@@ -31,7 +31,15 @@ def output(data):
     be used with the state.highstate function, or a function that returns
     highstate return data.
     '''
+    return ''.join(stream(data))
+
+
+def stream(data):
+    '''
+    Yield the formatted return of one host at a time
+    '''
     colors = salt.utils.get_colors(__opts__.get('color'))
+    sep = ''
     for host in data:
         hcolor = colors['GREEN']
         hstrs = []
@@ -107,6 +115,13 @@ def output(data):
                     ret['comment'],
                     colors
                     ))
+                if ret.get('bytes_saved'):
+                    hstrs.append(
+                        '        {0}Saved:     {1} bytes{2[ENDC]}'.format(
+                            tcolor,
+                            ret['bytes_saved'],
+                            colors
+                            ))
                 changes = '        Changes:   '
                 for key in ret['changes']:
                     if isinstance(ret['changes'][key], string_types):
@@ -123,7 +138,8 @@ def output(data):
                 hstrs.append(('{0}{1}{2[ENDC]}'
                               .format(tcolor, changes, colors)))
         hstrs.insert(0, ('{0}{1}:{2[ENDC]}'.format(hcolor, host, colors)))
-        return '\n'.join(hstrs)
+        yield sep + '\n'.join(hstrs)
+        sep = '\n'
 
 
 def _strip_clean(returns):
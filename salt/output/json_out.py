@@ -6,6 +6,9 @@ import json
 import traceback
 import logging
 
+# Import salt libs
+from salt._compat import string_types
+
 log = logging.getLogger(__name__)
 
 
@@ -28,3 +31,29 @@ def output(data):
         # Return valid json for unserializable objects
         ret = json.dumps({})
     return ret
+
+
+def stream(data):
+    '''
+    Yield the JSON of a dict one key at a time, only the value being encoded
+    is held in memory
+    '''
+    if not data or not isinstance(data, dict) or not all(
+            isinstance(key, string_types) for key in data):
+        yield output(data)
+        return
+    sep = '{\n    '
+    for key, value in data.items():
+        try:
+            value = json.dumps(value, indent=4)
+        except TypeError:
+            log.debug(traceback.format_exc())
+            # Keep the document valid, the value is replaced instead of the
+            # whole document since the preceding keys have been written
+            value = json.dumps({})
+        yield '{0}{1}: {2}'.format(
+                sep,
+                json.dumps(key),
+                value.replace('\n', '\n    '))
+        sep = ', \n    '
+    yield '\n}'
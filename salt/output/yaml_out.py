@@ -16,3 +16,15 @@ def output(data):
     Print out YAML using the block mode
     '''
     return yaml.dump(data, default_flow_style=False)
+
+
+def stream(data):
+    '''
+    Yield the YAML of a dict one key at a time, in the same sorted order as
+    the full dump
+    '''
+    if not data or not isinstance(data, dict):
+        yield output(data)
+        return
+    for key in sorted(data):
+        yield yaml.dump({key: data[key]}, default_flow_style=False)
@@ -10,8 +10,8 @@ the deployment of states over groups of servers.
 # 6. append data to running
 #
 # Import Python libs
-import sys
 import os
+import time
 
 # Import Salt libs
 import salt.client
@@ -20,6 +20,10 @@ import salt.utils
 # Import third party libs
 import yaml
 
+# The number of seconds the minions have to answer if an expired job is
+# still running
+RUNNING_TIMEOUT = 2
+
 
 class OverState(object):
     '''
@@ -29,8 +33,11 @@ class OverState(object):
         self.opts = opts
         self.env = env
         self.over = self.__read_over(overstate)
+        self.names = dict(
+                (comp.keys()[0], comp[comp.keys()[0]]) for comp in self.over)
         self.local = salt.client.LocalClient(self.opts['conf_file'])
         self.over_run = {}
+        self.timing = {}
 
     def __read_over(self, overstate):
         '''
@@ -69,14 +76,43 @@ class OverState(object):
             comps.append({key: pre_over[key]})
         return comps
 
-    def _stage_list(self, match):
+    def _stage_lists(self, names):
         '''
-        Return a list of ids cleared for a given stage
+        Return the list of ids cleared for each of the given stages, the
+        minions are pinged for all of the stages at once
         '''
-        if isinstance(match, list):
-            match = ' or '.join(match)
-        raw = self.local.cmd(match, 'test.ping', expr_form='compound')
-        return raw.keys()
+        pings = {}
+        ret = {}
+        for name in names:
+            ret[name] = []
+            match = self.names[name].get('match')
+            if not match:
+                continue
+            if isinstance(match, list):
+                match = ' or '.join(match)
+            pub_data = self.local.run_job(
+                    match,
+                    'test.ping',
+                    expr_form='compound')
+            if pub_data:
+                pings[pub_data['jid']] = (name, set(pub_data['minions']))
+        deadline = time.time() + self.opts['timeout']
+        while pings and time.time() < deadline:
+            for raw in self.local.event.get_events(
+                    100,
+                    max(deadline - time.time(), 0),
+                    full=True):
+                if raw['tag'] not in pings:
+                    continue
+                name, minions = pings[raw['tag']]
+                minion = raw['data'].get('id')
+                if minion not in minions:
+                    continue
+                minions.discard(minion)
+                ret[name].append(minion)
+                if not minions:
+                    pings.pop(raw['tag'])
+        return ret
 
     def _check_result(self, running):
         '''
@@ -88,6 +124,9 @@ class OverState(object):
         if not running:
             return False
         for host in running:
+            if not isinstance(running[host], dict):
+                # The states failed to compile or could not be run
+                return False
             for tag, ret in running[host].items():
                 if not 'result' in ret:
                     return False
@@ -95,84 +134,242 @@ class OverState(object):
                     return False
         return True
 
-    def call_stage(self, name, stage):
+    def _failure(self, comment):
+        '''
+        Return the state data of a failed requisite
+        '''
+        return {'result': False,
+                'comment': comment,
+                'name': 'Requisite Failure',
+                'changes': {},
+                '__run_num__': 0}
+
+    def _check_reqs(self, name, stage):
+        '''
+        Return None if a requisite of the stage has not completed yet,
+        otherwise the failure data of the stage, which is empty if the stage
+        can be executed
+        '''
+        failure = {}
+        waiting = False
+        for req in stage.get('require', []):
+            if req not in self.names:
+                tag = 'No_|-Req_|-{0}_|-None'.format(req)
+                failure[tag] = self._failure(
+                        'Requisite {0} was not found'.format(req))
+            elif req not in self.over_run:
+                waiting = True
+            elif not self._check_result(self.over_run[req]):
+                tag = 'req_|-fail_|-{0}_|-None'.format(req)
+                failure[tag] = self._failure(
+                        'Requisite {0} failed for stage'.format(req))
+        if failure:
+            return {name: failure}
+        if waiting:
+            return None
+        return {}
+
+    def _call(self, stage):
         '''
-        Check if a stage has any requisites and run them first
+        Return the function and the arguments to execute for a stage
         '''
-        errors = []
-        fun = 'state.highstate'
-        arg = ()
-        if not 'match' in stage:
-            errors.append('No "match" argument in stage.')
-        if errors:
-            return errors
         if 'sls' in stage:
-            fun = 'state.sls'
-            arg = (','.join(stage['sls']), self.env)
-        req_fail = {name: {}}
-        if 'require' in stage:
-            for req in stage['require']:
-                if req in self.over_run:
-                    if self._check_result(self.over_run[req]):
-                        continue
-                    else:
-                        tag_name = 'req_|-fail_|-fail_|-None'
-                        failure = {tag_name: {
-                                'result': False,
-                                'comment': 'Requisite {0} failed for stage'.format(req),
-                                'name': 'Requisite Failure',
-                                'changes': {},
-                                '__run_num__': 0,
-                                    }
-                                }
-                        self.over_run[name] = failure
-                        req_fail[name].update(failure)
-                elif req not in self.over:
-                    tag_name = 'No_|-Req_|-fail_|-None'
-                    failure = {tag_name: {
-                            'result': False,
-                            'comment': 'Requisite {0} was not found'.format(req),
-                            'name': 'Requisite Failure',
-                            'changes': {},
-                            '__run_num__': 0,
-                                }
-                            }
-                    self.over_run[name] = failure
-                    req_fail[name].update(failure)
-                else:
-                    self.call_stage(self.over[req])
-        if req_fail[name]:
-            return req_fail
-        ret = {}
-        tgt = self._stage_list(stage['match'])
-        for minion in self.local.cmd_iter(
-                tgt,
-                fun,
-                arg,
-                expr_form='list'):
-            ret.update({minion.keys()[0]: minion[minion.keys()[0]]['ret']})
+            return 'state.sls', (','.join(stage['sls']), self.env)
+        return 'state.highstate', ()
+
+    def _complete(self, name, ret, start=None):
+        '''
+        Record the return data of a stage, and the timing if it was executed
+        '''
         self.over_run[name] = ret
-        return ret
+        if start is None:
+            return
+        now = time.time()
+        self.timing[name] = {'start': start,
+                             'end': now,
+                             'duration': now - start}
+
+    def _cached_returns(self, jid, job, minions):
+        '''
+        Stop waiting on the minions which are no longer running the job, the
+        returns of the minions which are done are read from the job cache
+        '''
+        jid_dir = salt.utils.jid_dir(
+                jid,
+                self.opts['cachedir'],
+                self.opts['hash_type'])
+        for minion in minions:
+            if minion not in job['minions']:
+                continue
+            job['minions'].discard(minion)
+            retp = os.path.join(jid_dir, minion, 'return.p')
+            if not os.path.isfile(retp):
+                continue
+            try:
+                with salt.utils.fopen(retp, 'rb') as fp_:
+                    job['ret'][minion] = self.local.serial.load(fp_)
+            except Exception:
+                continue
+
+    def _check_expired(self, jid, job, checks, now):
+        '''
+        Ask the minions which have not returned in time if they are still
+        running the job, the answers come in with the other events
+        '''
+        pub_data = self.local.run_job(
+                list(job['minions']),
+                'saltutil.find_job',
+                [jid],
+                'list',
+                timeout=RUNNING_TIMEOUT)
+        if not pub_data:
+            self._cached_returns(jid, job, list(job['minions']))
+            job['deadline'] = now + self.opts['timeout']
+            return
+        checks[pub_data['jid']] = {'jid': jid,
+                                   'minions': set(job['minions']),
+                                   'deadline': now + RUNNING_TIMEOUT}
+        job['check'] = pub_data['jid']
+
+    def critical_path(self):
+        '''
+        Return the chain of required stages which finished last, this is the
+        chain which set the length of the overstate run
+        '''
+        if not self.timing:
+            return []
+        name = max(self.timing, key=lambda x: self.timing[x]['end'])
+        path = [name]
+        while True:
+            reqs = [req for req in self.names[name].get('require', [])
+                    if req in self.timing and req not in path]
+            if not reqs:
+                break
+            name = max(reqs, key=lambda x: self.timing[x]['end'])
+            path.insert(0, name)
+        return path
 
     def stages(self):
         '''
         Execute the stages
         '''
-        self.over_run = {}
-        for comp in self.over:
-            name = comp.keys()[0]
-            stage = comp[name]
-            if not name in self.over_run:
-                self.call_stage(name, stage)
+        for ret in self.stages_iter():
+            pass
 
     def stages_iter(self):
         '''
-        Return an iterator that yields the state call data as it is processed
+        Return an iterator that yields the state call data as it is processed.
+
+        All of the stages which have their requisites met are executed at the
+        same time, unless they share minions with a running stage. A stage is
+        yielded when it is started and its return data is yielded when all of
+        its minions have returned.
         '''
         self.over_run = {}
-        for comp in self.over:
-            name = comp.keys()[0]
-            stage = comp[name]
-            if not name in self.over_run:
-                yield [comp]
-                yield self.call_stage(name, stage)
+        self.timing = {}
+        pending = [comp.keys()[0] for comp in self.over]
+        # Running stages by jid
+        active = {}
+        # The find_job checks of the expired stages by jid
+        checks = {}
+        event = self.local.event
+        # Listen before publishing so that fast returns are not missed
+        if not event.cpub:
+            event.connect_pub()
+        event.subscribe('')
+        targets = self._stage_lists(pending)
+        while pending or active:
+            busy = set()
+            for job in active.values():
+                busy.update(targets[job['name']])
+            changed = True
+            while changed:
+                changed = False
+                for name in list(pending):
+                    stage = self.names[name]
+                    failure = self._check_reqs(name, stage)
+                    if failure is None:
+                        continue
+                    if not failure and not 'match' in stage:
+                        failure = {name: {
+                            'No_|-Match_|-fail_|-None': self._failure(
+                                'No "match" argument in stage.')}}
+                    if failure:
+                        pending.remove(name)
+                        changed = True
+                        self._complete(name, failure)
+                        yield failure
+                        continue
+                    if busy.intersection(targets[name]):
+                        continue
+                    pending.remove(name)
+                    changed = True
+                    yield [{name: stage}]
+                    start = time.time()
+                    pub_data = {}
+                    if targets[name]:
+                        fun, arg = self._call(stage)
+                        pub_data = self.local.run_job(
+                                targets[name],
+                                fun,
+                                arg,
+                                'list')
+                    if not pub_data:
+                        self._complete(name, {}, start)
+                        yield {}
+                        continue
+                    busy.update(targets[name])
+                    active[pub_data['jid']] = {
+                            'name': name,
+                            'minions': set(pub_data['minions']),
+                            'ret': {},
+                            'start': start,
+                            'deadline': start + self.opts['timeout']}
+            if not active:
+                # The remaining stages require each other
+                for name in pending:
+                    failure = {name: {
+                        'req_|-cycle_|-fail_|-None': self._failure(
+                            'The requisites of the stage form a cycle')}}
+                    self._complete(name, failure)
+                    yield failure
+                break
+            for raw in event.get_events(100, 1, full=True):
+                data = raw['data']
+                if 'return' not in data:
+                    continue
+                check = checks.get(raw['tag'])
+                if check is not None:
+                    if data.get('id') not in check['minions']:
+                        continue
+                    check['minions'].discard(data['id'])
+                    job = active.get(check['jid'])
+                    if job is not None and not data['return']:
+                        self._cached_returns(check['jid'], job, [data['id']])
+                    continue
+                job = active.get(raw['tag'])
+                if job is None or data.get('id') not in job['minions']:
+                    continue
+                job['minions'].discard(data['id'])
+                job['ret'][data['id']] = data['return']
+            now = time.time()
+            for cjid, check in checks.items():
+                if check['minions'] and check['deadline'] > now:
+                    continue
+                # The minions which did not answer are not waited on
+                checks.pop(cjid)
+                job = active.get(check['jid'])
+                if job is None:
+                    continue
+                self._cached_returns(check['jid'], job, check['minions'])
+                job['deadline'] = now + self.opts['timeout']
+                job.pop('check')
+            for jid, job in active.items():
+                if (job['minions'] and job['deadline'] <= now
+                        and not 'check' in job):
+                    self._check_expired(jid, job, checks, now)
+                if not job['minions']:
+                    active.pop(jid)
+                    self._complete(job['name'], job['ret'], job['start'])
+                    yield job['ret']
+        event.unsubscribe('')
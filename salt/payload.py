@@ -130,12 +130,16 @@ class SREQ(object):
             self.socket.setsockopt(zmq.IDENTITY, id_)
         self.socket.connect(master)
 
-    def send(self, enc, load, tries=1, timeout=60):
+    def send(self, enc, load, tries=1, timeout=60, cmd=None):
         '''
-        Takes two arguments, the encryption type and the base payload
+        Takes two arguments, the encryption type and the base payload. The
+        optional cmd is sent in the clear so that the master can route
+        encrypted loads to the right worker lane without decrypting them
         '''
         payload = {'enc': enc}
         payload['load'] = load
+        if cmd:
+            payload['cmd'] = cmd
         package = self.serial.dumps(payload)
         self.socket.send(package)
         poller = zmq.Poller()
@@ -54,7 +54,12 @@ class RemotePillar(object):
                 'env': self.opts['environment'],
                 'ver': '2',
                 'cmd': '_pillar'}
-        ret = self.sreq.send('aes', self.auth.crypticle.dumps(load), 3, 7200)
+        ret = self.sreq.send(
+                'aes',
+                self.auth.crypticle.dumps(load),
+                3,
+                7200,
+                cmd=load['cmd'])
         key = self.auth.get_keys()
         aes = key.private_decrypt(ret['key'], 4)
         pcrypt = salt.crypt.Crypticle(self.opts, aes)
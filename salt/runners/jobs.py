@@ -32,8 +32,7 @@ def active():
                                    'Arguments': list(job['arg']),
                                    'Target': job['tgt'],
                                    'Target-type': job['tgt_type']}
-            else:
-                ret[job['jid']]['Running'].append({minion: job['pid']})
+            ret[job['jid']]['Running'].append({minion: job['pid']})
     for jid in ret:
         jid_dir = salt.utils.jid_dir(
                 jid,
@@ -132,5 +131,5 @@ def print_job(job_id):
                                     'Target': load['tgt'],
                                     'Target-type': load['tgt_type'],
                                     'Result': hosts_return}
-                        salt.output.display_output(ret, 'yaml', __opts__)
+    salt.output.display_output(ret, 'yaml', __opts__)
     return ret
@@ -23,6 +23,18 @@ def over(env='base', os_fn=None):
         elif isinstance(stage, list):
             # This is a stage
             salt.output.display_output(stage, 'overstatestage', opts=__opts__)
+    if overstate.timing:
+        start = min(times['start'] for times in overstate.timing.values())
+        timing = {}
+        for name, times in overstate.timing.items():
+            timing[name] = 'started at {0:.2f}s, ran for {1:.2f}s'.format(
+                    times['start'] - start,
+                    times['duration'])
+        salt.output.display_output(
+                {'Stage timing': timing,
+                 'Critical path': overstate.critical_path()},
+                'yaml',
+                opts=__opts__)
     return overstate.over_run
 
 def show_stages(env='base', os_fn=None):
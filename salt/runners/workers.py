@@ -0,0 +1,63 @@
+'''
+Inspect and resize the worker lanes of the master request server
+'''
+
+# Import python libs
+import os
+
+# Import third party libs
+import zmq
+
+# Import salt libs
+import salt.payload
+import salt.output
+
+
+def _ctl(load, timeout=5):
+    '''
+    Send a load to the control socket of the running master
+    '''
+    serial = salt.payload.Serial(__opts__)
+    context = zmq.Context()
+    sock = context.socket(zmq.REQ)
+    sock.setsockopt(zmq.LINGER, 0)
+    try:
+        sock.connect(
+            'ipc://{0}'.format(
+                os.path.join(__opts__['sock_dir'], 'workers_ctl.ipc')
+            )
+        )
+        sock.send(serial.dumps(load))
+        if sock.poll(timeout * 1000) != zmq.POLLIN:
+            return 'The salt master did not respond'
+        return serial.loads(sock.recv())
+    finally:
+        sock.close()
+        context.term()
+
+
+def stats():
+    '''
+    Return the queue depth, in flight requests and latency of the worker
+    lanes
+
+    CLI Example::
+
+        salt-run workers.stats
+    '''
+    ret = _ctl({'cmd': 'stats'})
+    salt.output.display_output(ret, 'yaml', __opts__)
+    return ret
+
+
+def resize(lane, size):
+    '''
+    Change the number of worker processes in a lane of the running master
+
+    CLI Example::
+
+        salt-run workers.resize file 8
+    '''
+    ret = _ctl({'cmd': 'resize', 'lane': lane, 'size': int(size)})
+    salt.output.display_output(ret, 'yaml', __opts__)
+    return ret
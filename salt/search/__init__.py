@@ -11,71 +11,86 @@ import salt.loader
 import salt.utils
 
 
-def iter_ret(opts, ret):
+def _ret_funcs(opts, ret):
     '''
-    Yield returner data if the external job cache is enabled
+    Return the get_load, get_jid and get_jids functions of the external job
+    cache, or None if they are not available
     '''
     if not opts['ext_job_cache']:
-        raise StopIteration
-    get_load = '{0}.get_load'.format(opts['ext_job_cache'])
-    get_jid = '{0}.get_jid'.format(opts['ext_job_cache'])
-    get_jids = '{0}.get_jids'.format(opts['ext_job_cache'])
-    if not get_load in ret:
-        raise StopIteration
-    else:
-        get_load = ret[get_load]
-    if not get_jid in ret:
-        raise StopIteration
-    else:
-        get_jid = ret[get_jid]
-    if not get_jids in ret:
-        raise StopIteration
-    else:
-        get_jids = ret[get_jids]
-    for jid in get_jids():
-        jids = {}
-        jids['load'] = get_load(jid)
-        jids['ret'] = get_jid(jid)
-        jids['jid'] = jid
-        yield jids
-
-
-def _iter_dir(dir_, env):
-    ret = []
-    for fn_ in os.listdir(dir_):
-        path = os.path.join(dir_, fn_)
-        if os.path.isdir(path):
-            yield _iter_dir(path, env)
-        elif os.path.isfile(path):
-            with open(path) as fp_:
-                if salt.utils.istextfile(fp_):
-                    ret.append(
-                        {'path': unicode(path),
-                         'env': unicode(env),
-                         'content': unicode(fp_.read())}
-                        )
-                else:
-                    ret.append(
-                        {'path': unicode(path),
-                         'env': unicode(env),
-                         'content': u'bin'}
-                        )
-    yield ret
-                    
+        return None
+    funcs = []
+    for name in ('get_load', 'get_jid', 'get_jids'):
+        fun = '{0}.{1}'.format(opts['ext_job_cache'], name)
+        if not fun in ret:
+            return None
+        funcs.append(ret[fun])
+    return funcs
+
+
+def list_jids(opts, ret):
+    '''
+    Return the jids in the external job cache, None if the external job cache
+    is not enabled
+    '''
+    funcs = _ret_funcs(opts, ret)
+    if funcs is None:
+        return None
+    return list(funcs[2]())
+
+
+def iter_ret(opts, ret, jids=None):
+    '''
+    Yield returner data if the external job cache is enabled, only the given
+    jids are read if jids is passed
+    '''
+    funcs = _ret_funcs(opts, ret)
+    if funcs is None:
+        return
+    get_load, get_jid, get_jids = funcs
+    if jids is None:
+        jids = get_jids()
+    for jid in jids:
+        data = {}
+        data['load'] = get_load(jid)
+        data['ret'] = get_jid(jid)
+        data['jid'] = jid
+        yield data
+
+
+def file_content(path):
+    '''
+    Return the content of a file to index, binary files are indexed as "bin"
+    '''
+    with salt.utils.fopen(path) as fp_:
+        if not salt.utils.istextfile(fp_):
+            return u'bin'
+        fp_.seek(0)
+        return fp_.read().decode('utf-8', 'replace')
+
 
 def iter_roots(roots):
     '''
     Accepts the file_roots or the pillar_roots structures and yields
     {'path': <path>,
      'env': <env>,
-     'cont': <contents>}
+     'mtime': <mtime>}
+    for every file, the content is read with file_content
     '''
     for env, dirs in roots.items():
         for dir_ in dirs:
             if not os.path.isdir(dir_):
                 continue
-            for ret in _iter_dir(dir_, env):
-                yield ret
+            for root, dirs, files in os.walk(dir_):
+                for fn_ in files:
+                    path = os.path.join(root, fn_)
+                    try:
+                        mtime = os.path.getmtime(path)
+                    except OSError:
+                        continue
+                    yield {'path': path.decode('utf-8', 'replace'),
+                           'env': unicode(env),
+                           'mtime': mtime}
+
 
 class Search(object):
     '''
@@ -4,9 +4,11 @@ Routines to manage interactions with the whoosh search system
 
 # Import python libs
 import os
+import pprint
 
 # Import salt libs
 import salt.search
+from salt._compat import string_types
 
 # Import whoosh libs
 has_whoosh = False
@@ -27,48 +29,123 @@ def __virtual__():
     return 'whoosh' if has_whoosh else False
 
 
-def index():
+def _schema():
     '''
-    Build the search index
+    Return the schema of the index, every document has a unique key so that
+    it can be replaced or removed when its source changes
     '''
-    schema = whoosh.fields.Schema(
+    return whoosh.fields.Schema(
+            key=whoosh.fields.ID(unique=True, stored=True), # Document key
+            mtime=whoosh.fields.STORED, # The mtime of an indexed file
             path=whoosh.fields.TEXT, # Path for sls files
             content=whoosh.fields.TEXT, # All content is indexed here
             env=whoosh.fields.ID, # The environment associated with a file
             fn_type=whoosh.fields.ID, # Set to pillar or state
             minion=whoosh.fields.ID, # The minion id associated with the content
-            jid=whoosh.fields.ID, # The job id
+            jid=whoosh.fields.ID(stored=True), # The job id
             load=whoosh.fields.ID, # The load data
             )
+
+
+def _text(data):
+    '''
+    Return the indexed text of returner data
+    '''
+    if not isinstance(data, string_types):
+        data = pprint.pformat(data)
+    if isinstance(data, unicode):
+        return data
+    return data.decode('utf-8', 'replace')
+
+
+def _index_roots(writer, indexed, roots, fn_type):
+    '''
+    Add the files which are new or have changed since they were indexed,
+    the keys of the files which are still present are dropped from indexed
+    '''
+    for data in salt.search.iter_roots(roots):
+        key = u'{0}:{1}'.format(fn_type, data['path'])
+        if indexed.pop(key, None) == data['mtime']:
+            continue
+        try:
+            content = salt.search.file_content(data['path'])
+        except (IOError, OSError):
+            continue
+        writer.update_document(
+                key=key,
+                fn_type=fn_type,
+                content=content,
+                **data)
+
+
+def index():
+    '''
+    Update the search index, only the files which changed since the last
+    run and the jobs newer than the newest indexed job are added. The
+    documents of removed files and expired jobs are deleted.
+    '''
     index_dir = os.path.join(__opts__['cachedir'], 'whoosh')
     if not os.path.isdir(index_dir):
         os.makedirs(index_dir)
     if whoosh.index.exists_in(index_dir):
         ix_ = whoosh.index.open_dir(index_dir)
+        if not 'key' in ix_.schema.names():
+            # Built by an older version without document keys, start over
+            ix_ = whoosh.index.create_in(index_dir, _schema())
     else:
-        ix_ = whoosh.index.create_in(index_dir, schema)
+        ix_ = whoosh.index.create_in(index_dir, _schema())
 
     try:
         writer = ix_.writer()
     except whoosh.store.LockError:
         return False
 
-    for data in salt.search.iter_roots(__opts__['file_roots']):
-        for chunk in data:
-            writer.add_document(fn_type=u'file', **chunk)
-
-    for data in salt.search.iter_roots(__opts__['pillar_roots']):
-        for chunk in data:
-            writer.add_document(fn_type=u'pillar', **chunk)
-
-    for data in salt.search.iter_ret(__opts__, __ret__):
-        writer.add_document(jid=data['jid'], load=data['load'])
-        for minion in data['ret']:
-            writer.add_document(
-                    jid=data['jid'],
-                    minion=minion,
-                    content=data['ret'][minion])
-    writer.commit()
+    # The lock is only released by commit or cancel, an error has to
+    # cancel the writer or the index stays locked for the next run
+    try:
+        # The mtime of every indexed file and the jids of the indexed jobs
+        files = {}
+        jids = set()
+        with ix_.searcher() as searcher:
+            for fields in searcher.all_stored_fields():
+                if 'jid' in fields:
+                    jids.add(fields['jid'])
+                elif 'key' in fields:
+                    files[fields['key']] = fields.get('mtime')
+
+        _index_roots(writer, files, __opts__['file_roots'], u'file')
+        _index_roots(writer, files, __opts__['pillar_roots'], u'pillar')
+        # The files which are left were removed
+        for key in files:
+            writer.delete_by_term('key', key)
+
+        current = salt.search.list_jids(__opts__, __ret__)
+        if current is not None:
+            current = set(unicode(jid) for jid in current)
+            for jid in jids.difference(current):
+                writer.delete_by_term('jid', jid)
+            # Jids sort by time, only the jobs from the newest indexed job
+            # on are read from the job cache, the newest job is read again
+            # since more returns may have come in for it
+            mark = max(jids) if jids else u''
+            new = sorted(jid for jid in current if jid >= mark)
+            for data in salt.search.iter_ret(__opts__, __ret__, new):
+                jid = unicode(data['jid'])
+                writer.update_document(
+                        key=u'job:{0}'.format(jid),
+                        jid=jid,
+                        load=_text(data['load']))
+                for minion in data['ret'] or {}:
+                    writer.update_document(
+                            key=u'ret:{0}:{1}'.format(jid, minion),
+                            jid=jid,
+                            minion=unicode(minion),
+                            content=_text(data['ret'][minion]))
+        writer.commit()
+    except Exception:
+        writer.cancel()
+        raise
+    return True
 
 
 def query(qstr, limit=10):
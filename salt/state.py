@@ -14,6 +14,8 @@ The data sent to the state calls is as follows:
 # Import python libs
 import os
 import copy
+import json
+import hashlib
 import inspect
 import fnmatch
 import logging
@@ -25,6 +27,7 @@ import salt.utils
 import salt.loader
 import salt.minion
 import salt.pillar
+import salt.payload
 import salt.fileclient
 from salt._compat import string_types, callable
 
@@ -184,6 +187,10 @@ class State(object):
         self.load_modules()
         self.active = set()
         self.mod_init = set()
+        # The tags of the chunks which were passed to a mod_aggregate function
+        self.aggregated = set()
+        # The position of each chunk of the running call_chunks, by tag
+        self.chunk_pos = {}
         self.__run_num = 0
 
     def __gather_pillar(self):
@@ -878,6 +885,7 @@ class State(object):
         if 'provider' in data:
             self.load_modules(data)
         cdata = self.format_call(data)
+        saved = salt.fileclient.TRANSFER_STATS['bytes_saved']
         try:
             if 'kwargs' in cdata:
                 ret = self.states[cdata['full']](
@@ -894,6 +902,11 @@ class State(object):
                 'comment': 'An exception occured in this state: {0}'.format(
                     trb)
                 }
+        # Report the bytes which did not need to be fetched from the master
+        # because the cached copy of a file was current
+        saved = salt.fileclient.TRANSFER_STATS['bytes_saved'] - saved
+        if saved:
+            ret['bytes_saved'] = saved
         ret['__run_num__'] = self.__run_num
         self.__run_num += 1
         format_log(ret)
@@ -907,6 +920,9 @@ class State(object):
         Iterate over a list of chunks and call them, checking for requires.
         '''
         running = {}
+        self.aggregated = set()
+        self.chunk_pos = dict(
+                (_gen_tag(chunk), ind) for ind, chunk in enumerate(chunks))
         for low in chunks:
             if '__FAILHARD__' in running:
                 running.pop('__FAILHARD__')
@@ -914,8 +930,9 @@ class State(object):
             tag = _gen_tag(low)
             if tag not in running:
                 running = self.call_chunk(low, running, chunks)
-                if self.check_failhard(low, running):
-                    return running
+            # The chunk may have been run with an aggregated chunk
+            if self.check_failhard(low, running):
+                return running
             self.active = set()
         return running
 
@@ -987,6 +1004,62 @@ class State(object):
             return 'change'
         return 'met'
 
+    def call_aggregate(self, low, running, chunks):
+        '''
+        Pass the chunk and the chunks of the same state which follow it and
+        have their requisites met to the mod_aggregate function of the state,
+        which can run them together. The return data of the chunks which were
+        run is added to running
+        '''
+        fun = '{0}.mod_aggregate'.format(low['state'])
+        if not self.opts.get('state_aggregate', True):
+            return running
+        tag = _gen_tag(low)
+        if not fun in self.states or tag in self.aggregated:
+            return running
+        pos = self.chunk_pos.get(tag)
+        if pos is None or chunks[pos] is not low:
+            # Not called from call_chunks
+            return running
+        if self.verify_data(low):
+            return running
+        group = [low]
+        for chunk in chunks[pos + 1:]:
+            if chunk['state'] != low['state'] or _gen_tag(chunk) in running:
+                break
+            if _gen_tag(chunk) in self.aggregated:
+                break
+            if self.check_requisite(chunk, running, chunks) != 'met':
+                break
+            # The errors of a chunk are reported when it is called
+            if self.verify_data(chunk):
+                continue
+            group.append(chunk)
+        if len(group) < 2:
+            return running
+        # The chunks the function leaves alone are run on their own
+        self.aggregated.update(_gen_tag(chunk) for chunk in group)
+        try:
+            rets = self.states[fun](group)
+        except Exception:
+            log.error(
+                    'An exception occured in {0}: {1}'.format(
+                        fun,
+                        traceback.format_exc()
+                        )
+                    )
+            return running
+        for chunk, ret in zip(group, rets):
+            if ret is None:
+                continue
+            ret['__run_num__'] = self.__run_num
+            self.__run_num += 1
+            format_log(ret)
+            running[_gen_tag(chunk)] = ret
+        if [ret for ret in rets if ret is not None]:
+            self.module_refresh(low)
+        return running
+
     def call_chunk(self, low, running, chunks):
         '''
         Check if a chunk has any requires, execute the requires and then
@@ -1046,7 +1119,9 @@ class State(object):
                 running['__FAILHARD__'] = True
                 return running
         elif status == 'met':
-            running[tag] = self.call(low)
+            running = self.call_aggregate(low, running, chunks)
+            if tag not in running:
+                running[tag] = self.call(low)
         elif status == 'fail':
             running[tag] = {'changes': {},
                             'result': False,
@@ -1064,9 +1139,10 @@ class State(object):
             running[tag] = self.call(low)
         return running
 
-    def call_high(self, high):
+    def compile_high(self, high):
         '''
-        Process a high data call and ensure the defined states.
+        Compile high data into the low chunks executed by call_high, returns
+        the chunks and the errors
         '''
         errors = []
         # If there is extension data reconcile it
@@ -1074,17 +1150,21 @@ class State(object):
         errors += ext_errors
         errors += self.verify_high(high)
         if errors:
-            return errors
+            return [], errors
         high, req_in_errors = self.requisite_in(high)
         errors += req_in_errors
         high = self.apply_exclude(high)
         # Verify that the high data is structurally sound
         if errors:
-            return errors
+            return [], errors
         # Compile and verify the raw chunks
-        chunks = self.compile_high_data(high)
-        # If there are extensions in the highstate, process them and update
-        # the low data chunks
+        return self.compile_high_data(high), errors
+
+    def call_high(self, high):
+        '''
+        Process a high data call and ensure the defined states.
+        '''
+        chunks, errors = self.compile_high(high)
         if errors:
             return errors
         ret = self.call_chunks(chunks)
@@ -1206,6 +1286,13 @@ class BaseHighState(object):
     def __init__(self, opts):
         self.opts = self.__gen_opts(opts)
         self.avail = self.__gather_avail()
+        self.serial = salt.payload.Serial(self.opts)
+        # The key of the compiled state cache and the hashes of the sls
+        # files rendered, they are only set when state_compile_cache is on
+        self.cache_key = None
+        self.sls_hashes = None
+        # True when the chunks came from the compiled state cache
+        self.cache_hit = False
 
     def __gather_avail(self):
         '''
@@ -1447,6 +1534,10 @@ class BaseHighState(object):
         '''
         err = ''
         errors = []
+        if self.sls_hashes is not None:
+            # Hash the sls before fetching it, a change in between makes the
+            # next run render it again
+            self.sls_hashes[(env, sls)] = self._sls_hash(sls, env)
         fn_ = self.client.get_state(sls, env)
         if not fn_:
             errors.append(('Specified SLS {0} in environment {1} is not'
@@ -1629,6 +1720,105 @@ class BaseHighState(object):
             highstate['__extend__'] = highext
         return highstate, errors
 
+    def _sls_hash(self, sls, env):
+        '''
+        Return the hashes of the files which can hold an sls on the master, up
+        to the one which is found, or None if the master could not be asked
+        '''
+        path = sls.replace('.', '/')
+        ret = []
+        for fn_ in [path + '.sls', os.path.join(path, 'init.sls')]:
+            data = self.client.hash_file('salt://' + fn_, env)
+            if not isinstance(data, dict):
+                return None
+            ret.append(data.get('hsum', ''))
+            if ret[-1]:
+                break
+        return ret
+
+    def _cache_path(self, kind):
+        '''
+        Return the path of the compiled state cache for a kind of chunks
+        '''
+        return os.path.join(
+                self.opts['cachedir'], 'state_cache', '{0}.p'.format(kind))
+
+    def load_compiled(self, kind, matches):
+        '''
+        Return the chunks of the compiled state cache if the grains, pillar,
+        top file matches and sls files they were compiled from did not change,
+        otherwise return None and start recording the sls files rendered
+        '''
+        self.cache_hit = False
+        if not self.opts.get('state_compile_cache'):
+            return None
+        avail = dict((env, sorted(self.avail.get(env, []))) for env in matches)
+        data = [
+                kind,
+                self.opts['id'],
+                self.opts['renderer'],
+                self.opts['grains'],
+                self.state.opts['pillar'],
+                matches,
+                avail]
+        try:
+            self.cache_key = hashlib.md5(
+                    json.dumps(data, sort_keys=True, default=repr)
+                    ).hexdigest()
+        except (TypeError, ValueError):
+            log.debug('Unable to hash the data of the compiled state cache')
+            return None
+        self.sls_hashes = {}
+        path = self._cache_path(kind)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with salt.utils.fopen(path, 'rb') as fp_:
+                cache = self.serial.load(fp_)
+        except Exception:
+            log.debug('Failed to read the compiled state cache {0}'.format(
+                path))
+            return None
+        if not isinstance(cache, dict) or cache.get('key') != self.cache_key:
+            return None
+        for env, sls, hashes in cache['sls']:
+            if self._sls_hash(sls, env) != hashes:
+                log.debug('SLS {0} in environment {1} changed since the '
+                          'states were compiled'.format(sls, env))
+                return None
+        self.sls_hashes = None
+        self.cache_hit = True
+        log.info('Using the {0} chunks of the compiled state cache'.format(
+            len(cache['chunks'])))
+        return cache['chunks']
+
+    def save_compiled(self, kind, chunks):
+        '''
+        Store the chunks compiled from the sls files rendered since
+        load_compiled in the compiled state cache
+        '''
+        if self.sls_hashes is None or not chunks:
+            return
+        sls = []
+        for (env, name), hashes in self.sls_hashes.items():
+            if hashes is None:
+                return
+            sls.append([env, name, hashes])
+        self.sls_hashes = None
+        path = self._cache_path(kind)
+        tmp = '{0}.{1}'.format(path, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with salt.utils.fopen(tmp, 'w+b') as fp_:
+                self.serial.dump(
+                        {'key': self.cache_key, 'sls': sls, 'chunks': chunks},
+                        fp_)
+            os.rename(tmp, path)
+        except Exception as exc:
+            log.debug('Failed to write the compiled state cache {0}: {1}'
+                      .format(path, exc))
+
     def call_highstate(self):
         '''
         Run the sequence to execute the salt highstate for this minion
@@ -1654,13 +1844,28 @@ class BaseHighState(object):
             ret[tag_name]['comment'] = msg
             return ret
         self.load_dynamic(matches)
-        high, errors = self.render_highstate(matches)
-        err += errors
-        if err:
-            return err
-        if not high:
-            return ret
-        return self.state.call_high(high)
+        saved = salt.fileclient.TRANSFER_STATS['bytes_saved']
+        chunks = None
+        if not err:
+            chunks = self.load_compiled('call', matches)
+        if chunks is None:
+            high, errors = self.render_highstate(matches)
+            err += errors
+            if err:
+                return err
+            if not high:
+                return ret
+            chunks, errors = self.state.compile_high(high)
+            if errors:
+                return errors
+            self.save_compiled('call', chunks)
+        ret = self.state.call_chunks(chunks)
+        log.info(
+            'Highstate run skipped {0} bytes of unchanged files'.format(
+                salt.fileclient.TRANSFER_STATS['bytes_saved'] - saved
+            )
+        )
+        return ret
 
     def compile_highstate(self):
         '''
@@ -1685,6 +1890,9 @@ class BaseHighState(object):
         '''
         top = self.get_top()
         matches = self.top_matches(top)
+        chunks = self.load_compiled('low', matches)
+        if chunks is not None:
+            return chunks
         high, errors = self.render_highstate(matches)
 
         # If there is extension data reconcile it
@@ -1699,6 +1907,7 @@ class BaseHighState(object):
 
         # Compile and verify the raw chunks
         chunks = self.state.compile_high_data(high)
+        self.save_compiled('low', chunks)
 
         return chunks
 
@@ -1784,7 +1993,8 @@ class RemoteHighState(object):
                     'aes',
                     self.auth.crypticle.dumps(load),
                     3,
-                    72000))
+                    72000,
+                    cmd=load['cmd']))
         except SaltReqTimeoutError:
             return {}
 
@@ -78,6 +78,7 @@ something like this:
 # Import Python libs
 import os
 import shutil
+import stat
 import difflib
 import logging
 import copy
@@ -1016,7 +1017,31 @@ def recurse(name,
         if _ret['changes']:
             ret['changes'][path] = _ret['changes']
 
-    def manage_file(path, source):
+    def in_place(path, hsum):
+        # Check the file against the manifest of the master with a stat, the
+        # hash of the file comes from the hash cache of the minion
+        try:
+            fstat = os.lstat(path)
+        except OSError:
+            return False
+        if not stat.S_ISREG(fstat.st_mode):
+            return False
+        if uid is not None and fstat.st_uid != uid:
+            return False
+        if gid is not None and fstat.st_gid != gid:
+            return False
+        if mode is not None and __salt__['config.manage_mode'](
+                oct(stat.S_IMODE(fstat.st_mode))) != mode:
+            return False
+        try:
+            return __salt__['file.get_hash'](path, hash_type) == hsum
+        except (IOError, OSError):
+            return False
+
+    def manage_file(path, source, hsum=None):
+        if hsum and in_place(path, hsum):
+            counts['unchanged'] += 1
+            return
         if clean and os.path.exists(path) and os.path.isdir(path):
             _ret = {'name': name, 'changes': {}, 'result': True, 'comment': ''}
             if __opts__['test']:
@@ -1044,6 +1069,12 @@ def recurse(name,
             backup=backup,
             **kwargs)
         merge_ret(path, _ret)
+        if _ret['result'] is False:
+            counts['failed'] += 1
+        elif _ret['changes'] or _ret['result'] is None:
+            counts['updated'] += 1
+        else:
+            counts['unchanged'] += 1
 
     def manage_directory(path):
         if clean and os.path.exists(path) and not os.path.isdir(path):
@@ -1072,9 +1103,28 @@ def recurse(name,
     # If source is a list, find which in the list actually exists
     source, source_hash = __salt__['file.source_list'](source, '', env)
 
+    # Cache the files along with their hashes on the master, the files which
+    # are already in place are then checked without a call to managed()
+    synced = {}
+    if not template and source.startswith('salt://'):
+        synced = __salt__['cp.sync_dir'](source, env, include_empty)
+    if synced:
+        hashes = synced['files']
+        hash_type = synced['hash_type']
+        cached = sorted(hashes) + synced['empty_dirs']
+    else:
+        hashes = {}
+        hash_type = None
+        cached = __salt__['cp.cache_dir'](source, env, include_empty)
+    uid = __salt__['file.user_to_uid'](user) if user else None
+    gid = __salt__['file.group_to_gid'](group) if group else None
+    # Normalize the mode the same way managed() does
+    mode = __salt__['config.manage_mode'](file_mode) or None
+    counts = {'unchanged': 0, 'updated': 0, 'failed': 0}
+
     keep = set()
     vdir = set()
-    for fn_ in __salt__['cp.cache_dir'](source, env, include_empty):
+    for fn_ in cached:
         if not fn_.strip():
             continue
         # fn_ here is the absolute source path of the file to copy from;
@@ -1097,9 +1147,10 @@ def recurse(name,
             manage_directory(dest)
         else:
             src = source + _get_recurse_dest('/', fn_, source, env)
-            manage_file(dest, src)
+            manage_file(dest, src, hashes.get(fn_))
 
     keep = list(keep)
+    removed = []
     if clean:
         # TODO: Use directory(clean=True) instead
         keep += _gen_keep_files(name, require)
@@ -1123,6 +1174,13 @@ def recurse(name,
     if not ret['changes'] and ret['result']:
         ret['comment'] = 'The directory {0} is in the correct state'.format(name)
 
+    ret['comment'] += (
+            '\n{0} files unchanged, {1} updated, {2} failed, {3} removed'
+            ).format(
+                counts['unchanged'],
+                counts['updated'],
+                counts['failed'],
+                len(removed))
     return ret
 
 
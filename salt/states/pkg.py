@@ -10,6 +10,11 @@ declarations are typically rather simple:
 
     vim:
       pkg.installed
+
+Consecutive installed and latest states which have their requisites met and
+no install options of their own are installed with a single call to the
+package manager, each state still gets its own result. This can be turned off
+with the ``state_aggregate`` minion option.
 '''
 # Import python ilbs
 import logging
@@ -179,6 +184,86 @@ def latest(name, refresh=False, repo='', skip_verify=False, **kwargs):
     return ret
 
 
+# The keys of a low chunk which do not change how the package is installed
+_AGGREGATE_KEYS = ('state', 'fun', 'name', 'order', 'refresh', 'require',
+                   'watch', 'require_in', 'watch_in', 'failhard')
+
+
+def _needs_install(low):
+    '''
+    Return True if the package of an installed or latest state has to be
+    installed or upgraded
+    '''
+    version = __salt__['pkg.version'](low['name'])
+    if low['fun'] == 'installed' or not version:
+        return not version
+    avail = __salt__['pkg.available_version'](low['name'])
+    if not avail:
+        return False
+    try:
+        return LooseVersion(avail) > LooseVersion(version)
+    except AttributeError:
+        return False
+
+
+def mod_aggregate(chunks):
+    '''
+    Install the packages of a run of installed and latest states with a
+    single call to pkg.install, so that the package manager resolves the
+    dependencies and takes its lock once.
+
+    Returns a list with the return data of each state which was handled, and
+    None for the states which have to be run on their own
+    '''
+    ret = [None] * len(chunks)
+    if __opts__['test']:
+        return ret
+    if not 'pkgs' in salt.utils.arg_lookup(__salt__['pkg.install'])['kwargs']:
+        return ret
+    names = []
+    for ind, low in enumerate(chunks):
+        if not low['fun'] in ('installed', 'latest'):
+            continue
+        if [key for key in low
+                if not key.startswith('__') and not key in _AGGREGATE_KEYS]:
+            # The state sets install options of its own
+            continue
+        if _needs_install(low):
+            names.append((ind, low))
+    if len(names) < 2:
+        return ret
+    rtag = __gen_rtag()
+    refresh = bool([low for ind, low in names if low.get('refresh')])
+    if refresh or os.path.isfile(rtag):
+        changes = __salt__['pkg.install'](
+                pkgs=[low['name'] for ind, low in names],
+                refresh=True)
+        if os.path.isfile(rtag):
+            os.remove(rtag)
+    else:
+        changes = __salt__['pkg.install'](
+                pkgs=[low['name'] for ind, low in names])
+    # The changes of the dependencies go to the first state which installed
+    # its package
+    deps = dict(changes)
+    for ind, low in names:
+        deps.pop(low['name'], None)
+    for ind, low in names:
+        if not low['name'] in changes:
+            # Let the state report why the package was not installed
+            continue
+        comment = 'Package {0} installed'
+        if low['fun'] == 'latest':
+            comment = 'Package {0} upgraded to latest'
+        ret[ind] = {'name': low['name'],
+                    'changes': {low['name']: changes[low['name']]},
+                    'result': True,
+                    'comment': comment.format(low['name'])}
+        ret[ind]['changes'].update(deps)
+        deps = {}
+    return ret
+
+
 def removed(name):
     '''
     Verify that the package is removed, this will remove the package via
@@ -26,6 +26,7 @@ from calendar import month_abbr as months
 # Import Salt libs
 import salt.minion
 import salt.payload
+import salt.utils.event
 from salt.exceptions import SaltClientError, CommandNotFoundError
 
 
@@ -51,6 +52,10 @@ DEFAULT_COLOR = '\033[00m'
 RED_BOLD = '\033[01;31m'
 ENDC = '\033[0m'
 
+# The hash types which can be requested by name, anything else could reach
+# arbitrary attributes of the hashlib module
+HASH_TYPES = ('md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512')
+
 
 def _getargs(func):
     '''
@@ -198,6 +203,8 @@ def daemonize_if(opts, **kwargs):
     sdata.update(data)
     with salt.utils.fopen(fn_, 'w+') as f:
         f.write(serial.dumps(sdata))
+    # Register the new pid with the job registry in the minion daemon
+    salt.utils.event.MinionEvent(**opts).fire_event(sdata, '_salt_job_start')
 
 
 def profile_func(filename=None):
@@ -519,6 +526,20 @@ def pem_finger(path, sum_type='md5'):
     return finger.rstrip(':')
 
 
+def get_hash(path, form='md5', chunk_size=65536):
+    '''
+    Return the hexdigest of a file, the file is read in chunks so that large
+    files are not loaded into memory
+    '''
+    if form not in HASH_TYPES:
+        raise ValueError('Invalid hash type: {0}'.format(form))
+    hash_obj = getattr(hashlib, form)()
+    with salt.utils.fopen(path, 'rb') as fp_:
+        for chunk in iter(lambda: fp_.read(chunk_size), ''):
+            hash_obj.update(chunk)
+    return hash_obj.hexdigest()
+
+
 def build_whitepace_splited_regex(text):
     '''
     Create a regular expression at runtime which should match ignoring the
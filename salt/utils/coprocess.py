@@ -0,0 +1,223 @@
+'''
+Run shell commands in a persistent shell process, the commands are sent over
+a pipe and the end of each command is marked with a unique delimiter. This
+saves the fork and exec of a new shell for each short command, like the
+onlyif and unless checks of the cmd states
+'''
+
+# Import python libs
+import os
+import time
+import shutil
+import select
+import tempfile
+import subprocess
+import threading
+
+# The running shells by key, they are kept here because the loader reloads the
+# execution modules
+WORKERS = {}
+
+# The number of shells a process keeps, the least recently used shell is
+# stopped to make room for a new one
+MAX_WORKERS = 8
+
+# Seconds after which an unused shell is stopped
+IDLE_TIMEOUT = 600
+
+
+class WorkerError(Exception):
+    '''
+    Raised when the shell process exited while running a command
+    '''
+
+
+def _quote(data):
+    '''
+    Return the data in single quotes for the shell
+    '''
+    return "'{0}'".format(str(data).replace("'", "'\\''"))
+
+
+def get_worker(key):
+    '''
+    Return the running shell for the key or None, shells started by a parent
+    process are not shared with the forked job processes
+    '''
+    _expire()
+    worker = WORKERS.get(key)
+    if worker is None:
+        return None
+    if worker.pid != os.getpid() or not worker.alive():
+        WORKERS.pop(key, None)
+        return None
+    return worker
+
+
+def start_worker(key, shell, cwd, preexec_fn=None, owner=None):
+    '''
+    Start a shell for the key and return it, owner is the uid and gid the
+    shell runs as if preexec_fn switches the user
+    '''
+    _expire()
+    workers = sorted(
+            (worker.last_use, key_) for key_, worker in WORKERS.items()
+            if worker.pid == os.getpid())
+    for last_use, key_ in workers[:max(len(workers) - MAX_WORKERS + 1, 0)]:
+        WORKERS.pop(key_).close()
+    worker = Worker(shell, cwd, preexec_fn, owner)
+    WORKERS[key] = worker
+    return worker
+
+
+def _expire():
+    '''
+    Stop the shells of this process which were not used for IDLE_TIMEOUT
+    seconds
+    '''
+    now = time.time()
+    for key in list(WORKERS):
+        worker = WORKERS[key]
+        if worker.pid != os.getpid():
+            continue
+        if now - worker.last_use > IDLE_TIMEOUT:
+            WORKERS.pop(key).close()
+
+
+def stop_workers():
+    '''
+    Stop all of the shells started by this process
+    '''
+    for key in list(WORKERS):
+        worker = WORKERS.pop(key)
+        if worker.pid == os.getpid():
+            worker.close()
+
+
+class Worker(object):
+    '''
+    A shell reading commands from a pipe, every command runs in a subshell
+    so that it cannot change the state of the shell. The output of each
+    command goes to files of its own, so that processes the command left
+    running in the background can not write into the output of the next
+    command or block the shell on a full pipe.
+    '''
+    def __init__(self, shell, cwd, preexec_fn=None, owner=None):
+        self.shell = shell
+        self.cwd = cwd
+        # The process which owns the pipes
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.last_use = time.time()
+        self.tmpdir = tempfile.mkdtemp(prefix='salt-coprocess-')
+        if owner is not None:
+            os.chown(self.tmpdir, owner[0], owner[1])
+        self.out_path = os.path.join(self.tmpdir, 'stdout')
+        self.err_path = os.path.join(self.tmpdir, 'stderr')
+        with open(os.devnull, 'w') as null:
+            try:
+                self.proc = subprocess.Popen(
+                        [shell],
+                        cwd=cwd,
+                        env=os.environ.copy(),
+                        stdin=subprocess.PIPE,
+                        stdout=subprocess.PIPE,
+                        stderr=null,
+                        preexec_fn=preexec_fn,
+                        close_fds=True)
+            except OSError:
+                shutil.rmtree(self.tmpdir, True)
+                raise
+
+    def alive(self):
+        '''
+        Return True if the shell is still running
+        '''
+        return self.proc.poll() is None
+
+    def close(self):
+        '''
+        Stop the shell
+        '''
+        try:
+            self.proc.stdin.close()
+        except (IOError, OSError):
+            pass
+        if self.alive():
+            try:
+                self.proc.kill()
+            except OSError:
+                pass
+        self.proc.wait()
+        shutil.rmtree(self.tmpdir, True)
+
+    def _script(self, cmd, token, env, merge):
+        '''
+        Return the shell code which runs a command and writes the delimiter
+        '''
+        exports = ''.join(
+                'export {0}={1}; '.format(key, _quote(val))
+                for key, val in dict(env).items())
+        return ('( {0}eval {1}\n) </dev/null >{2} {3}\n'
+                'printf \'{4} %d\\n\' $?\n').format(
+                        exports,
+                        _quote(cmd),
+                        _quote(self.out_path),
+                        '2>&1' if merge else '2>{0}'.format(
+                            _quote(self.err_path)),
+                        token)
+
+    def run(self, cmd, env=(), merge=False):
+        '''
+        Run a command and return the stdout, the stderr and the return code.
+        If merge is True the stderr of the command is sent to the stdout.
+        Returns None if the command could not be sent, the shell is busy in
+        another thread or is gone, in which case the command did not run.
+        '''
+        if not self.lock.acquire(False):
+            return None
+        try:
+            token = 'SALT_COPROCESS_{0}'.format(os.urandom(16).encode('hex'))
+            try:
+                self.proc.stdin.write(self._script(cmd, token, env, merge))
+                self.proc.stdin.flush()
+            except (IOError, OSError):
+                return None
+            retcode = self._read(token)
+            out = self._collect(self.out_path)
+            err = self._collect(self.err_path)
+            self.last_use = time.time()
+            return out, err, retcode
+        finally:
+            self.lock.release()
+
+    def _collect(self, path):
+        '''
+        Read and remove an output file of the last command, processes which
+        still write to it keep the removed file
+        '''
+        try:
+            with open(path, 'rb') as fp_:
+                data = fp_.read()
+        except IOError:
+            return ''
+        os.remove(path)
+        return data
+
+    def _read(self, token):
+        '''
+        Wait for the delimiter of a command and return its exit code
+        '''
+        fd_ = self.proc.stdout.fileno()
+        buf = ''
+        while True:
+            select.select([fd_], [], [])
+            data = os.read(fd_, 4096)
+            if not data:
+                raise WorkerError(
+                        'The shell {0} exited while running a '
+                        'command'.format(self.shell))
+            buf += data
+            ind = buf.find(token + ' ')
+            if ind != -1 and buf.endswith('\n'):
+                return int(buf[ind + len(token) + 1:-1])
@@ -0,0 +1,174 @@
+'''
+Compute and apply rsync style deltas between two copies of a file.
+
+The side with the old copy sends a signature, the weak and strong checksum of
+each block of the file. The side with the new copy rolls the weak checksum
+over its file to find the blocks which can be copied from the old copy, the
+rest is sent as literal data. The operations of a delta are:
+
+    ['c', <first block>, <number of blocks>]
+        copy the blocks from the old copy
+    ['l', <offset>, <length>]
+        literal data, read from the new copy at the offset
+'''
+
+# Import python libs
+import os
+import mmap
+import zlib
+import hashlib
+
+# Import salt libs
+import salt.utils
+
+BLOCK_SIZE = 65536
+# Modulus of the adler32 checksum
+MOD_ADLER = 65521
+
+
+def _weak(data):
+    '''
+    Return the adler32 checksum of a block
+    '''
+    return zlib.adler32(data) & 0xffffffff
+
+
+def _strong(data):
+    '''
+    Return the strong checksum of a block
+    '''
+    return hashlib.md5(data).digest()
+
+
+def signature(path, block_size=BLOCK_SIZE, form='md5'):
+    '''
+    Return the checksums of the blocks of a file and the hash of the whole
+    file
+    '''
+    hash_obj = getattr(hashlib, form)()
+    sums = []
+    with salt.utils.fopen(path, 'rb') as fp_:
+        for block in iter(lambda: fp_.read(block_size), ''):
+            hash_obj.update(block)
+            sums.append([_weak(block), _strong(block)])
+    return {'block_size': block_size,
+            'sums': sums,
+            'hsum': hash_obj.hexdigest()}
+
+
+def _add_copy(ops, ind):
+    '''
+    Add a copied block to the delta, adjoining blocks are merged
+    '''
+    if ops and ops[-1][0] == 'c' and ops[-1][1] + ops[-1][2] == ind:
+        ops[-1][2] += 1
+    else:
+        ops.append(['c', ind, 1])
+
+
+def _add_literal(ops, offset, length):
+    '''
+    Add a literal range to the delta
+    '''
+    if length > 0:
+        ops.append(['l', offset, length])
+
+
+def delta(path, sig, scan_limit=4):
+    '''
+    Return the operations which rebuild the file at path from the old copy
+    described by the signature, or None if the delta would not be smaller
+    than the file.
+
+    The weak checksum is rolled byte by byte for at most ``scan_limit`` blocks
+    after the last match, past that the file is only compared on block
+    boundaries, this keeps the cost of files which changed completely down
+    '''
+    block_size = sig['block_size']
+    table = {}
+    for ind, (weak, strong) in enumerate(sig['sums']):
+        table.setdefault(weak, []).append((strong, ind))
+    size = os.path.getsize(path)
+    ops = []
+    if not size or not table:
+        return None
+    literal = 0
+    with salt.utils.fopen(path, 'rb') as fp_:
+        data = mmap.mmap(fp_.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            pos = 0
+            # Start of the literal data which has not been added yet
+            lit = 0
+            weak = None
+            while pos < size:
+                end = min(pos + block_size, size)
+                if weak is None:
+                    weak = _weak(data[pos:end])
+                match = None
+                if weak in table:
+                    strong = _strong(data[pos:end])
+                    for candidate, ind in table[weak]:
+                        if candidate == strong:
+                            match = ind
+                            break
+                if match is not None:
+                    _add_literal(ops, lit, pos - lit)
+                    literal += pos - lit
+                    _add_copy(ops, match)
+                    pos = lit = end
+                    weak = None
+                    continue
+                if end == size:
+                    # The tail of the file is shorter than a block
+                    break
+                if pos - lit < scan_limit * block_size:
+                    # Roll the checksum one byte forward
+                    out_ = ord(data[pos])
+                    in_ = ord(data[end])
+                    low = (weak & 0xffff) - out_ + in_
+                    low %= MOD_ADLER
+                    high = ((weak >> 16) - block_size * out_ + low - 1)
+                    high %= MOD_ADLER
+                    weak = (high << 16) | low
+                    pos += 1
+                else:
+                    pos = end
+                    weak = None
+            _add_literal(ops, lit, size - lit)
+            literal += size - lit
+        finally:
+            data.close()
+    if literal >= size:
+        return None
+    return ops
+
+
+def literal_size(ops):
+    '''
+    Return the number of bytes of literal data in a delta
+    '''
+    return sum(op[2] for op in ops if op[0] == 'l')
+
+
+def patch(path, dest_fp, block_size, ops, fetch):
+    '''
+    Write the file described by a delta to dest_fp. The blocks are read from
+    the old copy at path, ``fetch(offset, length)`` must return an iterable
+    of the chunks of literal data
+    '''
+    with salt.utils.fopen(path, 'rb') as fp_:
+        for op in ops:
+            if op[0] == 'c':
+                fp_.seek(op[1] * block_size)
+                remaining = op[2] * block_size
+                while remaining > 0:
+                    chunk = fp_.read(min(remaining, block_size))
+                    if not chunk:
+                        break
+                    dest_fp.write(chunk)
+                    remaining -= len(chunk)
+            elif op[0] == 'l':
+                for chunk in fetch(op[1], op[2]):
+                    dest_fp.write(chunk)
+            else:
+                raise ValueError('Invalid delta operation {0}'.format(op[0]))
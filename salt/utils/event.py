@@ -3,20 +3,22 @@ Manage events
 '''
 # Events are all fired off via a zeromq pub socket, and listened to with
 # local subscribers. The event messages are comprised of two parts delimited
-# at the 20 char point. The first 20 characters are used for the zeromq
-# subscriber to match publications and 20 characters were chosen because it is
-# a few more characters than the length of a jid. The 20 characters
-# are padded with "|" chars so that the msgpack component can be predictably
-# extracted. All of the formatting is self contained in the event module, so
-# we should be able to modify the structure in the future since the same module
-# to read is the same module to fire off events.
+# by the TAGEND string. The tag comes first so that the zeromq subscribers can
+# match publications on any prefix of the tag, tags can be of any length as
+# long as they do not contain TAGEND. The msgpack component follows the
+# delimiter. All of the formatting is self contained in the event module, so
+# we should be able to modify the structure in the future since the same
+# module to read is the same module to fire off events.
 #
 #
 # Import Python libs
 import os
-import hashlib
+import time
 import errno
+import struct
+import hashlib
 import logging
+import collections
 import multiprocessing
 
 # Import Third Party libs
@@ -27,6 +29,13 @@ import salt.payload
 
 log = logging.getLogger(__name__)
 
+# The delimiter between the tag and the serialized data of an event
+TAGEND = '\n\n'
+
+# The number of events which matched a subscription but were not asked for
+# yet that are kept around for later get_event calls
+MAX_PENDING = 1000
+
 class SaltEvent(object):
     '''
     The base class used to manage salt events
@@ -37,6 +46,8 @@ class SaltEvent(object):
         self.poller = zmq.Poller()
         self.cpub = False
         self.cpush = False
+        self.subscriptions = set()
+        self.pending = collections.deque([], MAX_PENDING)
         self.puburi, self.pulluri = self.__load_uri(sock_dir, node, **kwargs)
 
     def __load_uri(self, sock_dir, node, **kwargs):
@@ -87,6 +98,8 @@ class SaltEvent(object):
         self.sub.connect(self.puburi)
         self.poller.register(self.sub, zmq.POLLIN)
         self.cpub = True
+        for tag in self.subscriptions:
+            self.sub.setsockopt(zmq.SUBSCRIBE, tag)
 
     def connect_pull(self):
         '''
@@ -96,36 +109,147 @@ class SaltEvent(object):
         self.push.connect(self.pulluri)
         self.cpush = True
 
+    def subscribe(self, tag=''):
+        '''
+        Subscribe to events with tags starting with the given prefix, an empty
+        tag subscribes to all events
+        '''
+        if tag in self.subscriptions:
+            return
+        self.subscriptions.add(tag)
+        if self.cpub:
+            self.sub.setsockopt(zmq.SUBSCRIBE, tag)
+
+    def unsubscribe(self, tag=''):
+        '''
+        Drop a subscription made with subscribe and forget the events which
+        are pending for it
+        '''
+        if tag not in self.subscriptions:
+            return
+        self.subscriptions.discard(tag)
+        if self.cpub:
+            self.sub.setsockopt(zmq.UNSUBSCRIBE, tag)
+        self.pending = collections.deque(
+                [evt for evt in self.pending if self._subscribed(evt[0])],
+                MAX_PENDING
+                )
+
+    def _subscribed(self, mtag):
+        '''
+        Return True if an event tag matches one of the subscriptions
+        '''
+        for tag in self.subscriptions:
+            if mtag.startswith(tag):
+                return True
+        return False
+
+    @classmethod
+    def pack(cls, tag, data, serial=None):
+        '''
+        Pack the tag and the data of an event into a raw event package
+        '''
+        if TAGEND in tag:
+            raise ValueError(
+                'Event tags can not contain {0!r}'.format(TAGEND)
+            )
+        if serial is None:
+            serial = salt.payload.Serial({'serial': 'msgpack'})
+        return '{0}{1}{2}'.format(tag, TAGEND, serial.dumps(data))
+
+    @classmethod
+    def unpack(cls, raw, serial=None):
+        '''
+        Split a raw event package into the tag and the deserialized data
+        '''
+        if serial is None:
+            serial = salt.payload.Serial({'serial': 'msgpack'})
+        mtag, sep, mdata = raw.partition(TAGEND)
+        return mtag, serial.loads(mdata)
+
+    def _format(self, mtag, data, full):
+        '''
+        Return an event in the form asked for by the caller
+        '''
+        if full:
+            return {'data': data, 'tag': mtag}
+        return data
+
+    def _pop_pending(self, tag):
+        '''
+        Return the oldest pending event matching the tag
+        '''
+        for evt in self.pending:
+            if evt[0].startswith(tag):
+                self.pending.remove(evt)
+                return evt
+        return None
+
+    def _recv(self, timeout):
+        '''
+        Receive a single raw package, waiting at most timeout milliseconds,
+        a timeout of None blocks
+        '''
+        try:
+            socks = dict(self.poller.poll(timeout))
+        except zmq.ZMQError as exc:
+            if exc.errno == errno.EINTR:
+                return None
+            raise exc
+        if socks.get(self.sub) == zmq.POLLIN:
+            return self.sub.recv()
+        return None
+
     def get_event(self, wait=5, tag='', full=False):
         '''
-        Get a single publication
+        Get a single publication. Events for other subscriptions which are
+        received while waiting are kept for later calls.
+        '''
+        evts = self.get_events(1, wait, tag, True)
+        if not evts:
+            return None
+        return self._format(evts[0]['tag'], evts[0]['data'], full)
+
+    def get_events(self, max_n=100, wait=5, tag='', full=False):
+        '''
+        Get up to max_n publications matching the tag prefix. Waits at most
+        wait seconds for the first event, the events which are already queued
+        are then read in without waiting.
         '''
-        wait = wait * 1000
         if not self.cpub:
             self.connect_pub()
-        self.sub.setsockopt(zmq.SUBSCRIBE, tag)
-        while True:
-            socks = dict(self.poller.poll(wait))
-            if self.sub in socks and socks[self.sub] == zmq.POLLIN:
-                raw = self.sub.recv()
-                data = self.serial.loads(raw[20:])
-                if full:
-                    ret = {'data': data,
-                           'tag': raw[:20].rstrip('|')}
-                    return ret
-                return data
+        self.subscribe(tag)
+        ret = []
+        while len(ret) < max_n:
+            evt = self._pop_pending(tag)
+            if evt is None:
+                break
+            ret.append(self._format(evt[0], evt[1], full))
+        deadline = time.time() + wait
+        while len(ret) < max_n:
+            if ret:
+                timeout = 0
             else:
-                return None
+                timeout = max(deadline - time.time(), 0) * 1000
+            raw = self._recv(timeout)
+            if raw is None:
+                if ret or time.time() >= deadline:
+                    break
+                continue
+            mtag, data = self.unpack(raw, self.serial)
+            if mtag.startswith(tag):
+                ret.append(self._format(mtag, data, full))
+            elif self._subscribed(mtag):
+                self.pending.append((mtag, data))
+        return ret
 
     def iter_events(self, tag='', full=False):
         '''
         Creates a generator that continuously listens for events
         '''
         while True:
-            data = self.get_event(tag=tag, full=full)
-            if data is None:
-                continue
-            yield data
+            for data in self.get_events(tag=tag, full=full):
+                yield data
 
     def fire_event(self, data, tag=''):
         '''
@@ -133,11 +257,75 @@ class SaltEvent(object):
         '''
         if not self.cpush:
             self.connect_pull()
-        tag = '{0:|<20}'.format(tag)
-        event = '{0}{1}'.format(tag, self.serial.dumps(data))
-        self.push.send(event)
+        self.push.send(self.pack(tag, data, self.serial))
         return True
 
+    def destroy(self, linger=1000):
+        '''
+        Close the sockets and terminate the context, the events which were
+        fired are given linger milliseconds to be delivered
+        '''
+        if self.cpub:
+            self.poller.unregister(self.sub)
+            self.sub.close()
+            self.cpub = False
+        if self.cpush:
+            self.push.setsockopt(zmq.LINGER, linger)
+            self.push.close()
+            self.cpush = False
+        self.context.term()
+
+
+class EventRecorder(object):
+    '''
+    Write raw event packages to a file and read them back, each package is
+    stored with a length prefix
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.fp_ = None
+
+    def record(self, package):
+        '''
+        Append a raw event package to the recording
+        '''
+        if self.fp_ is None:
+            self.fp_ = open(self.path, 'ab')
+        self.fp_.write(struct.pack('>I', len(package)))
+        self.fp_.write(package)
+
+    def flush(self):
+        '''
+        Flush the recorded events to disk
+        '''
+        if self.fp_ is not None:
+            self.fp_.flush()
+
+    def close(self):
+        '''
+        Close the recording
+        '''
+        if self.fp_ is not None:
+            self.fp_.close()
+            self.fp_ = None
+
+    def replay(self, tag=''):
+        '''
+        Iterate over the recorded events matching the tag prefix, yields
+        dicts with the tag and the data
+        '''
+        serial = salt.payload.Serial({'serial': 'msgpack'})
+        with open(self.path, 'rb') as fp_:
+            while True:
+                head = fp_.read(4)
+                if len(head) < 4:
+                    break
+                package = fp_.read(struct.unpack('>I', head)[0])
+                if not package.startswith(tag):
+                    continue
+                mtag, data = SaltEvent.unpack(package, serial)
+                yield {'tag': mtag, 'data': data}
+
 
 class MasterEvent(SaltEvent):
     '''
@@ -199,17 +387,35 @@ class EventPublisher(multiprocessing.Process):
                 448
                 )
 
+        recorder = None
+        if self.opts.get('event_record_file'):
+            recorder = EventRecorder(self.opts['event_record_file'])
+
         try:
             while True:
                 # Catch and handle EINTR from when this process is sent
                 # SIGUSR1 gracefully so we don't choke and die horribly
                 try:
                     package = epull_sock.recv()
-                    epub_sock.send(package)
+                    # Forward everything which is already queued in one go
+                    while True:
+                        epub_sock.send(package)
+                        if recorder:
+                            recorder.record(package)
+                        try:
+                            package = epull_sock.recv(zmq.NOBLOCK)
+                        except zmq.ZMQError as exc:
+                            if exc.errno == errno.EAGAIN:
+                                break
+                            raise exc
+                    if recorder:
+                        recorder.flush()
                 except zmq.ZMQError as exc:
                     if exc.errno == errno.EINTR:
                         continue
                     raise exc
         except KeyboardInterrupt:
+            if recorder:
+                recorder.close()
             epub_sock.close()
             epull_sock.close()
@@ -80,13 +80,15 @@ the following:
 '''
 
 # Import python libs
-import hashlib
+import collections
 import logging
 import os
 import re
 import stat
 import sys
 import time
+import threading
+import Queue
 try:
     import grp
     import pwd
@@ -98,6 +100,14 @@ import salt.utils
 from salt._compat import MAX_SIZE
 from salt.utils.filebuffer import BufferedReader
 
+# The scandir module gives the type of the directory entries without a stat
+try:
+    from scandir import scandir as _scandir_entries
+    HAS_SCANDIR = True
+except ImportError:
+    _scandir_entries = getattr(os, 'scandir', None)
+    HAS_SCANDIR = _scandir_entries is not None
+
 # Set up logger
 log = logging.getLogger(__name__)
 
@@ -411,6 +421,9 @@ class GrepOption(Option):
             self.re = re.compile(value)
         except re.error:
             raise ValueError('invalid regular expression: "{0}"'.format(value))
+        # The end of each chunk is searched again with the next chunk, so
+        # that matches spanning a chunk boundary are found
+        self.overlap = max(len(value), 4096)
 
     def requires(self):
         return _REQUIRES_CONTENTS | _REQUIRES_STAT
@@ -418,10 +431,13 @@ class GrepOption(Option):
     def match(self, dirname, filename, fstat):
         if not stat.S_ISREG(fstat[stat.ST_MODE]):
             return None
-        with BufferedReader(os.path.join(dirname, filename), mode='rb') as br:
+        path = os.path.join(dirname, filename)
+        tail = ''
+        with BufferedReader(path, mode='rb') as br:
             for chunk in br:
-                if self.re.search(chunk):
-                    return os.path.join(dirname, filename)
+                if self.re.search(tail + chunk):
+                    return path
+                tail = chunk[-self.overlap:]
         return None
 
 
@@ -485,13 +501,7 @@ class PrintOption(Option):
                     result.append(gid)
             elif arg == 'md5':
                 if stat.S_ISREG(fstat[stat.ST_MODE]):
-                    with salt.utils.fopen(fullpath, 'rb') as f:
-                        buf = f.read(8192)
-                        h = hashlib.md5()
-                        while buf:
-                            h.update(buf)
-                            buf = f.read(8192)
-                    result.append(h.hexdigest())
+                    result.append(salt.utils.get_hash(fullpath, 'md5'))
                 else:
                     result.append('')
 
@@ -501,8 +511,41 @@ class PrintOption(Option):
             return result
 
 
+def _scandir(path):
+    '''
+    Return the entries of a directory as tuples of the name, the file type
+    and the stat of the entry. The file type and the stat are None when they
+    are not known without a stat call, the file type of symlinks is never
+    set since the criteria match the target of the link
+    '''
+    ret = []
+    if HAS_SCANDIR:
+        for entry in _scandir_entries(path):
+            ftype = None
+            if entry.is_symlink():
+                pass
+            elif entry.is_dir():
+                ftype = stat.S_IFDIR
+            elif entry.is_file():
+                ftype = stat.S_IFREG
+            ret.append((entry.name, ftype, None))
+        return ret
+    for name in os.listdir(path):
+        try:
+            fstat = os.lstat(os.path.join(path, name))
+        except OSError:
+            continue
+        if stat.S_ISLNK(fstat.st_mode):
+            ret.append((name, None, None))
+        else:
+            # The lstat of anything but a link is its stat
+            ret.append((name, stat.S_IFMT(fstat.st_mode), fstat))
+    return ret
+
+
 class Finder(object):
-    def __init__(self, options):
+    def __init__(self, options, threads=1):
+        self.threads = threads
         self.actions = []
         criteria = {_REQUIRES_PATH: list(),
                     _REQUIRES_STAT: list(),
@@ -534,6 +577,52 @@ class Finder(object):
                         criteria[_REQUIRES_STAT] + \
                         criteria[_REQUIRES_CONTENTS]
 
+    def _check(self, dirpath, name, ftype, fstat):
+        '''
+        Return the results of the actions for a directory entry if it
+        matches the criteria, the entry is only stat'ed when a criterion or
+        an action needs more than the file type
+        '''
+        fullpath = os.path.join(dirpath, name)
+        try:
+            for criterion in self.criteria:
+                if fstat is None and criterion.requires() & _REQUIRES_STAT:
+                    if ftype is not None and isinstance(criterion, TypeOption):
+                        if ftype not in criterion.ftypes:
+                            return []
+                        continue
+                    fstat = os.stat(fullpath)
+                if not criterion.match(dirpath, name, fstat):
+                    return []
+            ret = []
+            for action in self.actions:
+                if fstat is None and action.requires() & _REQUIRES_STAT:
+                    fstat = os.stat(fullpath)
+                result = action.execute(fullpath, fstat)
+                if result is not None:
+                    ret.append(result)
+            return ret
+        except OSError:
+            # The entry is gone or is a dangling link
+            return []
+
+    def _scan(self, dirpath):
+        '''
+        Return the results for the entries of a directory and the
+        subdirectories to walk
+        '''
+        ret = []
+        dirs = []
+        try:
+            entries = _scandir(dirpath)
+        except OSError:
+            return ret, dirs
+        for name, ftype, fstat in entries:
+            ret.extend(self._check(dirpath, name, ftype, fstat))
+            if ftype == stat.S_IFDIR:
+                dirs.append(os.path.join(dirpath, name))
+        return ret, dirs
+
     def find(self, path):
         '''
         Generate filenames in path that satisfy criteria specified in
@@ -541,28 +630,72 @@ class Finder(object):
         This method is a generator and should be repeatedly called
         until there are no more results.
         '''
-        for dirpath, dirs, files in os.walk(path):
-            for name in dirs + files:
-                fstat = None
-                matches = True
-                fullpath = None
-                for criterion in self.criteria:
-                    if fstat is None and criterion.requires() & _REQUIRES_STAT:
-                        fullpath = os.path.join(dirpath, name)
-                        fstat = os.stat(fullpath)
-                    if not criterion.match(dirpath, name, fstat):
-                        matches = False
-                        break
-                if matches:
-                    if fullpath is None:
-                        fullpath = os.path.join(dirpath, name)
-                    for action in self.actions:
-                        if (fstat is None and
-                            action.requires() & _REQUIRES_STAT):
-                            fstat = os.stat(fullpath)
-                        result = action.execute(fullpath, fstat)
-                        if result is not None:
-                            yield result
+        if self.threads > 1:
+            for result in self._find_parallel(path):
+                yield result
+            return
+        pending = [path]
+        while pending:
+            results, dirs = self._scan(pending.pop())
+            for result in results:
+                yield result
+            pending.extend(reversed(dirs))
+
+    def _find_parallel(self, path):
+        '''
+        Walk the subdirectories with a pool of threads, the results come in
+        no particular order
+        '''
+        pending = collections.deque([path])
+        results = Queue.Queue()
+        cond = threading.Condition()
+        # The number of directories being scanned, and if the walk stopped
+        state = {'busy': 0, 'stop': False}
+
+        def _walk():
+            while True:
+                with cond:
+                    while not pending and state['busy'] and not state['stop']:
+                        cond.wait()
+                    if not pending or state['stop']:
+                        cond.notify_all()
+                        # Tell the consumer that this thread is done
+                        results.put(None)
+                        return
+                    dirpath = pending.popleft()
+                    state['busy'] += 1
+                dirs = []
+                try:
+                    ret, dirs = self._scan(dirpath)
+                    results.put(ret)
+                except Exception as exc:
+                    results.put(exc)
+                finally:
+                    with cond:
+                        pending.extend(dirs)
+                        state['busy'] -= 1
+                        cond.notify_all()
+
+        threads = [threading.Thread(target=_walk)
+                   for ind in range(self.threads)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            done = 0
+            while done < len(threads):
+                ret = results.get()
+                if ret is None:
+                    done += 1
+                    continue
+                if isinstance(ret, Exception):
+                    raise ret
+                for result in ret:
+                    yield result
+        finally:
+            with cond:
+                state['stop'] = True
+                cond.notify_all()
 
 
 def find(path, options):
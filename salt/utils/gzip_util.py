@@ -6,9 +6,21 @@
 '''
 
 # Import python libs
+import os
 import gzip
+import zlib
 import StringIO
 
+# Import salt libs
+import salt.utils
+
+# Extensions of files which are already compressed
+COMPRESSED_EXTS = frozenset([
+    '.7z', '.bz2', '.deb', '.gif', '.gz', '.jar', '.jpeg', '.jpg', '.lz4',
+    '.lzma', '.mp3', '.mp4', '.png', '.rpm', '.tbz2', '.tgz', '.txz',
+    '.xz', '.zip', '.zst',
+])
+
 
 class GzipFile(gzip.GzipFile):
     def __init__(self, filename=None, mode=None,
@@ -59,3 +71,32 @@ def uncompress(data):
     with open_fileobj(buffer, 'rb') as gz:
         unc = gz.read()
         return unc
+
+
+def compressible(path, sample_size=65536, max_ratio=0.9):
+    '''
+    Return False for files which will not compress, files with the extension
+    of a compressed format and files whose first block does not shrink below
+    max_ratio of its size at the fastest level are skipped
+    '''
+    if os.path.splitext(path)[1].lower() in COMPRESSED_EXTS:
+        return False
+    with salt.utils.fopen(path, 'rb') as fp_:
+        sample = fp_.read(sample_size)
+    if not sample:
+        return False
+    return len(zlib.compress(sample, 1)) < len(sample) * max_ratio
+
+
+def compress_file(src, dest, compresslevel=1, chunk_size=65536):
+    '''
+    Compress the file at src into a single zlib stream at dest, one
+    compressor is used for the whole file so every chunk benefits from the
+    data before it
+    '''
+    comp = zlib.compressobj(compresslevel)
+    with salt.utils.fopen(src, 'rb') as src_fp:
+        with salt.utils.fopen(dest, 'wb') as dest_fp:
+            for chunk in iter(lambda: src_fp.read(chunk_size), ''):
+                dest_fp.write(comp.compress(chunk))
+            dest_fp.write(comp.flush())
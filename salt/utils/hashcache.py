@@ -0,0 +1,149 @@
+'''
+Cache the hashes of files, a hash is used as long as the inode, size, mtime
+and ctime of the file did not change. The cache is kept in the cachedir so that
+it is shared by the processes of the minion or master and survives restarts
+'''
+
+# Import python libs
+import os
+import time
+import logging
+
+# Import salt libs
+import salt.payload
+import salt.utils
+
+log = logging.getLogger(__name__)
+
+# The caches by file, they are kept here because the loader reloads the
+# execution modules
+CACHES = {}
+
+# Seconds between two writes of the cache file
+FLUSH_INTERVAL = 1
+
+
+def get_cache(opts):
+    '''
+    Return the hash cache of the cachedir in the opts, the cache is only
+    kept in memory when there is no cachedir
+    '''
+    path = None
+    if opts.get('cachedir'):
+        path = os.path.join(opts['cachedir'], 'hash_cache.p')
+    if not path in CACHES:
+        CACHES[path] = HashCache(
+                path,
+                opts.get('hash_cache_size', 100000),
+                opts.get('serial', 'msgpack'))
+    return CACHES[path]
+
+
+class HashCache(object):
+    '''
+    Map the path and hash type of files to their hash, the entries are
+    stored as [ino, size, mtime, ctime, hash, last use]
+    '''
+    def __init__(self, path=None, size=100000, serial='msgpack'):
+        self.path = path
+        self.size = size
+        self.serial = salt.payload.Serial(serial)
+        self.entries = {}
+        # The stat of the cache file when it was last read
+        self.stat = None
+        self.dirty = False
+        self.flushed = 0
+
+    def _file_stat(self):
+        '''
+        Return the mtime and size of the cache file
+        '''
+        try:
+            fstat = os.stat(self.path)
+        except OSError:
+            return None
+        return (fstat.st_mtime, fstat.st_size)
+
+    def _load(self):
+        '''
+        Merge the entries written by other processes, the entries of this
+        process win
+        '''
+        if self.path is None:
+            return
+        stat = self._file_stat()
+        if stat is None or stat == self.stat:
+            return
+        self.stat = stat
+        try:
+            with salt.utils.fopen(self.path, 'rb') as fp_:
+                entries = self.serial.load(fp_)
+        except Exception:
+            log.debug('Failed to read the hash cache {0}'.format(self.path))
+            return
+        if not isinstance(entries, dict):
+            return
+        # Drop the entries of older versions, which did not store the ctime
+        for key in [key for key in entries if len(entries[key]) != 6]:
+            entries.pop(key)
+        entries.update(self.entries)
+        self.entries = entries
+
+    def flush(self):
+        '''
+        Write the cache file
+        '''
+        self.flushed = time.time()
+        if self.path is None or not self.dirty:
+            return
+        self._load()
+        if len(self.entries) > self.size:
+            # Drop the least recently used half
+            keys = sorted(self.entries, key=lambda x: self.entries[x][5])
+            for key in keys[:len(keys) - self.size // 2]:
+                self.entries.pop(key)
+        tmp = '{0}.{1}'.format(self.path, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            with salt.utils.fopen(tmp, 'w+b') as fp_:
+                self.serial.dump(self.entries, fp_)
+            os.rename(tmp, self.path)
+        except (IOError, OSError) as exc:
+            log.debug('Failed to write the hash cache {0}: {1}'.format(
+                self.path, exc))
+            return
+        self.dirty = False
+        self.stat = self._file_stat()
+
+    def get_hash(self, path, form='md5'):
+        '''
+        Return the hexdigest of a file, the file is only read when it changed
+        since it was last hashed
+        '''
+        fstat = os.stat(path)
+        key = '{0}:{1}'.format(form, path)
+        # The ctime also changes when the mtime was set back, like with
+        # touch -r or an extracted archive
+        stat = [fstat.st_ino, fstat.st_size, fstat.st_mtime, fstat.st_ctime]
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is None or list(entry[:4]) != stat:
+            self._load()
+            entry = self.entries.get(key)
+        if entry is not None and list(entry[:4]) == stat:
+            hsum = entry[4]
+            # The last use is written out so that the eviction in flush
+            # sees the use by every process
+            entry[5] = now
+        else:
+            hsum = salt.utils.get_hash(path, form)
+            if now - fstat.st_mtime < 1:
+                # The file can still change without a change of the mtime
+                self.entries.pop(key, None)
+                return hsum
+            self.entries[key] = stat + [hsum, now]
+        self.dirty = True
+        if now - self.flushed >= FLUSH_INTERVAL:
+            self.flush()
+        return hsum
@@ -755,6 +755,15 @@ class SaltCMDOptionParser(OptionParser, ConfigDirMixIn, TimeoutMixIn,
                   'of minions to batch at a time, or the percentage of '
                   'minions to have running')
         )
+        self.add_option(
+            '--batch-ping',
+            default=False,
+            dest='batch_ping',
+            action='store_true',
+            help=('Ping the targeted minions to find the ones which are up '
+                  'before a batch run, by default the minions are read from '
+                  'the accepted keys and the minion data cache')
+        )
         self.add_option(
             '-a', '--auth', '--eauth', '--extended-auth',
             default='',
@@ -1,4 +1,5 @@
 # Import Python libs
+import errno
 import logging
 import os
 import signal
@@ -71,3 +72,18 @@ def clean_proc(proc, wait_for_kill=10):
         # Catch AttributeError when the process dies between proc.is_alive()
         # and proc.terminate() and turns into a NoneType
         pass
+
+
+def os_is_running(pid):
+    '''
+    Use OS facilities to determine if a process is running
+    '''
+    if sys.platform.startswith('win'):
+        # Signal 0 terminates the process on Windows, assume it is alive
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except OSError as exc:
+        # EPERM means the process exists but belongs to another user
+        return exc.errno == errno.EPERM
+    return True
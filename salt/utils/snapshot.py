@@ -0,0 +1,70 @@
+'''
+Cache the results of queries against system databases, like the package
+database or the state of the services, for the modules which query them
+repeatedly
+'''
+
+# Import python libs
+import os
+import time
+
+# The snapshots by name, they are kept here because the loader reloads the
+# execution modules, the pkg providers are reloaded after each pkg state
+SNAPSHOTS = {}
+
+
+def snapshot(name, paths, ttl=None):
+    '''
+    Return the named snapshot, it is created on the first call
+    '''
+    if not name in SNAPSHOTS:
+        SNAPSHOTS[name] = Snapshot(paths, ttl)
+    return SNAPSHOTS[name]
+
+
+class Snapshot(object):
+    '''
+    Hold the results of database queries, the results are dropped
+    when one of the watched paths changes, when the snapshot is older than
+    the ttl or when it is cleared after the module changed the database
+    '''
+    def __init__(self, paths, ttl=None):
+        self.paths = paths
+        self.ttl = ttl
+        self.key = None
+        self.start = 0
+        self.data = {}
+
+    def _key(self):
+        '''
+        Return the mtime and size of the watched paths
+        '''
+        key = []
+        for path in self.paths:
+            try:
+                fstat = os.stat(path)
+            except OSError:
+                key.append(None)
+                continue
+            key.append((fstat.st_mtime, fstat.st_size))
+        return key
+
+    def get(self):
+        '''
+        Return the dict of the cached query results
+        '''
+        key = self._key()
+        now = time.time()
+        if key != self.key or (
+                self.ttl is not None and now - self.start > self.ttl):
+            self.key = key
+            self.start = now
+            self.data = {}
+        return self.data
+
+    def clear(self):
+        '''
+        Drop the cached query results
+        '''
+        self.key = None
+        self.data = {}
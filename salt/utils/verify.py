@@ -269,7 +269,14 @@ def check_parent_dirs(fname, user='root'):
             raise SaltClientError(msg)
 
 
-def check_max_open_files(opts):
+def check_max_open_files(opts, store=None):
+    '''
+    Log if the accepted keys come close to the max open files limit, the keys
+    are counted with the key store passed in or a new one
+    '''
+    if store is None:
+        import salt.key
+        store = salt.key.KeyStore(opts)
     mof_c = opts.get('max_open_files', 100000)
     if sys.platform.startswith('win'):
         # Check the windows api for more detail on this
@@ -279,11 +286,7 @@ def check_max_open_files(opts):
     else:
         mof_s, mof_h = resource.getrlimit(resource.RLIMIT_NOFILE)
 
-    accepted_keys_dir = os.path.join(opts.get('pki_dir'), 'minions')
-    accepted_count = len([
-        key for key in os.listdir(accepted_keys_dir) if
-        os.path.isfile(os.path.join(accepted_keys_dir, key))
-    ])
+    accepted_count = store.count('minions')
 
     log.debug(
         'This salt-master instance has accepted {0} minion keys.'.format(
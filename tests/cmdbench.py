@@ -0,0 +1,77 @@
+'''
+Compare the time spent in the onlyif and unless checks of a highstate when
+every check starts a new shell and when the checks run in the persistent
+shell of the cmd module
+'''
+# Import python libs
+import time
+import optparse
+
+# Import salt libs
+import salt.modules.cmdmod
+import salt.utils.coprocess
+
+
+def parse():
+    '''
+    Parse command line options
+    '''
+    parser = optparse.OptionParser()
+    parser.add_option('-s',
+            '--states',
+            dest='states',
+            default=500,
+            type=int,
+            help='The number of cmd states in the highstate')
+    parser.add_option('-o',
+            '--onlyif',
+            dest='onlyif',
+            default='test -e /etc/passwd',
+            help='The onlyif check of the states')
+    parser.add_option('-u',
+            '--unless',
+            dest='unless',
+            default='test -e /nonexistent',
+            help='The unless check of the states')
+    parser.add_option('--shell',
+            dest='shell',
+            default=salt.modules.cmdmod.DEFAULT_SHELL,
+            help='The shell used to run the checks')
+
+    options, args = parser.parse_args()
+    return options.__dict__
+
+
+def bench(name, opts, coprocess):
+    '''
+    Run the checks of all of the states and print the cost
+    '''
+    salt.modules.cmdmod.__opts__['cmd_coprocess'] = coprocess
+    start = time.time()
+    for ind in range(opts['states']):
+        for check in (opts['onlyif'], opts['unless']):
+            salt.modules.cmdmod.retcode(
+                    check,
+                    shell=opts['shell'],
+                    env={'SALT_STATE': str(ind)})
+    elapsed = time.time() - start
+    print('{0:<20} {1:>10.2f} {2:>10.2f}'.format(
+        name, elapsed, elapsed * 1000 / (opts['states'] * 2)))
+
+
+def run(opts):
+    '''
+    Run the benchmark
+    '''
+    salt.modules.cmdmod.__grains__ = {'os': ''}
+    print('Running the checks of {0} states'.format(opts['states']))
+    print('{0:<20} {1:>10} {2:>10}'.format('', 'total s', 'ms/check'))
+    try:
+        bench('fork per command', opts, False)
+        bench('coprocess', opts, True)
+    finally:
+        salt.utils.coprocess.stop_workers()
+
+
+if __name__ == '__main__':
+    run(parse())
@@ -0,0 +1,110 @@
+'''
+Compare the master CPU time spent to serve files with the per chunk gzip
+compression and with the compressed streams, the results are given in CPU
+seconds per GB served
+'''
+# Import python libs
+import os
+import sys
+import time
+import shutil
+import optparse
+import tempfile
+
+# Import salt libs
+import salt.utils.gzip_util
+
+
+def parse():
+    '''
+    Parse command line options
+    '''
+    parser = optparse.OptionParser()
+    parser.add_option('-f',
+            '--file',
+            dest='file',
+            default=os.path.abspath(sys.executable),
+            help='The file to serve')
+    parser.add_option('-m',
+            '--minions',
+            dest='minions',
+            default=20,
+            type=int,
+            help='The number of minions the file is served to')
+    parser.add_option('-b',
+            '--buffer-size',
+            dest='buffer_size',
+            default=1048576,
+            type=int,
+            help='The file_buffer_size of the master')
+
+    options, args = parser.parse_args()
+    return options.__dict__
+
+
+def chunked(path, buffer_size, level):
+    '''
+    Serve a file once with every chunk gzipped on its own, as the master did
+    '''
+    sent = 0
+    with open(path, 'rb') as fp_:
+        for data in iter(lambda: fp_.read(buffer_size), ''):
+            sent += len(salt.utils.gzip_util.compress(data, level))
+    return sent
+
+
+def stream(path, zpath, buffer_size, level):
+    '''
+    Serve a file once from the compressed stream, the stream is written on
+    the first call
+    '''
+    if not os.path.isfile(zpath):
+        salt.utils.gzip_util.compress_file(path, zpath, level)
+    sent = 0
+    with open(zpath, 'rb') as fp_:
+        for data in iter(lambda: fp_.read(buffer_size), ''):
+            sent += len(data)
+    return sent
+
+
+def bench(name, func, minions, size):
+    '''
+    Run a serve function once per minion and print the cost
+    '''
+    start = time.clock()
+    for ind in range(minions):
+        sent = func()
+    cpu = time.clock() - start
+    served = float(size * minions) / 1024 ** 3
+    print('{0:<20} {1:>10.2f} {2:>10.2%}'.format(
+        name, cpu / served, float(sent) / size))
+
+
+def run(opts):
+    '''
+    Run the benchmark
+    '''
+    path = opts['file']
+    size = os.path.getsize(path)
+    tmp = tempfile.mkdtemp()
+    print('Serving {0} ({1} bytes) to {2} minions'.format(
+        path, size, opts['minions']))
+    print('{0:<20} {1:>10} {2:>10}'.format('', 'CPU s/GB', 'ratio'))
+    try:
+        for level in (9, 1):
+            bench('gzip chunks {0}'.format(level),
+                  lambda: chunked(path, opts['buffer_size'], level),
+                  opts['minions'],
+                  size)
+        for level in (9, 1):
+            zpath = os.path.join(tmp, str(level))
+            bench('stream {0}'.format(level),
+                  lambda: stream(path, zpath, opts['buffer_size'], level),
+                  opts['minions'],
+                  size)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    run(parse())
@@ -52,10 +52,7 @@ def listen(sock_dir, node):
             node,
             sock_dir,
             )
-    while True:
-        ret = event.get_event(full=True)
-        if ret is None:
-            continue
+    for ret in event.iter_events(full=True):
         print('Event fired at {0}'.format(time.asctime()))
         print('*' * 25)
         print('Tag: {0}'.format(ret['tag']))
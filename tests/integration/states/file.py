@@ -150,6 +150,45 @@ class FileTest(integration.ModuleCase):
         self.assertTrue(result)
         shutil.rmtree(name, ignore_errors=True)
 
+    def test_recurse_unchanged(self):
+        '''
+        file.recurse only updates the files which changed
+        '''
+        name = os.path.join(integration.TMP, 'recurse_unchanged_dir')
+        self.run_state('file.recurse', name=name, source='salt://grail')
+        ret = self.state_result(self.run_state(
+            'file.recurse', name=name, source='salt://grail'), raw=True)
+        self.assertTrue(ret['result'])
+        self.assertFalse(ret['changes'])
+        self.assertIn('unchanged, 0 updated', ret['comment'])
+        scene = os.path.join(name, '36', 'scene')
+        with salt.utils.fopen(scene, 'w+') as fp_:
+            fp_.write('changed')
+        ret = self.state_result(self.run_state(
+            'file.recurse', name=name, source='salt://grail'), raw=True)
+        self.assertTrue(ret['result'])
+        self.assertEqual(list(ret['changes']), [scene])
+        self.assertIn('unchanged, 1 updated', ret['comment'])
+        self.assertNotEqual(
+            salt.utils.fopen(scene, 'r').read(), 'changed')
+        shutil.rmtree(name, ignore_errors=True)
+
+    def test_recurse_unchanged_mode(self):
+        '''
+        file.recurse skips the files in place when file_mode was parsed by
+        YAML into an int
+        '''
+        name = os.path.join(integration.TMP, 'recurse_unchanged_mode_dir')
+        self.run_state(
+            'file.recurse', name=name, source='salt://grail', file_mode=0644)
+        ret = self.state_result(self.run_state(
+            'file.recurse', name=name, source='salt://grail', file_mode=0644),
+            raw=True)
+        self.assertTrue(ret['result'])
+        self.assertFalse(ret['changes'])
+        self.assertIn('unchanged, 0 updated, 0 failed', ret['comment'])
+        shutil.rmtree(name, ignore_errors=True)
+
     def test_test_recurse(self):
         '''
         file.recurse test interface
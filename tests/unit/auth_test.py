@@ -0,0 +1,93 @@
+'''
+Test the token cache of the external authentication
+'''
+# Import python libs
+import os
+import time
+import shutil
+import tempfile
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+import salt.auth
+import salt.utils
+import salt.payload
+
+
+class TokenCacheTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.opts = {'token_dir': self.tmp, 'serial': 'msgpack'}
+        self.serial = salt.payload.Serial(self.opts)
+        # The loader is not needed to read the tokens
+        self.auth = object.__new__(salt.auth.LoadAuth)
+        self.auth.opts = self.opts
+        self.auth.serial = self.serial
+        self.auth.tokens = {}
+        self.auth.evict = []
+        self.recheck = salt.auth.TOKEN_RECHECK
+
+    def tearDown(self):
+        salt.auth.TOKEN_RECHECK = self.recheck
+        shutil.rmtree(self.tmp)
+
+    def _token(self, tok, expire):
+        '''
+        Write a token file which expires in expire seconds
+        '''
+        tdata = {'start': time.time(),
+                 'expire': time.time() + expire,
+                 'name': 'fred',
+                 'eauth': 'pam'}
+        with salt.utils.fopen(os.path.join(self.tmp, tok), 'w+') as fp_:
+            fp_.write(self.serial.dumps(tdata))
+
+    def test_expire(self):
+        self._token('tok', 0.2)
+        self.assertEqual(self.auth.get_tok('tok')['name'], 'fred')
+        self.assertIn('tok', self.auth.tokens)
+        time.sleep(0.3)
+        # The expired token is evicted and its file removed
+        self.assertEqual(self.auth.get_tok('tok'), {})
+        self.assertEqual(self.auth.tokens, {})
+        self.assertEqual(self.auth.evict, [])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, 'tok')))
+
+    def test_evict(self):
+        salt.auth.TOKEN_RECHECK = 0.2
+        for ind in range(20):
+            tok = 'tok{0}'.format(ind)
+            self._token(tok, 3600)
+            self.auth.get_tok(tok)
+        self.assertEqual(len(self.auth.tokens), 20)
+        time.sleep(0.3)
+        # Looking up any token drops the entries which are due
+        self.assertEqual(self.auth.get_tok('missing'), {})
+        self.assertEqual(self.auth.tokens, {})
+        self.assertEqual(self.auth.evict, [])
+
+    def test_revoke(self):
+        salt.auth.TOKEN_RECHECK = 0.2
+        self._token('tok', 3600)
+        self.assertEqual(self.auth.get_tok('tok')['name'], 'fred')
+        os.remove(os.path.join(self.tmp, 'tok'))
+        # The removed token is noticed within TOKEN_RECHECK
+        self.assertEqual(self.auth.get_tok('tok')['name'], 'fred')
+        time.sleep(0.3)
+        self.assertEqual(self.auth.get_tok('tok'), {})
+        self.assertEqual(self.auth.tokens, {})
+
+    def test_reread(self):
+        salt.auth.TOKEN_RECHECK = 0.2
+        self._token('tok', 3600)
+        self.auth.get_tok('tok')
+        time.sleep(0.3)
+        # A valid token is read again and cached once more
+        self.assertEqual(self.auth.get_tok('tok')['name'], 'fred')
+        self.assertEqual(len(self.auth.evict), 1)
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(TokenCacheTestCase)
+    TextTestRunner(verbosity=1).run(tests)
@@ -0,0 +1,170 @@
+'''
+Test the sliding window of the batch runs
+'''
+# Import python libs
+import sys
+import time
+import shutil
+import tempfile
+from cStringIO import StringIO
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+import salt.output
+import salt.cli.batch
+
+
+class FakeEvent(object):
+    '''
+    Hand out the queued events one at a time and log the returns
+    '''
+    def __init__(self, log):
+        self.cpub = True
+        self.queue = []
+        self.log = log
+
+    def subscribe(self, tag):
+        pass
+
+    def unsubscribe(self, tag):
+        pass
+
+    def get_events(self, max_n=100, wait=5, tag='', full=False):
+        if not self.queue:
+            time.sleep(0.01)
+            return []
+        raw = self.queue.pop(0)
+        self.log.append(('return', [raw['data']['id']]))
+        return [raw]
+
+
+class FakeLocal(object):
+    '''
+    Publish the jobs to fake minions, the minions in returns answer their
+    job and the minions in running answer the running checks in turn, with
+    their job when the answer is True and with no job otherwise
+    '''
+    def __init__(self, returns=(), running=None):
+        self.returns = returns
+        self.running = running or {}
+        self.log = []
+        self.event = FakeEvent(self.log)
+        self.jobs = {}
+
+    def run_job(self, tgt, fun, arg=(), expr_form='glob', ret='',
+                timeout=None, **kwargs):
+        jid = str(len(self.log))
+        self.log.append((fun, list(tgt)))
+        for minion in tgt:
+            if fun == 'saltutil.running':
+                if not self.running.get(minion):
+                    continue
+                data = []
+                if self.running[minion].pop(0):
+                    data = [{'jid': self.jobs[minion]}]
+            elif minion in self.returns:
+                data = True
+            else:
+                self.jobs[minion] = jid
+                continue
+            self.event.queue.append(
+                    {'tag': jid, 'data': {'id': minion, 'return': data}})
+        return {'jid': jid, 'minions': list(tgt)}
+
+
+class BatchTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.display = salt.output.display_output
+        self.running = salt.cli.batch.RUNNING_TIMEOUT
+        self.displayed = []
+        salt.output.display_output = (
+                lambda data, out, opts: self.displayed.append(data))
+        salt.cli.batch.RUNNING_TIMEOUT = 0.1
+
+    def tearDown(self):
+        salt.output.display_output = self.display
+        salt.cli.batch.RUNNING_TIMEOUT = self.running
+        shutil.rmtree(self.tmp)
+
+    def _run(self, minions, local, batch='2'):
+        '''
+        Run the batch with the fake client, the output is thrown away
+        '''
+        batch_ = object.__new__(salt.cli.batch.Batch)
+        batch_.opts = {'batch': batch,
+                       'timeout': 0.1,
+                       'fun': 'test.ping',
+                       'arg': [],
+                       'cachedir': self.tmp,
+                       'hash_type': 'md5'}
+        batch_.local = local
+        batch_.minions = minions
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            return batch_.run()
+        finally:
+            sys.stdout = stdout
+
+    def test_refill(self):
+        minions = ['m{0}'.format(ind) for ind in range(5)]
+        local = FakeLocal(returns=minions)
+        ret = self._run(minions, local)
+        self.assertEqual(ret, dict((minion, True) for minion in minions))
+        # The window is filled and a new minion starts as each one returns
+        self.assertEqual(
+                local.log,
+                [('test.ping', ['m0']),
+                 ('test.ping', ['m1']),
+                 ('return', ['m0']),
+                 ('test.ping', ['m2']),
+                 ('return', ['m1']),
+                 ('test.ping', ['m3']),
+                 ('return', ['m2']),
+                 ('test.ping', ['m4']),
+                 ('return', ['m3']),
+                 ('return', ['m4'])])
+        self.assertEqual(
+                [data.keys()[0] for data in self.displayed], minions)
+
+    def test_expire(self):
+        # m1 is still running at the first check and gone at the second one
+        local = FakeLocal(returns=('m0', 'm2', 'm3'),
+                          running={'m1': [True]})
+        start = time.time()
+        ret = self._run(['m0', 'm1', 'm2', 'm3'], local)
+        self.assertEqual(ret['m1'], 'Minion did not return')
+        self.assertEqual(ret['m3'], True)
+        # m2 and m3 ran while m1 was checked
+        self.assertEqual(
+                local.log,
+                [('test.ping', ['m0']),
+                 ('test.ping', ['m1']),
+                 ('return', ['m0']),
+                 ('test.ping', ['m2']),
+                 ('return', ['m2']),
+                 ('test.ping', ['m3']),
+                 ('return', ['m3']),
+                 ('saltutil.running', ['m1']),
+                 ('return', ['m1']),
+                 ('saltutil.running', ['m1'])])
+        # Two timeouts and the two checks
+        self.assertTrue(time.time() - start < 2)
+
+    def test_done(self):
+        # A minion which is no longer running the job is not waited on
+        local = FakeLocal(running={'m0': [False, True]})
+        ret = self._run(['m0'], local)
+        self.assertEqual(ret['m0'], 'Minion did not return')
+        self.assertEqual(
+                local.log,
+                [('test.ping', ['m0']),
+                 ('saltutil.running', ['m0']),
+                 ('return', ['m0'])])
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(BatchTestCase)
+    TextTestRunner(verbosity=1).run(tests)
@@ -0,0 +1,50 @@
+'''
+Test the thread pool which fetches files from the master
+'''
+# Import python libs
+import time
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+import salt.fileclient
+from salt.exceptions import MinionError
+
+
+class FetchClient(salt.fileclient.RemoteClient):
+    '''
+    A remote client which fetches nothing, the paths in fail raise
+    '''
+    def __init__(self, fail=()):
+        self.opts = {'master_uri': 'tcp://127.0.0.1:4506',
+                     'file_fetch_threads': 4}
+        self.fail = fail
+
+    def cache_file(self, path, env='base'):
+        time.sleep(0.001)
+        if path in self.fail:
+            raise MinionError('Failed to fetch {0}'.format(path))
+        salt.fileclient._count('bytes_received', 1)
+        return path
+
+
+class FetchFilesTestCase(TestCase):
+    def test_counters(self):
+        paths = ['file{0}'.format(ind) for ind in range(200)]
+        before = salt.fileclient.TRANSFER_STATS['bytes_received']
+        ret = FetchClient()._fetch_files(paths)
+        self.assertEqual(len(ret), 200)
+        self.assertEqual(ret['file7'], 'salt://file7')
+        self.assertEqual(
+                salt.fileclient.TRANSFER_STATS['bytes_received'] - before,
+                200)
+
+    def test_error(self):
+        paths = ['file{0}'.format(ind) for ind in range(20)]
+        client = FetchClient(fail=('salt://file3',))
+        self.assertRaises(MinionError, client._fetch_files, paths)
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(FetchFilesTestCase)
+    TextTestRunner(verbosity=1).run(tests)
@@ -0,0 +1,162 @@
+# Import python libs
+import os
+import sys
+import shutil
+import tempfile
+from cStringIO import StringIO
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+import salt.key
+import salt.output
+
+
+class FakeEvent(object):
+    '''
+    Record the fired events instead of sending them to the master
+    '''
+    def __init__(self):
+        self.fired = []
+
+    def fire_event(self, data, tag=''):
+        self.fired.append((tag, data))
+        return True
+
+
+class TestKeyStore(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for status in salt.key.KEY_DIRS:
+            os.makedirs(os.path.join(self.tmpdir, status))
+        self.store = salt.key.KeyStore({'pki_dir': self.tmpdir})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_index(self):
+        for name in ('web1', 'web2', 'db1'):
+            self.store.add('minions_pre', name, 'pub')
+        self.assertEqual(self.store.count('minions_pre'), 3)
+        self.assertEqual(
+            self.store.match('web*'), {'minions_pre': ['web1', 'web2']})
+        self.assertEqual(self.store.match('db1'), {'minions_pre': ['db1']})
+        self.assertEqual(self.store.match('db2'), {})
+        # Keys written by other processes are picked up
+        with open(os.path.join(self.tmpdir, 'minions_pre', 'db2'), 'w') as fp_:
+            fp_.write('pub')
+        self.assertTrue(self.store.check('minions_pre', 'db2'))
+
+    def test_move(self):
+        for name in ('web1', 'web2', 'db1'):
+            self.store.add('minions_pre', name, 'pub')
+        moved = self.store.move(
+            ['web1', 'web2', 'gone'], 'minions_pre', 'minions')
+        self.assertEqual(moved, ['web1', 'web2'])
+        self.assertEqual(
+            self.store.list_keys(),
+            {'minions': ['web1', 'web2'],
+             'minions_pre': ['db1'],
+             'minions_rejected': []})
+        self.assertEqual(self.store.remove(['web1'], 'minions'), ['web1'])
+        self.assertFalse(self.store.check('minions', 'web1'))
+
+
+class TestKey(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for status in salt.key.KEY_DIRS:
+            os.makedirs(os.path.join(self.tmpdir, status))
+        self.opts = {
+            'pki_dir': self.tmpdir,
+            'sock_dir': self.tmpdir,
+            'extension_modules': self.tmpdir,
+            'yes': True,
+            'color': False}
+        self.key = salt.key.Key(self.opts)
+        self.key.event = FakeEvent()
+        for name in ('web1', 'web2', 'db1', 'db2'):
+            self.key.store.add('minions_pre', name, 'pub')
+
+    def tearDown(self):
+        salt.key.STORES.pop(self.tmpdir, None)
+        shutil.rmtree(self.tmpdir)
+
+    def test_accept_reject(self):
+        self.assertEqual(self.key.accept('web*'), {'minions': ['web1', 'web2']})
+        self.assertEqual(
+            self.key.reject('db1'), {'minions_rejected': ['db1']})
+        self.assertEqual(
+            [(data['act'], data['id']) for tag, data in self.key.event.fired],
+            [('accept', 'web1'), ('accept', 'web2'), ('reject', 'db1')])
+        self.assertEqual(
+            self.key.accept_all()['minions'], ['db2', 'web1', 'web2'])
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.tmpdir, 'minions'))),
+            ['db2', 'web1', 'web2'])
+
+    def test_delete(self):
+        self.key.reject_all()
+        self.assertEqual(
+            self.key.delete_key('web*')['minions_rejected'], ['db1', 'db2'])
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.tmpdir, 'minions_rejected'))),
+            ['db1', 'db2'])
+        self.assertEqual(
+            self.key.delete_all(),
+            {'minions': [], 'minions_pre': [], 'minions_rejected': []})
+
+    def _run_cli(self, opts):
+        '''
+        Run the key command line with the given opts and return its output
+        '''
+        cli = salt.key.KeyCLI(opts)
+        cli.key.event = FakeEvent()
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            cli.run()
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_cli(self):
+        opts = dict(self.opts)
+        for opt in ('gen_keys', 'list', 'list_all', 'print', 'print_all',
+                    'accept', 'accept_all', 'reject', 'reject_all', 'delete',
+                    'delete_all', 'finger', 'finger_all'):
+            opts[opt] = False
+        opts['accept'] = 'web*'
+        self.assertEqual(
+            sorted(self._run_cli(opts).splitlines()),
+            ['Key for minion web1 accepted.', 'Key for minion web2 accepted.'])
+        opts['accept'] = 'nothing'
+        self.assertEqual(
+            self._run_cli(opts), 'The key glob nothing does not match any '
+            'unaccepted keys.\n')
+        opts['accept'] = False
+        opts['reject_all'] = True
+        self.assertEqual(self._run_cli(opts), '')
+        opts['reject_all'] = False
+        opts['delete'] = 'db1'
+        self.assertEqual(self._run_cli(opts), '')
+        opts['delete'] = 'db1'
+        self.assertEqual(self._run_cli(opts), 'No keys to delete.\n')
+        opts['delete'] = False
+        opts['list_all'] = True
+        out = self._run_cli(opts)
+        self.assertEqual(
+            self.key.list_keys(),
+            {'minions': ['web1', 'web2'],
+             'minions_pre': [],
+             'minions_rejected': ['db2']})
+        for name in ('web1', 'web2', 'db2'):
+            self.assertIn(name, out)
+        self.assertNotIn('db1', out)
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(TestKeyStore)
+    tests.addTests(loader.loadTestsFromTestCase(TestKey))
+    TextTestRunner(verbosity=1).run(tests)
@@ -0,0 +1,348 @@
+'''
+Test the job cache writer of the master
+'''
+# Import python libs
+import os
+import pwd
+import time
+import zlib
+import shutil
+import tempfile
+
+# Import third party libs
+import zmq
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+import salt.utils
+import salt.payload
+import salt.master
+
+
+class JobCacheWriterTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.opts = {
+                'sock_dir': self.tmp,
+                'cachedir': self.tmp,
+                'hash_type': 'md5',
+                'serial': 'msgpack',
+                'job_cache_flush_interval': 60,
+                'job_cache_batch_size': 500,
+                'job_cache_fsync': False}
+        self.serial = salt.payload.Serial(self.opts)
+        self.jid = salt.utils.prep_jid(self.tmp, 'md5')
+        self.jid_dir = salt.utils.jid_dir(self.jid, self.tmp, 'md5')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _load(self, id_):
+        return {'jid': self.jid, 'id': id_, 'return': id_}
+
+    def test_commit(self):
+        writer = salt.master.JobCacheWriter(self.opts)
+        writer.commit([self._load('minion{0}'.format(ind))
+                       for ind in range(20)])
+        for ind in range(20):
+            path = os.path.join(
+                    self.jid_dir, 'minion{0}'.format(ind), 'return.p')
+            with salt.utils.fopen(path, 'rb') as fp_:
+                self.assertEqual(
+                        self.serial.load(fp_), 'minion{0}'.format(ind))
+        # No temporary files are left behind
+        self.assertEqual(
+                os.listdir(os.path.join(self.jid_dir, 'minion0')),
+                ['return.p'])
+
+    def test_sync(self):
+        self.opts['job_cache_fsync'] = True
+        writer = salt.master.JobCacheWriter(self.opts)
+        synced = []
+
+        def sync(paths):
+            # The write tag is still in place while the batch is synced
+            self.assertTrue(os.path.isfile(wtag))
+            synced.append(paths)
+            salt.master.sync_paths(paths, 4)
+        writer.sync = sync
+        wtag = os.path.join(self.jid_dir, 'wtag_minion0')
+        open(wtag, 'w+').close()
+        batch = [self._load('minion{0}'.format(ind)) for ind in range(10)]
+        batch[3]['out'] = 'txt'
+        batch.append({'wtag': wtag})
+        writer.commit(batch)
+        # One pass for the whole batch, the files before the directories
+        self.assertEqual(len(synced), 1)
+        self.assertEqual(len(synced[0]), 11 + 10 + 1)
+        self.assertEqual(
+                synced[0][:2],
+                [os.path.join(self.jid_dir, 'minion0', 'return.p'),
+                 os.path.join(self.jid_dir, 'minion1', 'return.p')])
+        self.assertEqual(synced[0][-1], os.path.join(self.jid_dir, 'minion9'))
+        self.assertIn(self.jid_dir, synced[0][11:])
+        self.assertFalse(os.path.exists(wtag))
+        # Without fsync nothing is synced
+        self.opts['job_cache_fsync'] = False
+        writer.commit([self._load('minion10')])
+        self.assertEqual(len(synced), 1)
+
+    def test_sigterm(self):
+        writer = salt.master.JobCacheWriter(self.opts)
+        writer.start()
+        context = zmq.Context(1)
+        push = context.socket(zmq.PUSH)
+        push.setsockopt(zmq.LINGER, 1000)
+        push.connect('ipc://{0}'.format(
+            os.path.join(self.tmp, 'job_cache_pull.ipc')))
+        for ind in range(10):
+            push.send(self.serial.dumps(self._load('minion{0}'.format(ind))))
+        time.sleep(0.5)
+        writer.terminate()
+        writer.join(10)
+        push.close()
+        context.term()
+        self.assertEqual(writer.exitcode, 0)
+        # The batch was pending, the flush interval is a minute
+        self.assertEqual(len(os.listdir(self.jid_dir)), 11)
+
+
+class ZStreamTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'file.txt')
+        with salt.utils.fopen(self.path, 'w+') as fp_:
+            fp_.write('salt ' * 100000)
+        self.funcs = object.__new__(salt.master.AESFuncs)
+        self.funcs.opts = {'cachedir': self.tmp}
+        self.funcs.compress_cache = {}
+        self.funcs.zstream_jobs = {}
+        self.zstream = self.funcs._AESFuncs__zstream
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _wait(self):
+        for job in self.funcs.zstream_jobs.values():
+            job.join(10)
+
+    def test_background(self):
+        # The file is sent uncompressed while the stream is written
+        self.assertEqual(self.zstream(self.path, 'a', 1), '')
+        self.assertEqual(len(self.funcs.zstream_jobs), 1)
+        self._wait()
+        zpath = self.zstream(self.path, 'a', 1)
+        self.assertEqual(os.path.basename(zpath), 'a.1')
+        with salt.utils.fopen(zpath, 'rb') as fp_:
+            self.assertEqual(zlib.decompress(fp_.read()), 'salt ' * 100000)
+        # Only the streams of the file are kept in its directory
+        zdir = os.path.dirname(zpath)
+        self.assertEqual(os.listdir(zdir), ['a.1'])
+        self.zstream(self.path, 'a', 9)
+        self._wait()
+        self.zstream(self.path, 'b', 1)
+        self._wait()
+        self.assertEqual(sorted(os.listdir(zdir)), ['a.9', 'b.1'])
+
+    def test_busy(self):
+        zpath = self.funcs._AESFuncs__zstream_path(self.path, 'a', 1)
+        os.makedirs(os.path.dirname(zpath))
+        # Another worker is writing the stream, a dead one left its file
+        with salt.utils.fopen('{0}.{1}'.format(zpath, os.getppid()), 'w+'):
+            pass
+        pid = 65535
+        while os.path.exists('/proc/{0}'.format(pid)):
+            pid -= 1
+        dead = '{0}.{1}'.format(zpath, pid)
+        with salt.utils.fopen(dead, 'w+'):
+            pass
+        self.assertEqual(self.zstream(self.path, 'a', 1), '')
+        self.assertEqual(self.funcs.zstream_jobs, {})
+        os.remove('{0}.{1}'.format(zpath, os.getppid()))
+        self.assertEqual(self.zstream(self.path, 'a', 1), '')
+        self._wait()
+        self.assertFalse(os.path.exists(dead))
+        self.assertEqual(self.zstream(self.path, 'a', 1), zpath)
+
+
+class FakeSocket(object):
+    '''
+    Hand out queued multipart messages and record the sent ones
+    '''
+    def __init__(self):
+        self.inbox = []
+        self.sent = []
+
+    def recv_multipart(self):
+        return self.inbox.pop(0)
+
+    def send_multipart(self, frames):
+        self.sent.append(frames)
+
+
+class FakeProc(object):
+    def __init__(self, pid):
+        self.pid = pid
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+
+class ReqServerTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.opts = {'sock_dir': self.tmp,
+                     'interface': '127.0.0.1',
+                     'ret_port': 4506,
+                     'serial': 'msgpack',
+                     'worker_threads': 2,
+                     'worker_lanes': {'file': 1}}
+        self.serial = salt.payload.Serial(self.opts)
+        self.server = salt.master.ReqServer(self.opts, None, None, None)
+        self.server.clients.close()
+        self.server.workers.close()
+        self.server.ctl.close()
+        self.server.clients = FakeSocket()
+        self.server.workers = FakeSocket()
+        # No worker processes are started
+        self.server._ReqServer__spawn = lambda lane: None
+
+    def tearDown(self):
+        self.server.context.term()
+        shutil.rmtree(self.tmp)
+
+    def _client(self, cid, cmd, enc='aes'):
+        '''
+        Send a request from a client to the broker
+        '''
+        if enc == 'clear':
+            payload = {'enc': 'clear', 'load': {'cmd': cmd}}
+        else:
+            payload = {'enc': 'aes', 'load': 'crypted', 'cmd': cmd}
+        self.server.clients.inbox.append(
+                [cid, '', self.serial.dumps(payload)])
+        self.server._ReqServer__handle_client()
+
+    def _worker(self, wid, *body):
+        '''
+        Send a message from a worker to the broker
+        '''
+        self.server.workers.inbox.append([wid, ''] + list(body))
+        self.server._ReqServer__handle_worker()
+
+    def test_lane_name(self):
+        lane_name = self.server._ReqServer__lane_name
+        for cmd, enc, lane in (('_serve_file', 'aes', 'file'),
+                               ('_file_list', 'clear', 'file'),
+                               ('_return', 'aes', 'default'),
+                               ('_no_such_cmd', 'aes', 'default'),
+                               (None, 'aes', 'default')):
+            payload = {'enc': enc, 'load': {'cmd': cmd}}
+            if enc == 'aes':
+                payload = {'enc': enc, 'load': 'crypted', 'cmd': cmd}
+            self.assertEqual(lane_name(self.serial.dumps(payload)), lane)
+        self.assertEqual(lane_name('not a payload'), 'default')
+
+    def test_dispatch(self):
+        self._worker('default-1', 'READY', 'default')
+        self._worker('default-2', 'READY', 'default')
+        self._worker('file-3', 'READY', 'file')
+        self._client('c1', '_return')
+        self._client('c2', '_serve_file')
+        self._client('c3', '_unknown')
+        self._client('c4', '_pillar')
+        sent = self.server.workers.sent
+        # The idle workers of the lane take the requests in turn
+        self.assertEqual(
+                [(frames[0], frames[2]) for frames in sent],
+                [('default-1', 'c1'), ('file-3', 'c2'), ('default-2', 'c3')])
+        default = self.server.lanes['default']
+        self.assertEqual(len(default.queue), 1)
+        self.assertEqual(default.inflight, 2)
+        # A reply goes back to the client and frees the worker for the
+        # queued request
+        self._worker('default-2', 'c3', '', 'reply')
+        self.assertEqual(self.server.clients.sent, [['c3', '', 'reply']])
+        self.assertEqual(sent[-1][0], 'default-2')
+        self.assertEqual(sent[-1][2], 'c4')
+        self.assertEqual(len(default.queue), 0)
+        self.assertEqual(default.stats()['processed'], 1)
+        # A worker of an unknown lane is stopped
+        self._worker('other-4', 'READY', 'other')
+        self.assertEqual(sent[-1], ['other-4', '', 'STOP'])
+
+    def test_worker_dies(self):
+        default = self.server.lanes['default']
+        procs = [FakeProc(1), FakeProc(2)]
+        default.procs = procs
+        self._worker('default-1', 'READY', 'default')
+        self._worker('default-2', 'READY', 'default')
+        self._client('c1', '_return')
+        self.assertEqual(self.server.workers.sent[-1][0], 'default-1')
+        # The busy worker dies mid request
+        procs[0].alive = False
+        self.server._ReqServer__reap()
+        self.assertEqual(default.inflight, 0)
+        self.assertNotIn('default-1', self.server.busy)
+        self.assertEqual(default.workers, set(['default-2']))
+        # New requests only go to the live worker
+        self._client('c2', '_return')
+        self._client('c3', '_return')
+        self.assertEqual(
+                [frames[0] for frames in self.server.workers.sent],
+                ['default-1', 'default-2'])
+        self.assertEqual(len(default.queue), 1)
+
+
+class AutosignTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'autosign.conf')
+        self.funcs = object.__new__(salt.master.ClearFuncs)
+        self.funcs.opts = {'auto_accept': False,
+                           'autosign_file': self.path,
+                           'user': pwd.getpwuid(os.getuid()).pw_name}
+        self.funcs.autosign = (None, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _write(self, data):
+        with salt.utils.fopen(self.path, 'w+') as fp_:
+            fp_.write(data)
+        os.chmod(self.path, 0644)
+
+    def test_reload(self):
+        self._write('web1\n')
+        self.assertTrue(self.funcs._check_autosign('web1'))
+        self.assertFalse(self.funcs._check_autosign('db1'))
+        rules = self.funcs.autosign[1]
+        # The rules are kept while the file is not changed
+        self.assertTrue(self.funcs._check_autosign('web1'))
+        self.assertIs(self.funcs.autosign[1], rules)
+        self._write('db*\n')
+        self.assertTrue(self.funcs._check_autosign('db1'))
+        self.assertFalse(self.funcs._check_autosign('web1'))
+        rules = self.funcs.autosign[1]
+        # A change of the mode alone is noticed as well
+        os.chmod(self.path, 0600)
+        self.assertTrue(self.funcs._check_autosign('db1'))
+        self.assertIsNot(self.funcs.autosign[1], rules)
+
+    def test_blank(self):
+        # Blank lines and comments do not match every key
+        self._write('\n   \n# comment\nweb1\n\n')
+        self.assertTrue(self.funcs._check_autosign('web1'))
+        self.assertFalse(self.funcs._check_autosign('db1'))
+        self.assertFalse(self.funcs._check_autosign(''))
+        self.assertEqual(self.funcs.autosign[1][0], set(['web1']))
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(JobCacheWriterTestCase)
+    tests.addTests(loader.loadTestsFromTestCase(ZStreamTestCase))
+    tests.addTests(loader.loadTestsFromTestCase(ReqServerTestCase))
+    tests.addTests(loader.loadTestsFromTestCase(AutosignTestCase))
+    TextTestRunner(verbosity=1).run(tests)
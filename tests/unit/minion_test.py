@@ -0,0 +1,125 @@
+# Import python libs
+import os
+import time
+import shutil
+import tempfile
+
+# Import third party libs
+import zmq
+
+# Import salt libs
+import salt.minion
+import salt.payload
+import salt.utils.event
+from saltunittest import TestCase, TestLoader, TextTestRunner
+
+
+class JobRegistryTestCase(TestCase):
+
+    def setUp(self):
+        self.registry = salt.minion.JobRegistry({'serial': 'msgpack'})
+        self.serial = salt.payload.Serial({'serial': 'msgpack'})
+
+    def _package(self, data, tag):
+        return salt.utils.event.SaltEvent.pack(tag, data, self.serial)
+
+    def test_add_and_find(self):
+        self.registry.add({'jid': '1', 'fun': 'test.ping'}, os.getpid())
+        data = self.registry.find('1')
+        self.assertEqual(data['fun'], 'test.ping')
+        self.assertEqual(data['pid'], os.getpid())
+        self.assertEqual(self.registry.find('2'), {})
+        self.assertEqual(
+            self.registry.handle_query({'cmd': 'find', 'jid': '1'}),
+            data
+        )
+
+    def test_events(self):
+        self.registry.handle_event(
+            self._package(
+                {'jid': '1', 'fun': 'test.ping', 'pid': os.getpid()},
+                '_salt_job_start'
+            )
+        )
+        self.assertEqual(len(self.registry.running()), 1)
+        # An end event from another pid does not remove the job
+        self.registry.handle_event(
+            self._package({'jid': '1', 'pid': -1}, '_salt_job_end')
+        )
+        self.assertEqual(len(self.registry.running()), 1)
+        self.registry.handle_event(
+            self._package({'jid': '1', 'pid': os.getpid()}, '_salt_job_end')
+        )
+        self.assertEqual(self.registry.running(), [])
+        # Unrelated events are ignored
+        self.registry.handle_event(self._package({}, 'minion_start'))
+        self.assertEqual(self.registry.handle_query({'cmd': 'running'}), [])
+
+    def test_prune_dead_pids(self):
+        # Find a pid which is not in use
+        pid = 65535
+        while os.path.exists('/proc/{0}'.format(pid)):
+            pid -= 1
+        self.registry.add({'jid': '1', 'fun': 'test.sleep'}, pid)
+        self.assertEqual(self.registry.running(), [])
+
+
+class ForwardSyndic(salt.minion.Syndic):
+    '''
+    A syndic whose publication returns at once on a local event bus, the
+    returns it would forward upstream are recorded
+    '''
+    def __init__(self, opts, epub):
+        self.opts = opts
+        self.epub = epub
+        self.serial = salt.payload.Serial({'serial': 'msgpack'})
+        self.forwarded = []
+
+    def pub(self, tgt, fun, arg, expr_form, ret, jid, timeout):
+        # The minion returns before the syndic starts to read the events
+        time.sleep(0.2)
+        self.epub.send(salt.utils.event.SaltEvent.pack(
+            jid, {'id': 'minion', 'return': True}, self.serial))
+        return {'jid': jid, 'minions': ['minion']}
+
+    def _forward_returns(self, jid, returns, outs=None, minions=None):
+        self.forwarded.append(returns)
+
+
+class SyndicForwardTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.context = zmq.Context()
+        self.epub = self.context.socket(zmq.PUB)
+        self.epub.bind('ipc://{0}'.format(
+            os.path.join(self.tmp, 'master_event_pub.ipc')))
+
+    def tearDown(self):
+        self.epub.close()
+        self.context.term()
+        shutil.rmtree(self.tmp)
+
+    def test_fast_return(self):
+        syndic = ForwardSyndic(
+                {'syndic_batch_size': 50, 'syndic_batch_interval': 0.1},
+                self.epub)
+        # The event is not connected yet, as for a minion event
+        event = salt.utils.event.SaltEvent('master', self.tmp)
+        data = {'jid': '20121212', 'tgt': '*', 'fun': 'test.ping',
+                'arg': [], 'tgt_type': 'glob', 'ret': '', 'to': 2}
+        start = time.time()
+        try:
+            syndic._syndic_forward(data, event)
+        finally:
+            event.destroy()
+        self.assertIn({'minion': True}, syndic.forwarded)
+        # The return was seen, the job did not run into its timeout
+        self.assertTrue(time.time() - start < 2)
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(JobRegistryTestCase)
+    tests.addTests(loader.loadTestsFromTestCase(SyndicForwardTestCase))
+    TextTestRunner(verbosity=1).run(tests)
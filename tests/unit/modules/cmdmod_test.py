@@ -0,0 +1,125 @@
+'''
+Test the streaming execution of the cmd module
+'''
+# Import python libs
+import time
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+import salt.crypt
+import salt.payload
+import salt.modules.cmdmod as cmdmod
+cmdmod.__grains__ = {'os': ''}
+
+
+class FakeAuth(object):
+    '''
+    An authentication whose crypticle leaves the loads as they are
+    '''
+    def __init__(self):
+        self.crypticle = self
+
+    def dumps(self, load):
+        return load
+
+
+class FakeMaster(object):
+    '''
+    Stand in for the authentication and the req socket to the master, the
+    sent loads are recorded
+    '''
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.auths = 0
+        self.socks = 0
+        self.loads = []
+
+    def auth(self, opts):
+        self.auths += 1
+        return FakeAuth()
+
+    def sreq(self, master_uri):
+        self.socks += 1
+        return self
+
+    def send(self, enc, load, tries=1, timeout=60, cmd=None):
+        time.sleep(self.delay)
+        self.loads.append(load)
+
+
+class CmdModTestCase(TestCase):
+    def setUp(self):
+        self.sauth = salt.crypt.SAuth
+        self.sreq = salt.payload.SREQ
+
+    def tearDown(self):
+        cmdmod.__opts__ = {}
+        salt.crypt.SAuth = self.sauth
+        salt.payload.SREQ = self.sreq
+
+    def _master(self, delay=0):
+        master = FakeMaster(delay)
+        salt.crypt.SAuth = master.auth
+        salt.payload.SREQ = master.sreq
+        cmdmod.__opts__ = {'id': 'minion',
+                           'master_uri': 'tcp://127.0.0.1:4506',
+                           'cmd_output_events': True,
+                           'cmd_output_event_interval': 0.1}
+        return master
+
+    def test_capture(self):
+        capture = cmdmod._Capture(10)
+        for data in ('abc', 'defgh', 'ijklmnop', 'qrstuvwxyz'):
+            capture.write(data)
+        self.assertEqual(
+                capture.getvalue(),
+                'abcde\n[... 16 bytes dropped ...]\nvwxyz')
+        capture = cmdmod._Capture()
+        capture.write('abc')
+        capture.write('def')
+        self.assertEqual(capture.getvalue(), 'abcdef')
+
+    def test_output_limit(self):
+        cmdmod.__opts__ = {'cmd_output_limit': 100}
+        ret = cmdmod._run('head -c 100000 /dev/zero | tr "\\0" x; echo y')
+        self.assertEqual(ret['retcode'], 0)
+        self.assertTrue(ret['stdout'].startswith('x' * 50))
+        self.assertTrue(ret['stdout'].endswith('x' * 48 + 'y'))
+        self.assertIn('[... 99902 bytes dropped ...]', ret['stdout'])
+
+    def test_timeout(self):
+        start = time.time()
+        ret = cmdmod._run('echo start; (sleep 30) & sleep 30', timeout=1)
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(ret['stdout'], 'start')
+        self.assertIn('timed out after 1 seconds', ret['stderr'])
+        self.assertNotEqual(ret['retcode'], 0)
+
+    def test_output_events(self):
+        master = self._master()
+        ret = cmdmod._run('for i in 1 2 3; do echo $i; sleep 0.2; done')
+        self.assertEqual(ret['stdout'], '1\n2\n3')
+        # The events of the command share one connection
+        self.assertEqual((master.auths, master.socks), (1, 1))
+        self.assertTrue(len(master.loads) > 1)
+        self.assertEqual(
+                set(load['tag'] for load in master.loads), set(['cmd_output']))
+        self.assertEqual(
+                ''.join(load['data']['stdout'] for load in master.loads),
+                '1\n2\n3\n')
+
+    def test_slow_master(self):
+        master = self._master(2)
+        start = time.time()
+        ret = cmdmod._run('echo start; sleep 0.3; echo end; sleep 30',
+                          timeout=1)
+        # The command is killed on time while the first event is being sent
+        self.assertLess(time.time() - start, 1.8)
+        self.assertEqual(ret['stdout'], 'start\nend')
+        self.assertIn('timed out after 1 seconds', ret['stderr'])
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(CmdModTestCase)
+    TextTestRunner(verbosity=1).run(tests)
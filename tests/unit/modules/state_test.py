@@ -0,0 +1,65 @@
+'''
+Test the flag set on the returns of the compiled state cache
+'''
+# Import python libs
+import shutil
+import tempfile
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+import salt.state
+import salt.modules.state as state
+state.__salt__ = {'saltutil.is_running': lambda fun: []}
+
+
+class FakeHighState(object):
+    '''
+    A highstate which returns fixed data, cache_hit is set from the class
+    '''
+    cache_hit = False
+
+    def __init__(self, opts):
+        self.opts = opts
+
+    def call_highstate(self):
+        return {'cmd_|-true_|-true_|-run': {'result': True,
+                                            'changes': {},
+                                            'comment': '',
+                                            '__run_num__': 0}}
+
+    def compile_low_chunks(self):
+        return [{'state': 'cmd', 'fun': 'run', 'name': 'true',
+                 '__id__': 'true', '__sls__': 'foo', '__env__': 'base'}]
+
+
+class CacheHitTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        state.__opts__ = {'cachedir': self.tmp,
+                          'multiprocessing': False,
+                          'serial': 'msgpack'}
+        self.highstate = salt.state.HighState
+        salt.state.HighState = FakeHighState
+
+    def tearDown(self):
+        salt.state.HighState = self.highstate
+        FakeHighState.cache_hit = False
+        shutil.rmtree(self.tmp)
+
+    def test_highstate(self):
+        ret = state.highstate()
+        self.assertNotIn('__cache_hit__', ret['cmd_|-true_|-true_|-run'])
+        FakeHighState.cache_hit = True
+        ret = state.highstate()
+        self.assertTrue(ret['cmd_|-true_|-true_|-run']['__cache_hit__'])
+
+    def test_show_lowstate(self):
+        self.assertNotIn('__cache_hit__', state.show_lowstate()[0])
+        FakeHighState.cache_hit = True
+        self.assertTrue(state.show_lowstate()[0]['__cache_hit__'])
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(CacheHitTestCase)
+    TextTestRunner(verbosity=1).run(tests)
@@ -0,0 +1,85 @@
+'''
+Test the systemd service module against canned systemctl output
+'''
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+import salt.modules.systemd as systemd
+
+LIST_UNIT_FILES = '''UNIT FILE                     STATE           VENDOR PRESET
+sshd.service                  enabled         enabled
+getty@.service                enabled         enabled
+rescue.service                static          -
+cups.socket                   disabled        enabled
+
+4 unit files listed.
+'''
+
+LIST_UNITS = '''  UNIT                  LOAD   ACTIVE   SUB     DESCRIPTION
+  sshd.service          loaded active   running OpenSSH Daemon
+* nginx.service         loaded failed   failed  nginx
+  cups.socket           loaded inactive dead    CUPS Socket
+'''
+
+
+class SystemdTestCase(TestCase):
+    def setUp(self):
+        self.calls = []
+        systemd.__salt__ = {
+                'cmd.run_stdout': self._run_stdout,
+                'cmd.retcode': self._retcode}
+        systemd._clear()
+
+    def tearDown(self):
+        systemd._clear()
+
+    def _run_stdout(self, cmd):
+        self.calls.append(cmd)
+        if 'list-unit-files' in cmd:
+            return LIST_UNIT_FILES
+        return LIST_UNITS
+
+    def _retcode(self, cmd):
+        self.calls.append(cmd)
+        return 0
+
+    def test_unit_files(self):
+        self.assertEqual(systemd.get_enabled(), ['getty@', 'sshd'])
+        self.assertEqual(systemd.get_disabled(), ['cups.socket'])
+        self.assertEqual(
+                systemd.get_all(),
+                ['cups.socket', 'getty@', 'rescue', 'sshd'])
+        self.assertTrue(systemd.available('getty@tty1'))
+        self.assertTrue(systemd.enabled('sshd'))
+        self.assertTrue(systemd.enabled('rescue.service'))
+        self.assertTrue(systemd.disabled('cups.socket'))
+        # All of the above are answered from one listing
+        self.assertEqual(len(self.calls), 1)
+        # A unit which is not listed is asked for
+        self.assertTrue(systemd.enabled('other'))
+        self.assertEqual(
+                self.calls[-1], 'systemctl is-enabled other.service')
+
+    def test_status(self):
+        self.assertTrue(systemd.status('sshd'))
+        self.assertFalse(systemd.status('nginx'))
+        self.assertFalse(systemd.status('cups.socket'))
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(systemd.status('other'))
+        self.assertEqual(self.calls[-1], 'systemctl is-active other.service')
+
+    def test_clear(self):
+        systemd.status('sshd')
+        systemd.enabled('sshd')
+        self.assertEqual(len(self.calls), 2)
+        systemd.start('nginx')
+        self.assertEqual(self.calls[-1], 'systemctl start nginx.service')
+        # The listings are read again after the change
+        systemd.status('sshd')
+        systemd.enabled('sshd')
+        self.assertEqual(len(self.calls), 5)
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(SystemdTestCase)
+    TextTestRunner(verbosity=1).run(tests)
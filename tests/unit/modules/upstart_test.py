@@ -0,0 +1,76 @@
+'''
+Test the upstart service module against canned runlevel and initctl output
+'''
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+import salt.modules.upstart as upstart
+
+INITCTL_LIST = '''mountall-net stop/waiting
+ssh start/running, process 1234
+network-interface-security (network-interface/eth0) start/running
+network-interface-security (network-manager) start/running
+cron stop/waiting
+'''
+
+
+class UpstartTestCase(TestCase):
+    def setUp(self):
+        self.calls = []
+        upstart.__salt__ = {
+                'cmd.run': self._run,
+                'cmd.retcode': self._retcode}
+        # Only ssh and cron are upstart jobs, the rest are sysv scripts
+        self.service_is_upstart = upstart._service_is_upstart
+        self.find_utmp = upstart._find_utmp
+        upstart._service_is_upstart = lambda name: name in ('ssh', 'cron')
+        upstart._find_utmp = lambda: '/var/run/utmp'
+        upstart._clear()
+
+    def tearDown(self):
+        upstart._service_is_upstart = self.service_is_upstart
+        upstart._find_utmp = self.find_utmp
+        upstart._clear()
+
+    def _run(self, cmd):
+        self.calls.append(cmd)
+        if cmd == 'initctl list':
+            return INITCTL_LIST
+        if cmd.startswith('runlevel'):
+            return 'N 2'
+        return ''
+
+    def _retcode(self, cmd):
+        self.calls.append(cmd)
+        return 0 if 'apache2' in cmd else 3
+
+    def test_jobs(self):
+        self.assertTrue(upstart.status('ssh'))
+        self.assertFalse(upstart.status('cron'))
+        # Both are answered from one initctl call
+        self.assertEqual(self.calls, ['initctl list'])
+
+    def test_sysv_status(self):
+        self.assertTrue(upstart.status('apache2'))
+        self.assertFalse(upstart.status('mysql'))
+        self.assertTrue(upstart.status('apache2'))
+        self.assertFalse(upstart.status('mysql'))
+        self.assertEqual(
+                self.calls,
+                ['service apache2 status', 'service mysql status'])
+        upstart.restart('mysql')
+        upstart.status('mysql')
+        self.assertEqual(
+                self.calls[-2:],
+                ['service mysql restart', 'service mysql status'])
+
+    def test_runlevel(self):
+        self.assertEqual(upstart._runlevel(), '2')
+        for name in ('apache2', 'mysql', 'ntp'):
+            upstart._sysv_is_disabled(name)
+        self.assertEqual(self.calls, ['runlevel /var/run/utmp'])
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(UpstartTestCase)
+    TextTestRunner(verbosity=1).run(tests)
@@ -0,0 +1,79 @@
+# Import python libs
+import sys
+import tempfile
+import shutil
+from cStringIO import StringIO
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+import salt.loader
+import salt.output
+
+
+class TestOutput(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.opts = {'extension_modules': self.tmpdir, 'color': False}
+        self.data = dict(
+            ('minion{0}'.format(ind), {
+                'list': range(ind),
+                'str': 'value {0}'.format(ind),
+                'dict': {'nested': [ind, {'deep': True}]}})
+            for ind in range(5))
+        self.data['empty'] = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _display(self, data, out):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            salt.output.display_output(data, out, self.opts)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_stream_matches_output(self):
+        for out in ('json', 'yaml'):
+            expected = salt.output.out_format(self.data, out, self.opts)
+            self.assertEqual(self._display(self.data, out), expected + '\n')
+            self.assertEqual(self._display([], out),
+                             salt.output.out_format([], out, self.opts) + '\n')
+
+    def test_highstate_stream(self):
+        data = {}
+        for host in ('minion1', 'minion2'):
+            data[host] = {
+                'file_|-/tmp/foo_|-/tmp/foo_|-managed': {
+                    'result': False,
+                    'comment': 'Failed',
+                    'changes': {},
+                    '__run_num__': 0}}
+        printed = self._display(data, 'highstate')
+        self.assertIn('minion1:', printed)
+        self.assertIn('minion2:', printed)
+        self.assertEqual(printed.count('Result:    False'), 2)
+
+    def test_cached(self):
+        salt.output.get_printout('json', self.opts)
+        loaded = []
+        orig = salt.loader.outputters
+
+        def _outputters(opts):
+            loaded.append(opts)
+            return orig(opts)
+        salt.loader.outputters = _outputters
+        try:
+            self._display(self.data, 'txt')
+            self._display(self.data, 'json')
+        finally:
+            salt.loader.outputters = orig
+        self.assertEqual(loaded, [])
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(TestOutput)
+    TextTestRunner(verbosity=1).run(tests)
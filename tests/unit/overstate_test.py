@@ -0,0 +1,203 @@
+'''
+Test the scheduling of the overstate stages
+'''
+# Import python libs
+import time
+import shutil
+import tempfile
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+import salt.overstate
+
+
+class FakeEvent(object):
+    '''
+    Hand out the queued events one at a time and log the returns
+    '''
+    def __init__(self, log):
+        self.cpub = True
+        self.queue = []
+        self.log = log
+
+    def subscribe(self, tag):
+        pass
+
+    def unsubscribe(self, tag):
+        pass
+
+    def get_events(self, max_n=100, wait=5, tag='', full=False):
+        if not self.queue:
+            time.sleep(0.01)
+            return []
+        raw = self.queue.pop(0)
+        if raw['fun'] != 'test.ping':
+            self.log.append(('return', raw['data']['id']))
+        return [raw]
+
+
+class FakeLocal(object):
+    '''
+    Run the stages on fake minions, the minions in fail fail their states,
+    the minions in running do not return and answer the find_job checks in
+    turn, with the job when the answer is True and with nothing otherwise
+    '''
+    def __init__(self, targets, fail=(), running=None):
+        self.targets = targets
+        self.fail = fail
+        self.running = running or {}
+        self.log = []
+        self.event = FakeEvent(self.log)
+        self.jid = 0
+
+    def run_job(self, tgt, fun, arg=(), expr_form='glob', ret='',
+                timeout=None, **kwargs):
+        self.jid += 1
+        jid = str(self.jid)
+        if fun == 'test.ping':
+            tgt = self.targets[tgt]
+        else:
+            self.log.append((fun, sorted(tgt)))
+        for minion in tgt:
+            if fun == 'test.ping':
+                data = True
+            elif fun == 'saltutil.find_job':
+                if not self.running.get(minion):
+                    continue
+                data = {}
+                if self.running[minion].pop(0):
+                    data = {'jid': arg[0]}
+            elif minion in self.running:
+                continue
+            else:
+                data = {'cmd_|-run_|-true_|-run': {
+                    'result': minion not in self.fail, 'changes': {}}}
+            self.event.queue.append({'tag': jid,
+                                     'fun': fun,
+                                     'data': {'id': minion, 'return': data}})
+        return {'jid': jid, 'minions': list(tgt)}
+
+
+class OverStateTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.running = salt.overstate.RUNNING_TIMEOUT
+        salt.overstate.RUNNING_TIMEOUT = 0.1
+
+    def tearDown(self):
+        salt.overstate.RUNNING_TIMEOUT = self.running
+        shutil.rmtree(self.tmp)
+
+    def _over(self, stages, local):
+        '''
+        Return an overstate for the stages which runs on the fake client
+        '''
+        over = object.__new__(salt.overstate.OverState)
+        over.opts = {'timeout': 0.1,
+                     'cachedir': self.tmp,
+                     'hash_type': 'md5'}
+        over.env = 'base'
+        over.over = over._OverState__sort_stages(stages)
+        over.names = stages
+        over.local = local
+        over.over_run = {}
+        over.timing = {}
+        return over
+
+    def test_order(self):
+        local = FakeLocal({'web': ['web1'], 'db': ['db1']})
+        over = self._over({'a': {'match': 'db', 'require': ['b']},
+                           'b': {'match': 'web'}},
+                          local)
+        over.stages()
+        # a waits on b
+        self.assertEqual(
+                local.log,
+                [('state.highstate', ['web1']),
+                 ('return', 'web1'),
+                 ('state.highstate', ['db1']),
+                 ('return', 'db1')])
+        self.assertEqual(sorted(over.over_run), ['a', 'b'])
+
+    def test_concurrent(self):
+        local = FakeLocal({'web': ['web1', 'web2'], 'db': ['db1']})
+        over = self._over({'a': {'match': 'web'},
+                           'b': {'match': 'db', 'sls': ['mysql']},
+                           'c': {'match': 'web', 'sls': ['nginx']}},
+                          local)
+        over.stages()
+        # a and b are independent, c shares its minions with a
+        self.assertEqual(
+                local.log,
+                [('state.highstate', ['web1', 'web2']),
+                 ('state.sls', ['db1']),
+                 ('return', 'web1'),
+                 ('return', 'web2'),
+                 ('state.sls', ['web1', 'web2']),
+                 ('return', 'db1'),
+                 ('return', 'web1'),
+                 ('return', 'web2')])
+
+    def test_failure(self):
+        local = FakeLocal({'web': ['web1'], 'db': ['db1']}, fail=('db1',))
+        over = self._over({'a': {'match': 'db'},
+                           'b': {'match': 'web', 'require': ['a']},
+                           'c': {'match': 'web', 'require': ['b']},
+                           'd': {'match': 'web'}},
+                          local)
+        over.stages()
+        # The stages depending on a are not run, d is not affected
+        self.assertEqual(
+                local.log,
+                [('state.highstate', ['db1']),
+                 ('state.highstate', ['web1']),
+                 ('return', 'db1'),
+                 ('return', 'web1')])
+        self.assertIn('req_|-fail_|-a_|-None', over.over_run['b']['b'])
+        self.assertIn('req_|-fail_|-b_|-None', over.over_run['c']['c'])
+        self.assertTrue(over._check_result(over.over_run['d']))
+
+    def test_expire(self):
+        # web2 is still running at the first check and gone at the second
+        local = FakeLocal({'web': ['web1', 'web2'], 'db': ['db1']},
+                          running={'web2': [True]})
+        over = self._over({'a': {'match': 'web'},
+                           'b': {'match': 'db', 'require': ['a']},
+                           'c': {'match': 'db', 'sls': ['mysql']}},
+                          local)
+        start = time.time()
+        over.stages()
+        self.assertEqual(
+                local.log,
+                [('state.highstate', ['web1', 'web2']),
+                 ('state.sls', ['db1']),
+                 ('return', 'web1'),
+                 ('return', 'db1'),
+                 ('saltutil.find_job', ['web2']),
+                 ('return', 'web2'),
+                 ('saltutil.find_job', ['web2']),
+                 ('state.highstate', ['db1']),
+                 ('return', 'db1')])
+        self.assertEqual(list(over.over_run['a']), ['web1'])
+        self.assertTrue(time.time() - start < 2)
+
+    def test_critical_path(self):
+        over = self._over({'a': {},
+                           'b': {'require': ['a']},
+                           'c': {},
+                           'd': {'require': ['b', 'c']}},
+                          None)
+        self.assertEqual(over.critical_path(), [])
+        over.timing = {'a': {'end': 1},
+                       'b': {'end': 3},
+                       'c': {'end': 2},
+                       'd': {'end': 4}}
+        self.assertEqual(over.critical_path(), ['a', 'b', 'd'])
+        over.timing['c']['end'] = 3.5
+        self.assertEqual(over.critical_path(), ['c', 'd'])
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(OverStateTestCase)
+    TextTestRunner(verbosity=1).run(tests)
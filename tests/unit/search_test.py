@@ -0,0 +1,73 @@
+# Import python libs
+import os
+import time
+import shutil
+import tempfile
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner, skipIf
+import salt.search.whoosh_search as whoosh_search
+
+
+@skipIf(whoosh_search.has_whoosh is False, 'whoosh is not installed')
+class TestWhooshIndex(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmpdir, 'roots')
+        os.makedirs(os.path.join(self.root, 'web'))
+        self._write('top.sls', 'base:\n  "*":\n    - web.apache\n')
+        self._write('web/apache.sls', 'apache:\n  pkg.installed\n')
+        self.jobs = {
+            '20121010101010000001': ({'fun': 'test.ping'}, {'m1': True}),
+            '20121010101010000002': ({'fun': 'cmd.run'}, {'m1': 'nginx'})}
+        whoosh_search.__opts__ = {'cachedir': self.tmpdir,
+                                  'file_roots': {'base': [self.root]},
+                                  'pillar_roots': {},
+                                  'ext_job_cache': 'test'}
+        whoosh_search.__ret__ = {
+            'test.get_load': lambda jid: self.jobs[jid][0],
+            'test.get_jid': lambda jid: self.jobs[jid][1],
+            'test.get_jids': lambda: list(self.jobs)}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, content, mtime=None):
+        path = os.path.join(self.root, name)
+        with open(path, 'w') as fp_:
+            fp_.write(content)
+        if mtime:
+            os.utime(path, (mtime, mtime))
+
+    def _keys(self):
+        ix_ = whoosh_search.whoosh.index.open_dir(
+                os.path.join(self.tmpdir, 'whoosh'))
+        with ix_.searcher() as searcher:
+            return sorted(
+                    fields['key'].split(':')[0]
+                    for fields in searcher.all_stored_fields())
+
+    def test_incremental(self):
+        whoosh_search.index()
+        whoosh_search.index()
+        # A second run does not add the documents again
+        self.assertEqual(
+                self._keys(),
+                ['file', 'file', 'job', 'job', 'ret', 'ret'])
+        os.remove(os.path.join(self.root, 'top.sls'))
+        self._write('web/apache.sls', 'httpd:\n  pkg.installed\n',
+                    time.time() + 10)
+        del self.jobs['20121010101010000001']
+        self.jobs['20121010101010000003'] = ({'fun': 'x'}, {'m2': 'hello'})
+        whoosh_search.index()
+        self.assertEqual(self._keys(), ['file', 'job', 'job', 'ret', 'ret'])
+        self.assertEqual(len(whoosh_search.query('apache')), 0)
+        self.assertEqual(len(whoosh_search.query('httpd')), 1)
+        self.assertEqual(len(whoosh_search.query('hello')), 1)
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(TestWhooshIndex)
+    TextTestRunner(verbosity=1).run(tests)
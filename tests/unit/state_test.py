@@ -0,0 +1,235 @@
+'''
+Test the compiled state cache of the highstate and the aggregation of states
+'''
+# Import python libs
+import shutil
+import tempfile
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+import salt.state
+import salt.payload
+
+
+class FakeClient(object):
+    '''
+    Serve the hashes of the sls files from a dict
+    '''
+    def __init__(self, files):
+        self.files = files
+
+    def hash_file(self, path, env='base'):
+        hsum = self.files.get(path[len('salt://'):])
+        if hsum is None:
+            return {}
+        return {'hsum': hsum, 'hash_type': 'md5'}
+
+
+class FakeState(object):
+    def __init__(self, opts):
+        self.opts = opts
+
+
+class CachedHighState(salt.state.BaseHighState):
+    def __init__(self, opts, files):
+        self.opts = opts
+        self.avail = {'base': ['foo', 'bar']}
+        self.serial = salt.payload.Serial(opts)
+        self.cache_key = None
+        self.sls_hashes = None
+        self.cache_hit = False
+        self.client = FakeClient(files)
+        self.state = FakeState(opts)
+
+
+class CompiledCacheTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.opts = {
+                'cachedir': self.tmp,
+                'state_compile_cache': True,
+                'id': 'minion',
+                'renderer': 'yaml_jinja',
+                'grains': {'os': 'Linux'},
+                'pillar': {'foo': 'bar'},
+                'serial': 'msgpack'}
+        self.files = {'foo.sls': 'a', 'bar/init.sls': 'b'}
+        self.matches = {'base': ['foo']}
+        self.chunks = [{'state': 'file', 'fun': 'touch', 'name': '/tmp/foo'}]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _compile(self):
+        '''
+        Check the cache and fill it like a highstate rendering foo and bar
+        '''
+        st_ = CachedHighState(self.opts, self.files)
+        chunks = st_.load_compiled('call', self.matches)
+        if chunks is None and st_.sls_hashes is not None:
+            for sls in ('foo', 'bar'):
+                st_.sls_hashes[('base', sls)] = st_._sls_hash(sls, 'base')
+            st_.save_compiled('call', self.chunks)
+        return st_.cache_hit
+
+    def test_hit(self):
+        self.assertFalse(self._compile())
+        self.assertTrue(self._compile())
+        st_ = CachedHighState(self.opts, self.files)
+        self.assertEqual(st_.load_compiled('call', self.matches), self.chunks)
+        self.assertEqual(st_.load_compiled('low', self.matches), None)
+
+    def test_invalidate(self):
+        self.assertFalse(self._compile())
+        self.files['bar/init.sls'] = 'c'
+        self.assertFalse(self._compile())
+        self.assertTrue(self._compile())
+        self.files['bar.sls'] = 'd'
+        self.assertFalse(self._compile())
+        self.opts['pillar']['foo'] = 'baz'
+        self.assertFalse(self._compile())
+        self.matches['base'].append('bar')
+        self.assertFalse(self._compile())
+        self.assertTrue(self._compile())
+
+    def test_disabled(self):
+        self.opts['state_compile_cache'] = False
+        self.assertFalse(self._compile())
+        self.assertFalse(self._compile())
+
+
+def installed(name, version=None, refresh=False, **kwargs):
+    pass
+
+
+def mod_watch(name, **kwargs):
+    pass
+
+
+def run(name, **kwargs):
+    pass
+
+
+class AggregateState(salt.state.State):
+    '''
+    A state which records the calls instead of running the states, the pkg
+    chunks passed to mod_aggregate are run together
+    '''
+    def __init__(self, opts, rets=None):
+        self.opts = opts
+        self.active = set()
+        self.mod_init = set()
+        self.aggregated = set()
+        self.chunk_pos = {}
+        self._State__run_num = 0
+        self.rets = rets
+        self.groups = []
+        self.called = []
+        self.states = {'pkg.installed': installed,
+                       'pkg.mod_aggregate': self.mod_aggregate,
+                       'pkg.mod_watch': mod_watch,
+                       'cmd.run': run}
+
+    def mod_aggregate(self, chunks):
+        self.groups.append([low['name'] for low in chunks])
+        if self.rets is not None:
+            return self.rets
+        return [{'name': low['name'], 'changes': {low['name']: '1.0'},
+                 'result': True, 'comment': ''} for low in chunks]
+
+    def call(self, low):
+        self.called.append(low['name'])
+        return {'name': low['name'], 'changes': {'ran': True},
+                'result': True, 'comment': ''}
+
+    def module_refresh(self, data):
+        pass
+
+
+class AggregateTestCase(TestCase):
+    def setUp(self):
+        self.opts = {'state_aggregate': True, 'failhard': False, 'test': False}
+
+    def _chunk(self, state, name, **kwargs):
+        low = {'state': state,
+               'fun': 'installed' if state == 'pkg' else 'run',
+               'name': name,
+               '__id__': name,
+               '__sls__': 'test',
+               '__env__': 'base'}
+        low.update(kwargs)
+        return low
+
+    def _run(self, chunks, rets=None):
+        st_ = AggregateState(self.opts, rets)
+        running = st_.call_chunks(chunks)
+        return st_, running
+
+    def test_group(self):
+        st_, running = self._run(
+                [self._chunk('pkg', name) for name in ('a', 'b', 'c')])
+        self.assertEqual(st_.groups, [['a', 'b', 'c']])
+        self.assertEqual(st_.called, [])
+        self.assertEqual(len(running), 3)
+        self.assertEqual(
+                sorted(ret['__run_num__'] for ret in running.values()),
+                [0, 1, 2])
+
+    def test_disabled(self):
+        self.opts['state_aggregate'] = False
+        st_, running = self._run(
+                [self._chunk('pkg', name) for name in ('a', 'b', 'c')])
+        self.assertEqual(st_.groups, [])
+        self.assertEqual(st_.called, ['a', 'b', 'c'])
+
+    def test_unmet(self):
+        # c requires a command which comes after it, the group ends at c and
+        # c starts the next one once the command ran
+        st_, running = self._run([
+                self._chunk('pkg', 'a'),
+                self._chunk('pkg', 'b'),
+                self._chunk('pkg', 'c', require=[{'cmd': 'x'}]),
+                self._chunk('pkg', 'd'),
+                self._chunk('cmd', 'x')])
+        self.assertEqual(st_.groups, [['a', 'b'], ['c', 'd']])
+        self.assertEqual(st_.called, ['x'])
+
+    def test_change(self):
+        # c watches a command which changed something, it is not grouped
+        st_, running = self._run([
+                self._chunk('cmd', 'x'),
+                self._chunk('pkg', 'a'),
+                self._chunk('pkg', 'b'),
+                self._chunk('pkg', 'c', watch=[{'cmd': 'x'}]),
+                self._chunk('pkg', 'd'),
+                self._chunk('pkg', 'e')])
+        self.assertEqual(st_.groups, [['a', 'b'], ['d', 'e']])
+        self.assertEqual(st_.called, ['x', 'c'])
+
+    def test_invalid(self):
+        # The chunk with errors is left out and reports them when called
+        st_, running = self._run([
+                self._chunk('pkg', 'a'),
+                self._chunk('pkg', ['b']),
+                self._chunk('pkg', 'c')])
+        self.assertEqual(st_.groups, [['a', 'c']])
+        self.assertEqual(st_.called, [['b']])
+
+    def test_fallback(self):
+        # mod_aggregate did not handle b, it is run on its own
+        rets = [{'name': 'a', 'changes': {}, 'result': True, 'comment': ''},
+                None,
+                {'name': 'c', 'changes': {}, 'result': True, 'comment': ''}]
+        st_, running = self._run(
+                [self._chunk('pkg', name) for name in ('a', 'b', 'c')],
+                rets)
+        self.assertEqual(st_.groups, [['a', 'b', 'c']])
+        self.assertEqual(st_.called, ['b'])
+        self.assertEqual(len(running), 3)
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(CompiledCacheTestCase)
+    tests.addTests(loader.loadTestsFromTestCase(AggregateTestCase))
+    TextTestRunner(verbosity=1).run(tests)
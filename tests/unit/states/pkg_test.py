@@ -0,0 +1,102 @@
+import sys
+import os
+import shutil
+import tempfile
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from saltunittest import TestCase, TestLoader, TextTestRunner, skipIf
+try:
+    from mock import MagicMock, patch
+    has_mock = True
+except ImportError:
+    has_mock = False
+
+import salt.states.pkg as pkg
+pkg.__salt__ = {}
+pkg.__opts__ = {'test': False}
+
+
+class FakeInstall(object):
+    '''
+    Install the packages which are not in missing and record the calls
+    '''
+    def __init__(self, missing=()):
+        self.missing = missing
+        self.calls = []
+
+    def __call__(self, name=None, refresh=False, pkgs=None, **kwargs):
+        self.calls.append(pkgs)
+        return dict((name, '1.0') for name in pkgs
+                    if not name in self.missing)
+
+
+@skipIf(has_mock is False, "mock python module is unavailable")
+class TestPkgAggregate(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.opts = {'test': False, 'cachedir': self.tmp}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _chunk(self, name, **kwargs):
+        low = {'state': 'pkg',
+               'fun': 'installed',
+               'name': name,
+               '__id__': name,
+               '__sls__': 'test',
+               '__env__': 'base'}
+        low.update(kwargs)
+        return low
+
+    def _aggregate(self, chunks, install):
+        version = MagicMock(return_value='')
+        with patch.dict(pkg.__salt__, {'pkg.version': version,
+                                       'pkg.install': install}):
+            with patch.dict(pkg.__opts__, self.opts):
+                return pkg.mod_aggregate(chunks)
+
+    def test_install(self):
+        install = FakeInstall()
+        ret = self._aggregate(
+                [self._chunk('foo'), self._chunk('bar', refresh=True)],
+                install)
+        self.assertEqual(install.calls, [['foo', 'bar']])
+        self.assertEqual(ret[0]['changes'], {'foo': '1.0'})
+        self.assertEqual(ret[1]['changes'], {'bar': '1.0'})
+
+    def test_options(self):
+        # A state with install options of its own is left alone
+        install = FakeInstall()
+        ret = self._aggregate(
+                [self._chunk('foo'),
+                 self._chunk('bar', version='2.0'),
+                 self._chunk('baz')],
+                install)
+        self.assertEqual(install.calls, [['foo', 'baz']])
+        self.assertEqual(ret[1], None)
+        self.assertEqual(ret[2]['changes'], {'baz': '1.0'})
+
+    def test_partial(self):
+        # The package which failed to install is left to its own state
+        install = FakeInstall(missing=('bar',))
+        ret = self._aggregate(
+                [self._chunk('foo'), self._chunk('bar'), self._chunk('baz')],
+                install)
+        self.assertEqual(ret[0]['result'], True)
+        self.assertEqual(ret[1], None)
+        self.assertEqual(ret[2]['result'], True)
+
+    def test_test(self):
+        self.opts['test'] = True
+        install = FakeInstall()
+        ret = self._aggregate([self._chunk('foo'), self._chunk('bar')],
+                              install)
+        self.assertEqual(ret, [None, None])
+        self.assertEqual(install.calls, [])
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(TestPkgAggregate)
+    TextTestRunner(verbosity=1).run(tests)
@@ -0,0 +1,80 @@
+'''
+Test the persistent shell used by the cmd module
+'''
+# Import python libs
+import os
+import time
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+import salt.utils.coprocess
+
+
+class CoprocessTestCase(TestCase):
+    def setUp(self):
+        self.worker = salt.utils.coprocess.start_worker(
+                'test', '/bin/sh', '/')
+
+    def tearDown(self):
+        salt.utils.coprocess.stop_workers()
+
+    def test_run(self):
+        self.assertEqual(
+                self.worker.run('echo out; echo err >&2; exit 3'),
+                ('out\n', 'err\n', 3))
+        self.assertEqual(
+                self.worker.run('printf out; echo err >&2', merge=True),
+                ('outerr\n', '', 0))
+        self.assertEqual(self.worker.run('pwd'), ('/\n', '', 0))
+
+    def test_isolation(self):
+        self.worker.run('cd /tmp; FOO=bar; exit 1')
+        self.assertEqual(
+                self.worker.run('pwd; echo "$FOO"'), ('/\n\n', '', 0))
+        self.assertEqual(
+                self.worker.run('echo "$FOO"', env={'FOO': "it's"}),
+                ("it's\n", '', 0))
+        self.assertEqual(self.worker.run('if then')[2], 2)
+        self.assertTrue(self.worker.alive())
+
+    def test_background(self):
+        start = time.time()
+        self.assertEqual(
+                self.worker.run('sleep 0.2 && echo late &'), ('', '', 0))
+        self.assertTrue(time.time() - start < 0.2)
+        self.assertEqual(self.worker.run('echo next'), ('next\n', '', 0))
+        time.sleep(0.3)
+        # The late output does not end up in the output of later commands
+        self.assertEqual(self.worker.run('echo again'), ('again\n', '', 0))
+        # More background output than a pipe holds does not block the shell
+        self.assertEqual(
+                self.worker.run('sleep 0.1 && head -c 1000000 /dev/zero &'),
+                ('', '', 0))
+        time.sleep(0.3)
+        self.assertEqual(self.worker.run('echo done'), ('done\n', '', 0))
+
+    def test_limits(self):
+        workers = [salt.utils.coprocess.start_worker(
+                       ind, '/bin/sh', '/')
+                   for ind in range(salt.utils.coprocess.MAX_WORKERS + 2)]
+        self.assertEqual(
+                len(salt.utils.coprocess.WORKERS),
+                salt.utils.coprocess.MAX_WORKERS)
+        # The least recently used shells were stopped
+        self.assertIsNone(salt.utils.coprocess.get_worker('test'))
+        self.assertFalse(workers[0].alive())
+        self.assertFalse(os.path.isdir(workers[0].tmpdir))
+        workers[-1].last_use -= salt.utils.coprocess.IDLE_TIMEOUT + 1
+        self.assertIsNone(salt.utils.coprocess.get_worker(len(workers) - 1))
+        self.assertIs(salt.utils.coprocess.get_worker(2), workers[2])
+
+    def test_get_worker(self):
+        self.assertIs(salt.utils.coprocess.get_worker('test'), self.worker)
+        self.worker.pid = os.getpid() + 1
+        self.assertIsNone(salt.utils.coprocess.get_worker('test'))
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(CoprocessTestCase)
+    TextTestRunner(verbosity=1).run(tests)
@@ -0,0 +1,61 @@
+# Import python libs
+import os
+import random
+import shutil
+import tempfile
+from cStringIO import StringIO
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+from salt.utils import delta
+
+
+class TestDelta(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.old = os.path.join(self.tmpdir, 'old')
+        self.new = os.path.join(self.tmpdir, 'new')
+        rand = random.Random(42)
+        self.data = ''.join(chr(rand.randint(0, 255)) for i in range(20000))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _rebuild(self, old, new, block_size=1024):
+        with open(self.old, 'wb') as fp_:
+            fp_.write(old)
+        with open(self.new, 'wb') as fp_:
+            fp_.write(new)
+        sig = delta.signature(self.old, block_size)
+        ops = delta.delta(self.new, sig)
+        if ops is None:
+            return None, None
+
+        def _fetch(offset, length):
+            yield new[offset:offset + length]
+
+        out = StringIO()
+        delta.patch(self.old, out, block_size, ops, _fetch)
+        self.assertEqual(out.getvalue(), new)
+        return ops, delta.literal_size(ops)
+
+    def test_append(self):
+        ops, literal = self._rebuild(self.data, self.data + 'appended row')
+        # Only the short last block and the new data are sent
+        self.assertEqual(literal, len(self.data) % 1024 + 12)
+        self.assertEqual(ops[0], ['c', 0, len(self.data) // 1024])
+
+    def test_insert(self):
+        new = self.data[:5000] + 'inserted' + self.data[5000:]
+        ops, literal = self._rebuild(self.data, new)
+        self.assertTrue(literal < 3000)
+
+    def test_unrelated(self):
+        self.assertEqual(self._rebuild(self.data, self.data[::-1]), (None, None))
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(TestDelta)
+    TextTestRunner(verbosity=1).run(tests)
@@ -8,6 +8,8 @@
 '''
 
 import os
+import shutil
+import tempfile
 import integration
 import hashlib
 from saltunittest import TestCase, TestLoader, TextTestRunner
@@ -72,6 +74,54 @@ class TestSaltEvent(TestCase):
             )
         )
 
+    def test_pack_unpack(self):
+        raw = event.SaltEvent.pack('salt/job/20121212', {'foo': 'bar'})
+        self.assertTrue(raw.startswith('salt/job/20121212'))
+        self.assertEqual(
+            event.SaltEvent.unpack(raw),
+            ('salt/job/20121212', {'foo': 'bar'})
+        )
+        self.assertRaises(ValueError, event.SaltEvent.pack, 'a\n\nb', {})
+
+    def test_subscriptions(self):
+        me = event.MinionEvent(sock_dir=SOCK_DIR)
+        me.subscribe('foo')
+        me.subscribe('foo')
+        self.assertEqual(me.subscriptions, set(['foo']))
+        me.pending.append(('foo/bar', {}))
+        me.pending.append(('baz', {}))
+        me.unsubscribe('foo')
+        self.assertEqual(me.subscriptions, set())
+        self.assertEqual(len(me.pending), 0)
+
+    def test_destroy(self):
+        me = event.MasterEvent(SOCK_DIR)
+        me.fire_event({'foo': 'bar'}, 'foo')
+        me.destroy(0)
+        self.assertTrue(me.sub.closed)
+        self.assertTrue(me.push.closed)
+        self.assertTrue(me.context.closed)
+
+
+class TestEventRecorder(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_record_replay(self):
+        recorder = event.EventRecorder(os.path.join(self.tmpdir, 'events'))
+        for num in range(3):
+            recorder.record(event.SaltEvent.pack('job', {'num': num}))
+        recorder.record(event.SaltEvent.pack('auth', {'num': 3}))
+        recorder.close()
+        self.assertEqual(len(list(recorder.replay())), 4)
+        self.assertEqual(
+            [evt['data']['num'] for evt in recorder.replay('job')],
+            [0, 1, 2]
+        )
 
 
 if __name__ == "__main__":
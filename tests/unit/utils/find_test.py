@@ -294,6 +294,16 @@ class TestGrepOption(TestCase):
             None
         )
 
+    def test_grep_option_match_chunk_boundary(self):
+        big_file = os.path.join(self.tmpdir, 'big.txt')
+        with salt.utils.fopen(big_file, 'w') as fd:
+            fd.write('x' * (256 * 1024 - 3) + 'foobar')
+        option = salt.utils.find.GrepOption('grep', 'foobar')
+        self.assertEqual(
+            option.match(self.tmpdir, 'big.txt', os.stat(big_file)),
+            big_file
+        )
+
     @skipIf(sys.platform.startswith('win'), 'No /dev/null on Windows')
     def test_grep_option_match_dev_null(self):
         option = salt.utils.find.GrepOption('grep', 'foo')
@@ -553,6 +563,37 @@ class TestFinder(TestCase):
             list(finder.find(self.tmpdir)), [[hello_file, 'hello.txt']]
         )
 
+    def test_find_threads(self):
+        paths = []
+        for sub in ('a', 'b', os.path.join('b', 'c')):
+            os.makedirs(os.path.join(self.tmpdir, sub))
+            paths.append(os.path.join(self.tmpdir, sub))
+            for name in ('foo', 'bar'):
+                path = os.path.join(self.tmpdir, sub, name)
+                with salt.utils.fopen(path, 'w') as fp_:
+                    fp_.write(name)
+                paths.append(path)
+        dangling = os.path.join(self.tmpdir, 'dangling')
+        os.symlink(os.path.join(self.tmpdir, 'gone'), dangling)
+        link = os.path.join(self.tmpdir, 'link')
+        os.symlink(os.path.join(self.tmpdir, 'b'), link)
+        for threads in (1, 4):
+            finder = salt.utils.find.Finder({}, threads)
+            self.assertEqual(
+                sorted(finder.find(self.tmpdir)),
+                sorted(paths + [dangling, link])
+            )
+            finder = salt.utils.find.Finder({'type': 'd'}, threads)
+            self.assertEqual(
+                sorted(finder.find(self.tmpdir)),
+                sorted([p for p in paths if os.path.isdir(p)] + [link])
+            )
+            finder = salt.utils.find.Finder({'grep': 'fo+$'}, threads)
+            self.assertEqual(
+                sorted(finder.find(self.tmpdir)),
+                sorted([p for p in paths if p.endswith('foo')])
+            )
+
 
 if __name__ == "__main__":
     loader = TestLoader()
@@ -0,0 +1,127 @@
+'''
+Test the cache of file hashes
+'''
+# Import python libs
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+import salt.utils
+import salt.utils.hashcache
+
+
+class HashCacheTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'data')
+        self.cache = os.path.join(self.tmp, 'cache', 'hash_cache.p')
+        self.hashed = []
+        self.get_hash = salt.utils.get_hash
+
+        def get_hash(path, form='md5'):
+            self.hashed.append(path)
+            return self.get_hash(path, form)
+        salt.utils.get_hash = get_hash
+
+    def tearDown(self):
+        salt.utils.get_hash = self.get_hash
+        shutil.rmtree(self.tmp)
+
+    def _write(self, data, age=10):
+        with salt.utils.fopen(self.path, 'w+') as fp_:
+            fp_.write(data)
+        mtime = time.time() - age
+        os.utime(self.path, (mtime, mtime))
+
+    def test_get_hash(self):
+        cache = salt.utils.hashcache.HashCache(self.cache)
+        self._write('foo')
+        md5 = hashlib.md5('foo').hexdigest()
+        self.assertEqual(cache.get_hash(self.path), md5)
+        self.assertEqual(cache.get_hash(self.path), md5)
+        self.assertEqual(len(self.hashed), 1)
+        self.assertEqual(
+                cache.get_hash(self.path, 'sha1'),
+                hashlib.sha1('foo').hexdigest())
+        self._write('bar', 5)
+        self.assertEqual(
+                cache.get_hash(self.path), hashlib.md5('bar').hexdigest())
+        self.assertEqual(len(self.hashed), 3)
+
+    def test_recent(self):
+        cache = salt.utils.hashcache.HashCache(self.cache)
+        self._write('foo', 0)
+        cache.get_hash(self.path)
+        cache.get_hash(self.path)
+        self.assertEqual(len(self.hashed), 2)
+
+    def test_persistent(self):
+        cache = salt.utils.hashcache.HashCache(self.cache)
+        self._write('foo')
+        cache.get_hash(self.path)
+        cache.flush()
+        cache = salt.utils.hashcache.HashCache(self.cache)
+        self.assertEqual(
+                cache.get_hash(self.path), hashlib.md5('foo').hexdigest())
+        self.assertEqual(len(self.hashed), 1)
+
+    def test_mtime_reset(self):
+        cache = salt.utils.hashcache.HashCache(self.cache)
+        self._write('foo')
+        mtime = os.stat(self.path).st_mtime
+        cache.get_hash(self.path)
+        # Same inode, size and mtime, only the ctime tells the change
+        time.sleep(0.01)
+        self._write('bar')
+        os.utime(self.path, (mtime, mtime))
+        self.assertEqual(
+                cache.get_hash(self.path), hashlib.md5('bar').hexdigest())
+        self.assertEqual(len(self.hashed), 2)
+
+    def test_last_use(self):
+        cache = salt.utils.hashcache.HashCache(self.cache)
+        self._write('foo')
+        cache.get_hash(self.path)
+        cache.flush()
+        used = cache.entries['md5:' + self.path][5]
+        time.sleep(0.01)
+        cache.get_hash(self.path)
+        self.assertTrue(cache.dirty)
+        cache.flush()
+        # The use is seen by the next process which reads the cache
+        cache = salt.utils.hashcache.HashCache(self.cache)
+        cache._load()
+        self.assertTrue(cache.entries['md5:' + self.path][5] > used)
+
+    def test_size(self):
+        cache = salt.utils.hashcache.HashCache(self.cache, 4)
+        for form in salt.utils.HASH_TYPES:
+            self._write('foo')
+            cache.get_hash(self.path, form)
+        cache.flush()
+        self.assertEqual(
+                sorted(cache.entries),
+                ['sha384:' + self.path, 'sha512:' + self.path])
+
+
+class GetHashTestCase(TestCase):
+    def test_chunks(self):
+        with tempfile.NamedTemporaryFile() as fp_:
+            data = os.urandom(1024) * 2048
+            fp_.write(data)
+            fp_.flush()
+            for size in (1024, 1048576 * 4):
+                self.assertEqual(
+                        salt.utils.get_hash(fp_.name, 'sha1', size),
+                        hashlib.sha1(data).hexdigest())
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(HashCacheTestCase)
+    tests.addTests(loader.loadTestsFromTestCase(GetHashTestCase))
+    TextTestRunner(verbosity=1).run(tests)
@@ -0,0 +1,66 @@
+'''
+Test the snapshots of system database queries
+'''
+# Import python libs
+import os
+import time
+import shutil
+import tempfile
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+import salt.utils.snapshot
+
+
+class SnapshotTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'status')
+        self._write('a', 10)
+
+    def tearDown(self):
+        salt.utils.snapshot.SNAPSHOTS.pop('test.snapshot', None)
+        shutil.rmtree(self.tmp)
+
+    def _write(self, data, age):
+        with open(self.path, 'w+') as fp_:
+            fp_.write(data)
+        mtime = time.time() - age
+        os.utime(self.path, (mtime, mtime))
+
+    def test_get(self):
+        snap = salt.utils.snapshot.Snapshot((self.path,))
+        snap.get()['pkgs'] = ['foo']
+        self.assertEqual(snap.get(), {'pkgs': ['foo']})
+        # A change of the watched file drops the results
+        self._write('ab', 5)
+        self.assertEqual(snap.get(), {})
+        snap.get()['pkgs'] = ['foo']
+        os.remove(self.path)
+        self.assertEqual(snap.get(), {})
+        snap.get()['pkgs'] = ['foo']
+        snap.clear()
+        self.assertEqual(snap.get(), {})
+
+    def test_ttl(self):
+        snap = salt.utils.snapshot.Snapshot((self.path,), 0.1)
+        snap.get()['pkgs'] = ['foo']
+        self.assertEqual(snap.get(), {'pkgs': ['foo']})
+        time.sleep(0.2)
+        self.assertEqual(snap.get(), {})
+
+    def test_registry(self):
+        snap = salt.utils.snapshot.snapshot('test.snapshot', (self.path,))
+        snap.get()['pkgs'] = ['foo']
+        # A reloaded module gets the same snapshot back
+        self.assertTrue(
+                salt.utils.snapshot.snapshot('test.snapshot', ()) is snap)
+        self.assertEqual(
+                salt.utils.snapshot.snapshot('test.snapshot', ()).get(),
+                {'pkgs': ['foo']})
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(SnapshotTestCase)
+    TextTestRunner(verbosity=1).run(tests)